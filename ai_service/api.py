@@ -2,23 +2,54 @@ from fastapi import Request, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import io
+import json
+import asyncio
 from rag_pipeline import (
-    classify_query,
-    retrieve_property_recommendations,
-    retrieve_market_trends_and_legal,
-    augment_with_context,
-    sync_new_listings_to_chroma,
-    sync_single_listing_to_chroma,
-    delete_single_listing_from_chroma,
-    update_single_listing_in_chroma,
-    add_pdfs_to_chroma,
-    generate_lease_pdf,
-    get_lease_template_fields
+    aroute_query,
+    aretrieve_for_route,
+    aaugment_with_context,
+    astream_augmented_answer,
+    document_dependency_id,
+    enqueue_lease_purge,
+    enqueue_listing_sync,
+    enqueue_pdf_ingestion,
+    job_scheduler,
+    follow_listing_changes,
+    queue_listing_upsert,
+    queue_listing_delete,
+    listing_write_buffer,
+    get_listing_write_buffer_stats,
+    agenerate_lease_pdf,
+    agenerate_lease_batch,
+    validate_lease_info,
+    get_lease_template_fields,
+    lease_render_service,
+    get_lease_render_stats,
+    get_embedding_cache_stats,
+    is_cacheable_query,
+    aget_cached_answer,
+    acache_answer,
+    get_response_cache_stats,
+    get_multi_query_stats,
+    startup,
+    get_startup_report,
+    session_store,
+    get_session_stats,
+    get_context_stats,
+    pipeline_metrics,
+    get_metrics_text
 )
+from metrics import MetricsMiddleware
+from session_store import SessionNotFound
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+from zip_stream import ZipStream
+from lease_store import iter_file
+import os
+import threading
 
 app = FastAPI(
     title="Estatify RAG API",
@@ -35,6 +66,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency per route and, when TRACE_SINK_PATH is set, one trace per request
+app.add_middleware(MetricsMiddleware, metrics=pipeline_metrics)
+
 limiter = Limiter(key_func=get_remote_address)
 app.state.limiter = limiter
 
@@ -43,9 +77,16 @@ class ConversationMessage(BaseModel):
     role: str  # 'user' or 'assistant'
     content: str
 
+class SearchLocation(BaseModel):
+    latitude: float
+    longitude: float
+    radius_km: Optional[float] = None
+
 class QueryRequest(BaseModel):
     query: str
-    conversation_history: Optional[List[ConversationMessage]] = []
+    conversation_history: Optional[List[ConversationMessage]] = []  # ignored when session_id is given
+    session_id: Optional[str] = None  # server-side conversation from POST /sessions
+    location: Optional[SearchLocation] = None  # e.g. the centre of the user's map view
 
 class FullListingRequest(BaseModel):
     listing: dict
@@ -57,50 +98,249 @@ class UpdateListingRequest(BaseModel):
 class DeleteListingRequest(BaseModel):
     listing_id: str
 
+class SyncListingsRequest(BaseModel):
+    listing_ids: Optional[List[str]] = None  # only re-sync these listings
+
 class PDFRequest(BaseModel):
     pdf_paths: list
     source_type: str
+    force: bool = False  # re-ingest files even when their fingerprint is unchanged
 
 class LeaseGenerationRequest(BaseModel):
     lease_info: dict
 
+class LeaseBatchRequest(BaseModel):
+    leases: List[dict]
+
+async def load_session(session_id: str, user):
+    try:
+        return await run_in_threadpool(session_store.get, session_id, user)
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+async def conversation_for(body: QueryRequest, user):
+    """(session or None, history for the prompt): the server-side session when one is named"""
+    if not body.session_id:
+        return None, body.conversation_history or []
+    session = await load_session(body.session_id, user)
+    return session, session_store.context(session)
+
 # Endpoint to process a user query with RAG and conversation context
 @app.post("/rag_query")
 @limiter.limit("10/minute")
-def rag_query(request: Request, body: QueryRequest):
+async def rag_query(request: Request, body: QueryRequest):
+    user = getattr(request.state, "user", None)
+    session, conversation_history = await conversation_for(body, user)
+    session_id = session.id if session else None
     try:
-        user = getattr(request.state, "user", None)
         query = body.query
-        conversation_history = body.conversation_history or []
         
         if not query.strip():
             raise HTTPException(status_code=400, detail="Query cannot be empty")
             
-        category = classify_query(query)
-        if category == "property_recommendation":
-            results = retrieve_property_recommendations(query)
-        elif category in ["market_trends", "legal_faq"]:
-            results = retrieve_market_trends_and_legal(query, category)
-        else:
-            results = []
-            
-        print(f"Query category: {category}, Results found: {len(results)}")
-        answer = augment_with_context(query, results, conversation_history, user)
-        return {"category": category, "answer": answer}
+        route = await aroute_query(query)
+        category = route.category
+        location = body.location.dict() if body.location else None
+
+        cacheable = is_cacheable_query(route, conversation_history)
+        if cacheable:
+            cached_answer = await aget_cached_answer(route, location)
+            if cached_answer is not None:
+                print(f"Query category: {category} (via {route.tier}), served from response cache")
+                if session_id:
+                    await run_in_threadpool(session_store.record_turn, session_id, query, cached_answer)
+                return {"category": category, "answer": cached_answer, "cached": True, "session_id": session_id}
+
+        results = await aretrieve_for_route(route, location)
+        print(f"Query category: {category} (via {route.tier}), Results found: {len(results)}")
+        answer = await aaugment_with_context(query, results, conversation_history, user, route=route,
+                                             conversation_id=session_id)
+        if cacheable:
+            await acache_answer(route, results, answer, location)
+        if session_id:
+            await run_in_threadpool(session_store.record_turn, session_id, query, answer)
+        return {"category": category, "answer": answer, "session_id": session_id}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-# Endpoint to sync new listings from MongoDB to Chroma
-@app.post("/sync_listings")
-def sync_listings():
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Streaming variant of /rag_query (Server-Sent Events): the category, then the
+# retrieved source IDs, then answer tokens as the LLM produces them
+@app.post("/rag_query_stream")
+@limiter.limit("10/minute")
+async def rag_query_stream(request: Request, body: QueryRequest):
+    user = getattr(request.state, "user", None)
+    query = body.query
+    location = body.location.dict() if body.location else None
+
+    if not query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    session, conversation_history = await conversation_for(body, user)
+    session_id = session.id if session else None
+
+    async def event_stream():
+        try:
+            route = await aroute_query(query)
+            yield sse_event("category", {"category": route.category, "tier": route.tier})
+
+            cacheable = is_cacheable_query(route, conversation_history)
+            cached_answer = await aget_cached_answer(route, location) if cacheable else None
+            if cached_answer is not None:
+                if session_id:
+                    await run_in_threadpool(session_store.record_turn, session_id, query, cached_answer)
+                yield sse_event("sources", {"sources": [], "cached": True})
+                yield sse_event("token", {"text": cached_answer})
+                yield sse_event("done", {"cached": True, "session_id": session_id})
+                return
+
+            results = await aretrieve_for_route(route, location)
+            yield sse_event("sources", {"sources": [document_dependency_id(doc) for doc in results], "cached": False})
+
+            answer_parts = []
+            stream = astream_augmented_answer(query, results, conversation_history, user, route=route,
+                                              conversation_id=session_id)
+            try:
+                async for text in stream:
+                    if await request.is_disconnected():
+                        print(f"Client disconnected, cancelled generation for: {query[:60]}")
+                        return
+                    answer_parts.append(text)
+                    yield sse_event("token", {"text": text})
+            finally:
+                await stream.aclose()
+
+            answer = "".join(answer_parts).strip()
+            if cacheable:
+                await acache_answer(route, results, answer, location)
+            # Only completed answers are recorded; a disconnect above leaves the session unchanged
+            if session_id:
+                await run_in_threadpool(session_store.record_turn, session_id, query, answer)
+            yield sse_event("done", {"cached": False, "session_id": session_id})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Internal server error: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Server-side conversations: clients then send only the new message with its session_id
+@app.post("/sessions")
+async def create_session(request: Request):
+    user = getattr(request.state, "user", None)
+    session = await run_in_threadpool(session_store.create, user)
+    return {"session_id": session.id, "ttl_seconds": session_store.ttl_seconds}
+
+@app.get("/sessions/{session_id}")
+async def get_session(request: Request, session_id: str):
+    session = await load_session(session_id, getattr(request.state, "user", None))
+    return {
+        "session_id": session.id,
+        "summary": session.summary,
+        "turns": session.turns,
+        "summarized_messages": session.summarized_messages,
+        "updated_at": session.updated_at
+    }
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(request: Request, session_id: str):
+    await load_session(session_id, getattr(request.state, "user", None))
+    await run_in_threadpool(session_store.backend.delete, session_id)
+    return {"success": True, "session_id": session_id}
+
+@app.get("/session_stats")
+async def session_stats():
+    return await run_in_threadpool(get_session_stats)
+
+def job_accepted(job, coalesced: bool, message: str) -> dict:
+    return {"success": True, "message": message, "job_id": job.id, "status": job.status, "coalesced": coalesced}
+
+# Endpoint to sync new listings from MongoDB to Chroma (runs as a background job)
+@app.post("/sync_listings", status_code=202)
+async def sync_listings(full: bool = False, body: Optional[SyncListingsRequest] = None):
     try:
-        sync_new_listings_to_chroma()
-        return {"success": True, "message": "Listings synced to ChromaDB."}
+        listing_ids = body.listing_ids if body else None
+        job, coalesced = await run_in_threadpool(enqueue_listing_sync, full=full, listing_ids=listing_ids)
+        return job_accepted(job, coalesced, "Listing sync queued.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Optionally follow the MongoDB change stream (polling when unavailable)
+listing_follower_stop = threading.Event()
+
+# Warm up in the background so liveness answers at once; /ready gates traffic until it is done
+@app.on_event("startup")
+def start_warmup():
+    if os.getenv("WARMUP_ON_STARTUP", "1").lower() in ("1", "true", "yes"):
+        startup.start_warmup()
+    else:
+        startup.skip_warmup()
+
+@app.on_event("startup")
+def start_job_scheduler():
+    job_scheduler.start()
+
+@app.on_event("shutdown")
+def stop_job_scheduler():
+    job_scheduler.stop()
+
+@app.on_event("shutdown")
+def flush_listing_writes():
+    listing_write_buffer.flush_and_stop()
+
+@app.on_event("shutdown")
+def stop_lease_renderer():
+    lease_render_service.shutdown()
+
+# Expired lease PDFs are only removed when read, so purge them on a schedule too
+lease_purge_stop = threading.Event()
+
+def purge_leases_periodically(interval: float):
+    while not lease_purge_stop.is_set():
+        try:
+            enqueue_lease_purge()
+        except Exception as e:
+            print(f"Error queueing lease store purge: {e}")
+        lease_purge_stop.wait(interval)
+
+@app.on_event("startup")
+def start_lease_purger():
+    interval = float(os.getenv("LEASE_STORE_PURGE_HOURS", "6")) * 3600
+    if interval > 0:
+        threading.Thread(target=purge_leases_periodically, args=(interval,), daemon=True).start()
+
+@app.on_event("shutdown")
+def stop_lease_purger():
+    lease_purge_stop.set()
+
+@app.on_event("shutdown")
+def stop_session_compactor():
+    if session_store.loaded:
+        session_store.shutdown()
+
+@app.on_event("startup")
+def start_listing_follower():
+    if os.getenv("LISTING_SYNC_FOLLOW", "").lower() in ("1", "true", "yes"):
+        poll_interval = float(os.getenv("LISTING_SYNC_POLL_SECONDS", "30"))
+        threading.Thread(
+            target=follow_listing_changes,
+            kwargs={"stop_event": listing_follower_stop, "poll_interval": poll_interval},
+            daemon=True
+        ).start()
+
+@app.on_event("shutdown")
+def stop_listing_follower():
+    listing_follower_stop.set()
+
 @app.post("/sync_listing_object")
-def sync_listing_object(body: FullListingRequest):
+async def sync_listing_object(body: FullListingRequest):
     try:
         listing = body.listing
         
@@ -111,8 +351,8 @@ def sync_listing_object(body: FullListingRequest):
         if "_id" not in listing:
             raise HTTPException(status_code=400, detail="Listing must have an _id field")
         
-        # Directly sync the provided listing object to ChromaDB
-        sync_single_listing_to_chroma(listing)
+        # Buffered with other listing writes; resolves once this listing is embedded and stored
+        await asyncio.wrap_future(queue_listing_upsert(listing))
         
         return {
             "success": True,
@@ -129,7 +369,7 @@ def sync_listing_object(body: FullListingRequest):
     
 # Endpoint to update a single listing in Chroma
 @app.put("/update_listing_object")
-def update_listing_object(body: UpdateListingRequest):
+async def update_listing_object(body: UpdateListingRequest):
     try:
         listing_id = body.listing_id
         updated_listing = body.updated_listing
@@ -143,8 +383,8 @@ def update_listing_object(body: UpdateListingRequest):
         # Ensure the updated listing has the same _id
         updated_listing["_id"] = listing_id
         
-        # Update the listing in ChromaDB
-        update_single_listing_in_chroma(listing_id, updated_listing)
+        # Update the listing in ChromaDB (an ID-based upsert, batched with other writes)
+        await asyncio.wrap_future(queue_listing_upsert(updated_listing))
         
         return {
             "success": True,
@@ -161,7 +401,7 @@ def update_listing_object(body: UpdateListingRequest):
 
 # Endpoint to delete a single listing from Chroma
 @app.delete("/delete_listing_object")
-def delete_listing_object(body: DeleteListingRequest):
+async def delete_listing_object(body: DeleteListingRequest):
     try:
         listing_id = body.listing_id
         
@@ -169,7 +409,7 @@ def delete_listing_object(body: DeleteListingRequest):
             raise HTTPException(status_code=400, detail="Listing ID cannot be empty")
         
         # Delete the listing from ChromaDB
-        delete_single_listing_from_chroma(listing_id)
+        await asyncio.wrap_future(queue_listing_delete(listing_id))
         
         return {
             "success": True,
@@ -183,18 +423,40 @@ def delete_listing_object(body: DeleteListingRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-# Endpoint to add PDFs to Chroma
-@app.post("/add_pdfs")
-def add_pdfs(request: PDFRequest):
+# Endpoint to add PDFs to Chroma (runs as a background job)
+@app.post("/add_pdfs", status_code=202)
+async def add_pdfs(request: PDFRequest):
     try:
-        add_pdfs_to_chroma(request.pdf_paths, request.source_type)
-        return {"success": True, "message": f"PDFs added to ChromaDB as {request.source_type}."}
+        job, coalesced = await run_in_threadpool(
+            enqueue_pdf_ingestion, request.pdf_paths, request.source_type, request.force
+        )
+        return job_accepted(job, coalesced, f"PDF ingestion queued as {request.source_type}.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Background job status, progress and throughput
+@app.get("/jobs")
+async def list_jobs(status: Optional[str] = None, limit: int = 50):
+    jobs = await run_in_threadpool(job_scheduler.list, status, limit)
+    return {"jobs": [job.as_dict() for job in jobs], **job_scheduler.stats()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await run_in_threadpool(job_scheduler.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.as_dict()
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    job = await run_in_threadpool(job_scheduler.cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.as_dict()
+
 @app.post("/generate_lease")
 @limiter.limit("5/minute")
-def generate_lease(request: Request, body: LeaseGenerationRequest):
+async def generate_lease(request: Request, body: LeaseGenerationRequest):
     try:
         lease_info = body.lease_info
 
@@ -221,18 +483,22 @@ def generate_lease(request: Request, body: LeaseGenerationRequest):
             )
         
         # Generate the lease PDF
-        result = generate_lease_pdf(lease_info, user)
+        result = await agenerate_lease_pdf(lease_info, user)
         
         if result["success"]:
-            # Return the PDF as a streaming response
+            # Return the PDF as a streaming response; stored leases are read from disk in chunks
             return StreamingResponse(
-                result["pdf_buffer"],
+                iter_file(result["pdf_buffer"]),
                 media_type="application/pdf",
                 headers={
                     "Content-Disposition": f"attachment; filename={result['filename']}",
-                    "X-Lease-ID": result["lease_id"]
+                    "X-Lease-ID": result["lease_id"],
+                    "X-Lease-Cache": "hit" if result.get("cached") else "miss"
                 }
             )
+        elif result.get("busy"):
+            # Render queue is full: tell the client to back off instead of queueing unboundedly
+            raise HTTPException(status_code=503, detail=result["message"], headers={"Retry-After": "5"})
         else:
             raise HTTPException(status_code=500, detail=result["message"])
             
@@ -241,7 +507,109 @@ def generate_lease(request: Request, body: LeaseGenerationRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-# Health check endpoint
+LEASE_BATCH_MAX_ITEMS = int(os.getenv("LEASE_BATCH_MAX_ITEMS", "200"))
+LEASE_BATCH_CONCURRENCY = int(os.getenv("LEASE_BATCH_CONCURRENCY", "4"))
+
+# Generate many leases in one request; the ZIP is streamed as each PDF finishes
+@app.post("/generate_lease_batch")
+@limiter.limit("5/minute")
+async def generate_lease_batch(request: Request, body: LeaseBatchRequest):
+    user = getattr(request.state, "user", None)
+    allowed_roles = ["admin", "owner", "agent"]
+    if not user or user.get("role") not in allowed_roles:
+        raise HTTPException(
+            status_code=403,
+            detail="Access denied. Only admin, owner, or agent can generate lease PDFs."
+        )
+
+    leases = body.leases
+    if not leases:
+        raise HTTPException(status_code=400, detail="Lease list cannot be empty")
+    if len(leases) > LEASE_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {LEASE_BATCH_MAX_ITEMS} leases per batch")
+
+    # Validate everything before generating anything
+    invalid = [
+        {"index": index, "errors": errors}
+        for index, errors in ((i, validate_lease_info(lease)) for i, lease in enumerate(leases))
+        if errors
+    ]
+    if invalid:
+        raise HTTPException(status_code=422, detail={"message": "Invalid lease data", "items": invalid})
+
+    async def zip_stream():
+        archive = ZipStream()
+        report = []
+        async for index, result in agenerate_lease_batch(leases, user, concurrency=LEASE_BATCH_CONCURRENCY):
+            if result["success"]:
+                filename = f"{index + 1:03d}_{result['filename']}"
+                with result["pdf_buffer"] as pdf:
+                    data = pdf.read()
+                yield archive.add(filename, data)
+                report.append({"index": index, "success": True, "lease_id": result["lease_id"], "filename": filename})
+            else:
+                report.append({"index": index, "success": False, "error": result["message"]})
+        report.sort(key=lambda item: item["index"])
+        summary = {"total": len(leases), "succeeded": sum(1 for r in report if r["success"]), "items": report}
+        yield archive.add("report.json", json.dumps(summary, indent=2).encode("utf-8"))
+        yield archive.close()
+
+    return StreamingResponse(
+        zip_stream(),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=lease_agreements.zip"}
+    )
+
+# Embedding cache hit/miss counters
+@app.get("/embedding_cache_stats")
+async def embedding_cache_stats():
+    return await run_in_threadpool(get_embedding_cache_stats)
+
+# Semantic response cache counters
+@app.get("/response_cache_stats")
+async def response_cache_stats():
+    return get_response_cache_stats()
+
+# Query-expansion cache counters for the multi-query retriever
+@app.get("/multi_query_stats")
+async def multi_query_stats():
+    return get_multi_query_stats()
+
+# Listing write buffer counters (coalesced writes, flush sizes)
+@app.get("/listing_write_stats")
+async def listing_write_stats():
+    return get_listing_write_buffer_stats()
+
+# Prompt context packing: tokens before/after, duplicates and items dropped for budget
+@app.get("/context_stats")
+async def context_stats():
+    return get_context_stats()
+
+# Lease PDF render pool counters (queue depth, rejections, render time)
+@app.get("/lease_render_stats")
+async def lease_render_stats():
+    return get_lease_render_stats()
+
+# Prometheus scrape endpoint: stage latency histograms, token counters, cache gauges
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(await run_in_threadpool(get_metrics_text), media_type="text/plain; version=0.0.4")
+
+# Liveness: the process is up and serving; does not touch dependencies
 @app.get("/health")
-def health():
-    return {"status": "ok"}
\ No newline at end of file
+async def health():
+    return {"status": "ok"}
+
+# Readiness: warmup finished and Mongo and Chroma answer; 503 until then
+@app.get("/ready")
+async def ready():
+    is_ready, details = await run_in_threadpool(startup.readiness)
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"status": "ready" if is_ready else "not_ready", **details}
+    )
+
+# Import, component construction and warmup step timings
+@app.get("/startup_stats")
+async def startup_stats():
+    return get_startup_report()
\ No newline at end of file
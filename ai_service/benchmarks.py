@@ -0,0 +1,830 @@
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import shutil
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+
+from tokens import count_tokens
+
+# --------------------------
+# Offline benchmark suite
+# --------------------------
+# Runs the service's own code paths (catalogue sync, /rag_query, lease
+# generation, PDF ingestion) against deterministic stand-ins for the OpenAI
+# chat and embedding clients and an in-memory listings collection, so
+# performance can be measured and compared without network access or API
+# cost. Chroma, the caches, the render pool and the PDF parser are the real
+# ones. Each scenario runs in a fresh interpreter with its own working
+# directory, so every run starts from empty indexes and caches.
+#
+#   python benchmarks.py                          # every scenario
+#   python benchmarks.py sync --sizes 1000,10000  # one scenario
+#   python benchmarks.py rag_query --llm-latency 0 --embed-latency 0  # CPU overhead only
+
+SCENARIOS = ("sync", "rag_query", "lease", "pdf_ingestion")
+CHAT_COMPONENTS = ("chat_model", "expansion_model", "lease_drafting_model", "summary_model")
+BENCHMARK_USER = {"id": "benchmark", "role": "admin", "email": "benchmark@example.com"}
+
+
+# --------------------------
+# Fake model backends
+# --------------------------
+class FakeMessage:
+    def __init__(self, content: str, usage_metadata: Optional[Dict[str, int]] = None):
+        self.content = content
+        self.usage_metadata = usage_metadata
+
+
+class FakeChatModel:
+    """Deterministic ChatOpenAI stand-in: replies shaped like each prompt expects, after a simulated delay.
+
+    A reply takes first_token_latency plus token_latency per output token; streamed
+    replies yield one word at a time on that schedule.
+    """
+
+    CATEGORY_WORDS = {
+        "lease_generation": ("lease", "tenancy"),
+        "legal_faq": ("law", "legal", "tax", "eviction", "deposit", "rights"),
+        "market_trends": ("market", "trend", "price", "invest", "yield", "demand"),
+        "property_recommendation": ("bedroom", "apartment", "house", "rent", "buy", "flat"),
+    }
+    VOCABULARY = ("the", "property", "offers", "good", "value", "near", "schools", "and", "transport",
+                  "with", "a", "spacious", "layout", "prices", "in", "this", "area", "have", "been", "stable")
+
+    def __init__(self, first_token_latency: float = 0.4, token_latency: float = 0.01, answer_words: int = 120,
+                 model: str = "fake-chat"):
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.answer_words = answer_words
+        self.model = model
+        self.calls = 0
+
+    def reply(self, prompt: str) -> str:
+        if "You are a classifier" in prompt:
+            match = re.search(r'Query: "(.*)"', prompt)
+            query = (match.group(1) if match else prompt).lower()
+            for category, words in self.CATEGORY_WORDS.items():
+                if any(word in query for word in words):
+                    return category
+            return "none"
+        if "Original question:" in prompt:
+            question = prompt.rsplit("Original question:", 1)[1].strip()
+            return "\n".join(f"{question} ({aspect})" for aspect in ("overview", "recent data", "details"))
+        if "running summary" in prompt:
+            return " ".join(prompt.rsplit("New messages:", 1)[-1].split()[:60])
+        if "Return ONLY a JSON object" in prompt:
+            return "{}"
+        # Anything else is a free-text answer; its words depend only on the prompt
+        seed = zlib.crc32(prompt.encode("utf-8"))
+        return " ".join(self.VOCABULARY[(seed + i * 7) % len(self.VOCABULARY)] for i in range(self.answer_words))
+
+    def _message(self, prompt: str) -> FakeMessage:
+        self.calls += 1
+        content = self.reply(str(prompt))
+        usage = {"input_tokens": count_tokens(str(prompt)), "output_tokens": count_tokens(content)}
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        return FakeMessage(content, usage)
+
+    def _delay(self, message: FakeMessage) -> float:
+        return self.first_token_latency + self.token_latency * message.usage_metadata["output_tokens"]
+
+    def invoke(self, prompt, *args, **kwargs) -> FakeMessage:
+        message = self._message(prompt)
+        time.sleep(self._delay(message))
+        return message
+
+    async def ainvoke(self, prompt, *args, **kwargs) -> FakeMessage:
+        message = self._message(prompt)
+        await asyncio.sleep(self._delay(message))
+        return message
+
+    async def astream(self, prompt, *args, **kwargs):
+        message = self._message(prompt)
+        await asyncio.sleep(self.first_token_latency)
+        for i, word in enumerate(message.content.split(" ")):
+            await asyncio.sleep(self.token_latency)
+            yield FakeMessage(word if i == 0 else " " + word)
+
+
+class FakeEmbeddings:
+    """Deterministic OpenAIEmbeddings stand-in: hashed bag-of-words vectors after a simulated delay.
+
+    Texts sharing words get similar vectors, so retrieval and the semantic caches behave
+    plausibly. A call takes latency plus item_latency per text.
+    """
+
+    def __init__(self, dimensions: int = 256, latency: float = 0.05, item_latency: float = 0.0005,
+                 model: Optional[str] = None):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.item_latency = item_latency
+        self.model = model or f"fake-embedding-{dimensions}"
+        self.calls = 0
+        self.texts = 0
+
+    def vector(self, text: str) -> List[float]:
+        values = [0.0] * self.dimensions
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            bucket = zlib.crc32(word.encode("utf-8"))
+            values[bucket % self.dimensions] += 1.0 if bucket & 0x80000000 else -1.0
+        norm = sum(v * v for v in values) ** 0.5 or 1.0
+        return [v / norm for v in values]
+
+    def _delay(self, count: int) -> float:
+        self.calls += 1
+        self.texts += count
+        return self.latency + self.item_latency * count
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self._delay(len(texts)))
+        return [self.vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self._delay(1))
+        return self.vector(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self._delay(len(texts)))
+        return [self.vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self._delay(1))
+        return self.vector(text)
+
+
+# --------------------------
+# In-memory listings collection
+# --------------------------
+_MISSING = object()
+
+
+def _field(doc: dict, path: str):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+_OPERATORS = {
+    "$gt": lambda value, operand: value is not _MISSING and value > operand,
+    "$gte": lambda value, operand: value is not _MISSING and value >= operand,
+    "$lt": lambda value, operand: value is not _MISSING and value < operand,
+    "$lte": lambda value, operand: value is not _MISSING and value <= operand,
+    "$ne": lambda value, operand: value != operand,
+    "$in": lambda value, operand: value in operand,
+    "$exists": lambda value, operand: (value is not _MISSING) == bool(operand),
+}
+
+
+def matches(doc: dict, query: dict) -> bool:
+    """The subset of the Mongo query language the service uses"""
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(doc, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+            value = _field(doc, key)
+            if not all(_OPERATORS[op](value, operand) for op, operand in condition.items()):
+                return False
+        elif _field(doc, key) != condition:
+            return False
+    return True
+
+
+def _id_lower_bound(query: dict):
+    """An _id $gt bound at the top level of the query, so paging can skip straight to it"""
+    clauses = [query] + [clause for clause in query.get("$and", []) if isinstance(clause, dict)]
+    for clause in clauses:
+        condition = clause.get("_id")
+        if isinstance(condition, dict) and "$gt" in condition:
+            return condition["$gt"]
+    return None
+
+
+class _Cursor:
+    def __init__(self, collection: "InMemoryListingCollection", query: dict, projection: Optional[dict]):
+        self._collection = collection
+        self._query = query or {}
+        self._projection = projection
+        self._sort = None
+        self._limit = 0
+
+    def sort(self, key: str, direction: int = 1) -> "_Cursor":
+        self._sort = (key, direction)
+        return self
+
+    def limit(self, count: int) -> "_Cursor":
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int) -> "_Cursor":
+        return self
+
+    def _project(self, doc: dict) -> dict:
+        if not self._projection:
+            return dict(doc)
+        keep = {key for key, include in self._projection.items() if include}
+        return {key: value for key, value in doc.items() if key in keep or key == "_id"}
+
+    def __iter__(self):
+        docs = self._collection.docs
+        start = 0
+        lower = _id_lower_bound(self._query)
+        if lower is not None:
+            start = bisect_right(self._collection.ids, lower)
+        if self._sort and self._sort != ("_id", 1):
+            key, direction = self._sort
+            selected = sorted((doc for doc in docs if matches(doc, self._query)),
+                              key=lambda doc: _field(doc, key), reverse=direction < 0)
+            selected = selected[:self._limit] if self._limit else selected
+            return iter([self._project(doc) for doc in selected])
+        return self._scan(docs, start)
+
+    def _scan(self, docs, start):
+        returned = 0
+        for doc in docs[start:] if start else docs:
+            if matches(doc, self._query):
+                yield self._project(doc)
+                returned += 1
+                if self._limit and returned >= self._limit:
+                    return
+
+
+class InMemoryListingCollection:
+    """Listings kept in _id order, answering the find/distinct calls the sync and router make"""
+
+    def __init__(self, listings: Iterable[dict] = ()):
+        self.docs: List[dict] = sorted(listings, key=lambda doc: doc["_id"])
+        self.ids = [doc["_id"] for doc in self.docs]
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None) -> _Cursor:
+        return _Cursor(self, query or {}, projection)
+
+    def distinct(self, key: str) -> list:
+        values = {_field(doc, key) for doc in self.docs}
+        values.discard(_MISSING)
+        return sorted(values, key=str)
+
+    def update(self, listing_id, changes: dict):
+        index = bisect_right(self.ids, listing_id) - 1
+        if index >= 0 and self.ids[index] == listing_id:
+            self.docs[index].update(changes)
+
+
+class _AsyncCursor:
+    def __init__(self, cursor: _Cursor):
+        self._cursor = cursor
+
+    def sort(self, key: str, direction: int = 1) -> "_AsyncCursor":
+        self._cursor.sort(key, direction)
+        return self
+
+    def limit(self, count: int) -> "_AsyncCursor":
+        self._cursor.limit(count)
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> list:
+        docs = list(self._cursor)
+        return docs[:length] if length else docs
+
+
+class AsyncInMemoryListingCollection:
+    """Motor-style async view of an InMemoryListingCollection"""
+
+    def __init__(self, collection: InMemoryListingCollection):
+        self.collection = collection
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None) -> _AsyncCursor:
+        return _AsyncCursor(self.collection.find(query, projection))
+
+    async def distinct(self, key: str) -> list:
+        return self.collection.distinct(key)
+
+
+# --------------------------
+# Synthetic data
+# --------------------------
+# (city, state, latitude, longitude, typical monthly rent for a 2 bedroom flat)
+CITIES = [
+    ("Lahore", "Punjab", 31.5204, 74.3587, 85000),
+    ("Karachi", "Sindh", 24.8607, 67.0011, 90000),
+    ("Islamabad", "Islamabad Capital Territory", 33.6844, 73.0479, 120000),
+    ("Rawalpindi", "Punjab", 33.5651, 73.0169, 65000),
+    ("Faisalabad", "Punjab", 31.4504, 73.1350, 50000),
+    ("Multan", "Punjab", 30.1575, 71.5249, 45000),
+    ("Peshawar", "Khyber Pakhtunkhwa", 34.0151, 71.5249, 48000),
+    ("Quetta", "Balochistan", 30.1798, 66.9750, 40000),
+]
+STREETS = ["Mall Road", "Canal View", "Garden Town", "Model Town", "Gulberg Main Boulevard", "Clifton Block 5",
+           "F-7 Markaz", "Bahria Enclave", "DHA Phase 6", "University Road", "Jinnah Avenue", "Satellite Town"]
+PROPERTY_TYPES = ["Apartment", "House", "Condo", "Commercial", "Land"]
+AMENITIES = ["Pool", "Gym", "Parking", "Elevator", "Balcony", "Garden", "Security", "AC", "Heating",
+             "Pet-Friendly", "Laundry"]
+STATUSES = ["Available"] * 6 + ["Rented", "Sold", "Under Review", "Draft"]
+ADJECTIVES = ["Spacious", "Sunny", "Modern", "Renovated", "Quiet", "Elegant", "Family", "Cozy", "Luxury", "Corner"]
+DESCRIPTION_SENTENCES = [
+    "The property has large windows and plenty of natural light throughout the day.",
+    "It is a short walk from schools, a hospital and the main market.",
+    "The kitchen was renovated recently with new cabinets and fittings.",
+    "Backup power and a water tank keep the home comfortable during outages.",
+    "Public transport stops and the ring road are a few minutes away.",
+    "The neighbourhood is gated, quiet and popular with young families.",
+    "Bedrooms come with built-in wardrobes and attached bathrooms.",
+    "There is covered parking and a separate servant quarter.",
+    "Residents share a landscaped park, a mosque and a community centre.",
+    "The owner is flexible on the move-in date for the right tenant.",
+]
+
+
+def _object_id(rng: random.Random, created_at: datetime) -> ObjectId:
+    """ObjectId for created_at whose random part comes from rng, so generated data is reproducible"""
+    seconds = int(created_at.replace(tzinfo=timezone.utc).timestamp())
+    return ObjectId(seconds.to_bytes(4, "big") + rng.getrandbits(64).to_bytes(8, "big"))
+
+
+def generate_listing(rng: random.Random, created_at: datetime) -> dict:
+    """One listing shaped like the backend Property model"""
+    city, state, latitude, longitude, base_rent = rng.choice(CITIES)
+    property_type = rng.choices(PROPERTY_TYPES, weights=[5, 4, 2, 1, 1])[0]
+    category = rng.choice(["Rent", "Rent", "Sale"])
+    bedrooms = 0 if property_type in ("Commercial", "Land") else rng.randint(1, 6)
+    area = rng.randint(500, 5000) if property_type != "Land" else rng.randint(2000, 20000)
+    rent = int(base_rent * (0.6 + 0.25 * max(bedrooms, 1)) * rng.uniform(0.8, 1.3) / 1000) * 1000
+    price = rent if category == "Rent" else rent * rng.randint(180, 260)
+    street = f"{rng.randint(1, 250)} {rng.choice(STREETS)}"
+    title = f"{rng.choice(ADJECTIVES)} {bedrooms} Bedroom {property_type} in {city}" if bedrooms \
+        else f"{rng.choice(ADJECTIVES)} {property_type} in {city}"
+    updated_at = created_at + timedelta(days=rng.randint(0, 90))
+    return {
+        "_id": _object_id(rng, created_at),
+        "title": title,
+        "description": " ".join(rng.sample(DESCRIPTION_SENTENCES, rng.randint(2, 6))),
+        "type": property_type,
+        "category": category,
+        "price": price,
+        "address": {"street": street, "city": city, "state": state, "zipCode": f"{rng.randint(10000, 99999)}",
+                    "country": "Pakistan"},
+        "coordinates": {"latitude": round(latitude + rng.uniform(-0.15, 0.15), 6),
+                        "longitude": round(longitude + rng.uniform(-0.15, 0.15), 6)},
+        "details": {"bedrooms": bedrooms, "bathrooms": max(1, bedrooms - rng.randint(0, 1)) if bedrooms else 1,
+                    "area": area, "parking": rng.randint(0, 3), "yearBuilt": rng.randint(1985, 2024),
+                    "furnished": rng.random() < 0.3},
+        "amenities": sorted(rng.sample(AMENITIES, rng.randint(0, 6))),
+        "images": [{"url": f"https://images.example.com/{rng.getrandbits(48):x}.jpg", "caption": "",
+                    "isPrimary": i == 0} for i in range(rng.randint(1, 8))],
+        "videos": [],
+        "virtualTourUrl": "",
+        "owner": _object_id(rng, created_at),
+        "agent": _object_id(rng, created_at) if rng.random() < 0.5 else None,
+        "status": rng.choice(STATUSES),
+        "featured": rng.random() < 0.05,
+        "availableFrom": updated_at + timedelta(days=rng.randint(0, 60)),
+        "tags": [],
+        "viewCount": rng.randint(0, 2000),
+        "createdAt": created_at,
+        "updatedAt": updated_at,
+    }
+
+
+def generate_listings(count: int, seed: int = 7) -> List[dict]:
+    """count listings in _id order; the same seed gives the same listings"""
+    rng = random.Random(seed)
+    start = datetime(2023, 1, 1)
+    # ObjectIds embed whole seconds, so one second apart keeps them in creation order
+    return [generate_listing(rng, start + timedelta(seconds=i)) for i in range(count)]
+
+
+QUERY_TEMPLATES = {
+    "property_recommendation": [
+        "Show me {bedrooms} bedroom apartments for rent in {city} under {budget}",
+        "I am looking for a house to buy in {city} with a garden and parking",
+        "Any furnished flats near {street} in {city}?",
+    ],
+    "market_trends": [
+        "How have property prices in {city} changed over the last year?",
+        "Is {city} a good market to invest in real estate this quarter?",
+        "What is the rental yield and demand outlook in {city}?",
+    ],
+    "legal_faq": [
+        "What taxes do I pay when selling a house in {city}?",
+        "What are the legal requirements for transferring property ownership in {state}?",
+        "Can a landlord keep the security deposit under the rent laws?",
+    ],
+    "lease_generation": [
+        "I want to create a lease agreement for my apartment at {street}, {city}",
+        "Draft a lease for {tenant}, rent {budget} per month starting {start}",
+    ],
+    "none": ["hello", "thanks", "good morning"],
+}
+
+
+def generate_query(route: str, rng: random.Random) -> str:
+    city, state, _, _, base_rent = rng.choice(CITIES)
+    return rng.choice(QUERY_TEMPLATES[route]).format(
+        city=city, state=state, street=rng.choice(STREETS), bedrooms=rng.randint(1, 5),
+        budget=int(base_rent * rng.uniform(0.8, 2.0) / 1000) * 1000,
+        tenant=f"{rng.choice(['Omar', 'Sara', 'Bilal', 'Hina'])} {rng.choice(['Ali', 'Khan', 'Raza', 'Iqbal'])}",
+        start=f"2025-{rng.randint(1, 12):02d}-01",
+    )
+
+
+def generate_lease(rng: random.Random, special_conditions: bool = False) -> Dict[str, Any]:
+    city, _, _, _, base_rent = rng.choice(CITIES)
+    start = datetime(2025, rng.randint(1, 12), 1)
+    rent = int(base_rent * rng.uniform(0.7, 1.6) / 1000) * 1000
+    first, last = rng.choice(["Ayesha", "Omar", "Sara", "Bilal", "Hina", "Usman"]), rng.choice(["Khan", "Ali", "Raza"])
+    lease = {
+        "property_address": f"{rng.randint(1, 250)} {rng.choice(STREETS)}, {city}",
+        "property_type": rng.choice(["Apartment", "House"]),
+        "landlord_name": f"{first} {last}",
+        "landlord_email": f"{first.lower()}.{last.lower()}@example.com",
+        "landlord_phone": f"0300-{rng.randint(1000000, 9999999)}",
+        "tenant_name": f"{rng.choice(['Zain', 'Maryam', 'Ahmed', 'Fatima'])} {rng.choice(['Iqbal', 'Shah', 'Malik'])}",
+        "tenant_email": f"tenant{rng.randint(1, 10 ** 6)}@example.com",
+        "lease_start_date": start.strftime("%Y-%m-%d"),
+        "lease_end_date": (start + timedelta(days=364)).strftime("%Y-%m-%d"),
+        "monthly_rent": str(rent),
+        "security_deposit": str(rent * 2),
+    }
+    if special_conditions:
+        lease["special_conditions"] = ["Tenant may keep one cat", "Landlord repaints before move-in"]
+    return lease
+
+
+MARKET_PARAGRAPHS = [
+    "Average asking rents in {city} rose {pct}% year over year, led by two and three bedroom apartments.",
+    "Sales volumes in {city} fell {pct}% in the quarter as higher mortgage rates kept first-time buyers away.",
+    "Demand for furnished rentals in {city} remained strong, with vacancy below {pct}% in central districts.",
+    "Plot prices on the outskirts of {city} appreciated {pct}% as new road links were completed.",
+]
+LEGAL_PARAGRAPHS = [
+    "Section {pct}: A landlord must return the security deposit within thirty days after the tenancy ends, "
+    "less any amount for damage beyond normal wear and tear.",
+    "Section {pct}: Capital gains tax applies when a property is sold within six years of purchase; the rate "
+    "falls each year the property is held.",
+    "Section {pct}: Transfer of title requires a registered sale deed, payment of stamp duty and mutation "
+    "of the land record in the name of the buyer.",
+    "Section {pct}: An eviction notice must state the grounds and give the tenant at least thirty days.",
+]
+
+
+def write_sample_pdfs(directory: str, count: int = 4, pages: int = 10, source_type: str = "market_trends",
+                      seed: int = 7) -> List[str]:
+    """Multi-page market report or legal FAQ PDFs with synthetic text; returns their paths"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    rng = random.Random(f"{seed}-{source_type}")
+    paragraphs = LEGAL_PARAGRAPHS if source_type == "legal_faq" else MARKET_PARAGRAPHS
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for number in range(count):
+        path = os.path.join(directory, f"{source_type}_{number + 1}.pdf")
+        pdf = canvas.Canvas(path, pagesize=A4)
+        for page in range(pages):
+            text = pdf.beginText(50, 800)
+            text.setFont("Helvetica", 10)
+            text.textLine(f"{source_type.replace('_', ' ').title()} report {number + 1}, page {page + 1}")
+            for _ in range(14):
+                paragraph = rng.choice(paragraphs).format(city=rng.choice(CITIES)[0], pct=rng.randint(2, 40))
+                for start in range(0, len(paragraph), 95):
+                    text.textLine(paragraph[start:start + 95])
+                text.textLine("")
+            pdf.drawText(text)
+            pdf.showPage()
+        pdf.save()
+        paths.append(path)
+    return paths
+
+
+# --------------------------
+# Harness
+# --------------------------
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(latencies: List[float], seconds: float, unit: str = "requests") -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    return {
+        unit: len(ordered),
+        "seconds": round(seconds, 3),
+        f"{unit}_per_second": round(len(ordered) / seconds, 2) if seconds else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+    }
+
+
+def load_offline_pipeline(config: Dict[str, Any], listings: Iterable[dict] = ()):
+    """Import rag_pipeline with the fake backends and an in-memory listings collection swapped in"""
+    import rag_pipeline
+    from metrics import InstrumentedChatModel
+
+    embeddings = FakeEmbeddings(config["dimensions"], config["embed_latency"], config["embed_item_latency"])
+    rag_pipeline.startup.components["embeddings"].set_factory(lambda: rag_pipeline.build_embedding_model(embeddings))
+    chat = FakeChatModel(config["llm_latency"], config["llm_token_latency"], config["answer_words"])
+    for name in CHAT_COMPONENTS:
+        rag_pipeline.startup.components[name].set_factory(
+            lambda: InstrumentedChatModel(chat, rag_pipeline.pipeline_metrics, count_tokens))
+    collection = InMemoryListingCollection(listings)
+    rag_pipeline.startup.components["listings_collection"].set_factory(lambda: collection)
+    if "async_listings_collection" in rag_pipeline.startup.components:
+        rag_pipeline.startup.components["async_listings_collection"].set_factory(
+            lambda: AsyncInMemoryListingCollection(collection))
+    rag_pipeline.startup.skip_warmup()
+    return rag_pipeline, collection, chat, embeddings
+
+
+def benchmark_app(app):
+    """ASGI wrapper that signs every request in as BENCHMARK_USER, as the auth proxy would"""
+    async def authenticated(scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["user"] = BENCHMARK_USER
+        await app(scope, receive, send)
+    return authenticated
+
+
+async def run_load(send, payloads: List[Any], concurrency: int) -> Dict[str, Any]:
+    """Send every payload with at most concurrency in flight; latency per call and failures"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], Counter()
+
+    async def one(payload):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                error = await send(payload)
+            except Exception as e:
+                error = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            if error:
+                failures[str(error)] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(payload) for payload in payloads))
+    report = latency_summary(latencies, time.perf_counter() - started)
+    report["failures"] = dict(failures)
+    return report
+
+
+# --------------------------
+# Scenarios
+# --------------------------
+def scenario_sync(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Full catalogue sync into an empty index, then a no-op sync and one with 1% of listings changed"""
+    listings = generate_listings(config["listings"], config["seed"])
+    rp, collection, _, embeddings = load_offline_pipeline(config, listings)
+    batches = []
+    rp.listing_sync_engine.on_upserted.append(lambda docs: batches.append((time.perf_counter(), len(docs))))
+
+    def timed_sync(name: str) -> Dict[str, Any]:
+        batches.clear()
+        started = time.perf_counter()
+        stats = rp.sync_new_listings_to_chroma()
+        seconds = time.perf_counter() - started
+        report = latency_summary([end - begin for (begin, _), (end, _) in
+                                  zip([(started, 0)] + batches[:-1], batches)], seconds, unit="batches")
+        report.update(listings_per_second=round(stats["scanned"] / seconds, 2) if seconds else 0.0,
+                      scanned=stats["scanned"], upserted=stats["upserted"], failed=stats["failed"])
+        print(f"sync {name}: {report}")
+        return report
+
+    result = {"listings": len(listings), "full": timed_sync("full"), "unchanged": timed_sync("unchanged")}
+    rng = random.Random(config["seed"])
+    changed_at = datetime.now()
+    for listing in rng.sample(listings, max(1, len(listings) // 100)):
+        collection.update(listing["_id"], {"price": listing["price"] + 1000, "updatedAt": changed_at})
+    result["changed_1pct"] = timed_sync("changed 1%")
+    result["embedding_calls"] = embeddings.calls
+    return result
+
+
+def seed_corpus(rp, config: Dict[str, Any]):
+    """Listings plus market and legal PDFs, as the rag_query and routing code expects to find"""
+    rp.sync_new_listings_to_chroma()
+    for source_type in ("market_trends", "legal_faq"):
+        paths = write_sample_pdfs(os.path.join("sample_pdfs", source_type), count=2, pages=config["pages"],
+                                  source_type=source_type, seed=config["seed"])
+        rp.add_pdfs_to_chroma(paths, source_type)
+
+
+def scenario_rag_query(config: Dict[str, Any]) -> Dict[str, Any]:
+    """/rag_query under concurrent load, one run per route and one mixed run"""
+    import httpx
+    import api
+
+    rp, _, chat, _ = load_offline_pipeline(config, generate_listings(config["listings"], config["seed"]))
+    seed_corpus(rp, config)
+    api.limiter.enabled = False
+    rng = random.Random(config["seed"])
+    categories = Counter()
+    result = {"listings": config["listings"], "concurrency": config["concurrency"], "routes": {}}
+
+    async def run_all():
+        transport = httpx.ASGITransport(app=benchmark_app(api.app))
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            async def send(query: str) -> Optional[str]:
+                response = await client.post("/rag_query", json={"query": query})
+                if response.status_code != 200:
+                    return f"HTTP {response.status_code}"
+                categories[response.json()["category"]] += 1
+                return None
+
+            routes = list(QUERY_TEMPLATES)
+            for route in routes + ["mixed"]:
+                categories.clear()
+                queries = [generate_query(rng.choice(routes) if route == "mixed" else route, rng)
+                           for _ in range(config["requests"])]
+                report = await run_load(send, queries, config["concurrency"])
+                report["categories"] = dict(categories)
+                result["routes"][route] = report
+                print(f"rag_query {route}: {report}")
+
+    asyncio.run(run_all())
+    result["llm_calls"] = chat.calls
+    result["response_cache"] = rp.get_response_cache_stats()
+    result["stages"] = rp.pipeline_metrics.stage_summary()
+    return result
+
+
+def scenario_lease(config: Dict[str, Any]) -> Dict[str, Any]:
+    """/generate_lease for distinct leases, then the same leases again (served from the artifact store)"""
+    import httpx
+    import api
+
+    rp, _, chat, _ = load_offline_pipeline(config)
+    api.limiter.enabled = False
+    rng = random.Random(config["seed"])
+    leases = [generate_lease(rng, special_conditions=i % 4 == 0) for i in range(config["leases"])]
+    result = {"concurrency": config["concurrency"], "render_workers": rp.lease_render_service.max_workers}
+
+    async def run_all():
+        transport = httpx.ASGITransport(app=benchmark_app(api.app))
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            async def send(lease: Dict[str, Any]) -> Optional[str]:
+                response = await client.post("/generate_lease", json={"lease_info": lease})
+                if response.status_code != 200 or not response.content.startswith(b"%PDF"):
+                    return f"HTTP {response.status_code}"
+                return None
+
+            for name in ("generated", "stored"):
+                report = await run_load(send, leases, config["concurrency"])
+                result[name] = report
+                print(f"lease {name}: {report}")
+
+    rp.lease_render_service.warmup()
+    try:
+        asyncio.run(run_all())
+    finally:
+        rp.lease_render_service.shutdown()
+    result["llm_calls"] = chat.calls
+    result["stages"] = rp.pipeline_metrics.stage_summary()
+    return result
+
+
+def scenario_pdf_ingestion(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Ingest sample PDFs into an empty index, then again unchanged (fingerprints skip them)"""
+    rp, _, _, embeddings = load_offline_pipeline(config)
+    paths = write_sample_pdfs("sample_pdfs", count=config["pdfs"], pages=config["pages"], seed=config["seed"])
+    result = {"pdfs": len(paths), "pages_per_pdf": config["pages"]}
+    for name in ("new", "unchanged"):
+        started = time.perf_counter()
+        stats = rp.add_pdfs_to_chroma(paths, "market_trends")
+        seconds = time.perf_counter() - started
+        report = latency_summary([f["seconds"] for f in stats["files"]], seconds, unit="files")
+        report.update(chunks=stats["documents"], chunks_per_second=round(stats["documents"] / seconds, 2),
+                      parse_p50_ms=round(percentile(sorted(f["parse_seconds"] for f in stats["files"]), 0.5) * 1000, 2))
+        result[name] = report
+        print(f"pdf_ingestion {name}: {report}")
+    result["embedding_calls"] = embeddings.calls
+    return result
+
+
+SCENARIO_FUNCTIONS = {
+    "sync": scenario_sync,
+    "rag_query": scenario_rag_query,
+    "lease": scenario_lease,
+    "pdf_ingestion": scenario_pdf_ingestion,
+}
+
+
+# --------------------------
+# Runner
+# --------------------------
+def run_child(scenario: str, config: Dict[str, Any], keep_workdir: bool = False) -> Dict[str, Any]:
+    """Run one scenario in a fresh interpreter and working directory"""
+    workdir = tempfile.mkdtemp(prefix=f"bench-{scenario}-")
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", scenario, "--config", json.dumps(config)],
+        cwd=workdir, capture_output=True, text=True,
+    )
+    lines = [line for line in completed.stdout.splitlines() if line.startswith("BENCHMARK_REPORT ")]
+    if completed.returncode != 0 or not lines:
+        # Failed runs keep their directory for inspection
+        print(completed.stdout[-2000:], completed.stderr[-4000:], sep="\n", file=sys.stderr)
+        return {"error": f"exit code {completed.returncode}", "workdir": workdir}
+    report = json.loads(lines[-1][len("BENCHMARK_REPORT "):])
+    report["process_seconds"] = round(time.perf_counter() - started, 3)
+    if keep_workdir:
+        report["workdir"] = workdir
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def run(scenarios: List[str], config: Dict[str, Any], sizes: List[int], keep_workdirs: bool = False) -> Dict[str, Any]:
+    results: Dict[str, Any] = {"config": config, "started_at": datetime.now().isoformat(timespec="seconds")}
+    for scenario in scenarios:
+        if scenario == "sync":
+            results["sync"] = {str(size): run_child("sync", dict(config, listings=size), keep_workdirs)
+                               for size in sizes}
+        else:
+            results[scenario] = run_child(scenario, config, keep_workdirs)
+    return results
+
+
+def write_data(directory: str, listings: int, seed: int):
+    """Synthetic listings (JSON lines, mongoimport-friendly) and sample PDFs for manual testing"""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "listings.jsonl"), "w", encoding="utf-8") as f:
+        for listing in generate_listings(listings, seed):
+            f.write(json.dumps(listing, default=lambda value: {"$oid": str(value)} if isinstance(value, ObjectId)
+                               else {"$date": value.isoformat() + "Z"}) + "\n")
+    for source_type in ("market_trends", "legal_faq"):
+        write_sample_pdfs(os.path.join(directory, source_type), source_type=source_type, seed=seed)
+    print(f"Wrote {listings} listings and sample PDFs to {directory}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks with fake OpenAI backends")
+    parser.add_argument("scenarios", nargs="*", help=f"any of {', '.join(SCENARIOS)}; default: all")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="listing counts for the sync scenario")
+    parser.add_argument("--listings", type=int, default=1000, help="catalogue size for rag_query")
+    parser.add_argument("--requests", type=int, default=100, help="rag_query requests per route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--leases", type=int, default=40)
+    parser.add_argument("--pdfs", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=10, help="pages per sample PDF")
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="seconds to the first token")
+    parser.add_argument("--llm-token-latency", type=float, default=0.01, help="seconds per output token")
+    parser.add_argument("--answer-words", type=int, default=120)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per embedding call")
+    parser.add_argument("--embed-item-latency", type=float, default=0.0005, help="extra seconds per text")
+    parser.add_argument("--dimensions", type=int, default=256, help="fake embedding size")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="also write the JSON report here")
+    parser.add_argument("--keep-workdirs", action="store_true", help="keep each run's Chroma and cache files")
+    parser.add_argument("--write-data", metavar="DIR", help="only write synthetic listings and sample PDFs")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    unknown = [scenario for scenario in args.scenarios if scenario not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario {', '.join(unknown)}; choose from {', '.join(SCENARIOS)}")
+
+    if args.child:
+        report = SCENARIO_FUNCTIONS[args.child](json.loads(args.config))
+        print("BENCHMARK_REPORT " + json.dumps(report, default=str))
+        sys.exit(0)
+    if args.write_data:
+        write_data(args.write_data, args.listings, args.seed)
+        sys.exit(0)
+
+    config = {
+        "listings": args.listings, "requests": args.requests, "concurrency": args.concurrency,
+        "leases": args.leases, "pdfs": args.pdfs, "pages": args.pages, "seed": args.seed,
+        "llm_latency": args.llm_latency, "llm_token_latency": args.llm_token_latency,
+        "answer_words": args.answer_words, "embed_latency": args.embed_latency,
+        "embed_item_latency": args.embed_item_latency, "dimensions": args.dimensions,
+    }
+    results = run(args.scenarios or list(SCENARIOS), config, [int(size) for size in args.sizes.split(",")],
+                  args.keep_workdirs)
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
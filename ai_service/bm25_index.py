@@ -0,0 +1,177 @@
+import os
+import re
+import math
+import json
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain.schema import Document
+
+from multi_query import content_hash
+
+# --------------------------
+# BM25 lexical index
+# --------------------------
+# An in-process inverted index over PDF chunks. Dense search is weak on exact
+# tokens such as section numbers ("9."), statute names and tax terms; BM25
+# matches those directly. The index is built as chunks are ingested and is
+# persisted as JSON next to the Chroma directory.
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how",
+    "i", "in", "is", "it", "me", "my", "of", "on", "or", "the", "to", "what", "when", "where",
+    "which", "who", "will", "with", "you", "your",
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over chunk texts, filterable by the chunk's source metadata"""
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._docs: Dict[str, dict] = {}  # id -> {"text", "metadata", "terms": {term: tf}, "length"}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._total_length = 0
+        self._lock = threading.RLock()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for doc_id, entry in data.get("documents", {}).items():
+                self._index(doc_id, entry)
+        except Exception as e:
+            print(f"Ignoring unreadable BM25 index {self.path}: {e}")
+            self._docs.clear()
+            self._postings.clear()
+            self._total_length = 0
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {"documents": self._docs}
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+    def _index(self, doc_id: str, entry: dict):
+        self._docs[doc_id] = entry
+        self._total_length += entry["length"]
+        for term, tf in entry["terms"].items():
+            self._postings[term][doc_id] = tf
+
+    def _unindex(self, doc_id: str):
+        entry = self._docs.pop(doc_id, None)
+        if entry is None:
+            return
+        self._total_length -= entry["length"]
+        for term in entry["terms"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def add_documents(self, ids: List[str], documents: List[Document]):
+        """Insert or replace chunks by ID"""
+        with self._lock:
+            for doc_id, doc in zip(ids, documents):
+                tokens = tokenize(doc.page_content)
+                self._unindex(doc_id)
+                self._index(doc_id, {
+                    "text": doc.page_content,
+                    "metadata": {k: v for k, v in doc.metadata.items() if isinstance(v, (str, int, float, bool))},
+                    "terms": dict(Counter(tokens)),
+                    "length": len(tokens),
+                })
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._unindex(doc_id)
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            self._postings.clear()
+            self._total_length = 0
+
+    def count(self, source: Optional[str] = None) -> int:
+        with self._lock:
+            if source is None:
+                return len(self._docs)
+            return sum(1 for entry in self._docs.values() if entry["metadata"].get("source") == source)
+
+    def search(self, query: str, k: int = 5, source: Optional[str] = None) -> List[Tuple[Document, float, float]]:
+        """(document, bm25 score, fraction of query terms matched) for the top k chunks"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            n = len(self._docs)
+            if n == 0:
+                return []
+            avg_length = self._total_length / n
+            scores: Dict[str, float] = defaultdict(float)
+            matched: Dict[str, int] = defaultdict(int)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    entry = self._docs[doc_id]
+                    if source is not None and entry["metadata"].get("source") != source:
+                        continue
+                    norm = tf + self.k1 * (1 - self.b + self.b * entry["length"] / avg_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / norm
+                    matched[doc_id] += 1
+            top = sorted(scores, key=scores.get, reverse=True)[:k]
+            return [
+                (
+                    Document(page_content=self._docs[doc_id]["text"], metadata=dict(self._docs[doc_id]["metadata"])),
+                    scores[doc_id],
+                    matched[doc_id] / len(terms),
+                )
+                for doc_id in top
+            ]
+
+
+def fuse_scores(lexical: List[Tuple[Document, float, float]], dense: List[Tuple[Document, float]],
+                alpha: float = 0.5) -> List[Document]:
+    """Rank chunks by alpha * normalized BM25 + (1 - alpha) * normalized vector relevance"""
+    def normalized(pairs):
+        if not pairs:
+            return {}
+        low, high = min(score for _, score in pairs), max(score for _, score in pairs)
+        span = high - low
+        return {content_hash(doc): (score - low) / span if span else 1.0 for doc, score in pairs}
+
+    lexical_scores = normalized([(doc, score) for doc, score, _ in lexical])
+    dense_scores = normalized(dense)
+    docs = {content_hash(doc): doc for doc, _ in dense}
+    for doc, _, _ in lexical:
+        docs.setdefault(content_hash(doc), doc)
+    combined = {
+        key: alpha * lexical_scores.get(key, 0.0) + (1 - alpha) * dense_scores.get(key, 0.0)
+        for key in docs
+    }
+    return [docs[key] for key in sorted(combined, key=combined.get, reverse=True)]
@@ -0,0 +1,208 @@
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain.schema import Document
+
+from tokens import count_tokens, truncate_to_tokens
+
+# --------------------------
+# Token-budgeted context assembly
+# --------------------------
+# Builds the CONTEXT block of the answer prompt from ranked retrieval results.
+# Listings are rendered as one compact line of their fields instead of the
+# indented embedding text, whitespace is collapsed, near-duplicate chunks are
+# dropped, and when the block is still over budget the lowest-ranked items are
+# truncated, then dropped, first. Every build records what it left out.
+
+LISTING_FIELDS = ("Title", "Description", "Price", "Amenities", "Address", "Details")
+FIELD_PATTERN = re.compile(r"^\s*(%s):\s?(.*)$" % "|".join(LISTING_FIELDS))
+SHINGLE_PATTERN = re.compile(r"[a-z0-9]+")
+ELLIPSIS = " ..."
+ITEM_OVERHEAD_TOKENS = 4  # the "[n] " prefix and the blank line between entries
+
+
+def collapse_whitespace(text: str) -> str:
+    return " ".join(text.split())
+
+
+def parse_listing_text(text: str) -> Dict[str, str]:
+    """Fields of a listing's embedding text (see transform_property_for_embedding)"""
+    fields, current = {}, None
+    for line in text.splitlines():
+        match = FIELD_PATTERN.match(line)
+        if match:
+            current = match.group(1)
+            fields[current] = match.group(2).strip()
+        elif current and line.strip():
+            # Descriptions can span several lines
+            fields[current] += " " + line.strip()
+    return {key: collapse_whitespace(value) for key, value in fields.items()}
+
+
+def _format_price(value: Any) -> str:
+    try:
+        number = float(str(value).replace(",", ""))
+    except (TypeError, ValueError):
+        return str(value)
+    return f"{number:,.0f}"
+
+
+def render_listing(doc: Document, description_words: int = 60) -> str:
+    """One line per listing: title | price | details | address | amenities | distance | description"""
+    fields = parse_listing_text(doc.page_content)
+    metadata = doc.metadata or {}
+    parts = [fields.get("Title") or "Untitled listing"]
+    price = fields.get("Price") or metadata.get("price")
+    if price not in (None, ""):
+        parts.append(f"Price {_format_price(price)}")
+    for key in ("Details", "Address"):
+        if fields.get(key):
+            parts.append(fields[key])
+    if metadata.get("property_type"):
+        parts.append(str(metadata["property_type"]))
+    if metadata.get("category"):
+        parts.append(f"for {metadata['category']}")
+    if fields.get("Amenities"):
+        parts.append(f"Amenities: {fields['Amenities']}")
+    if metadata.get("distance_km") is not None:
+        parts.append(f"{metadata['distance_km']} km away")
+    description = fields.get("Description", "").split()
+    if description:
+        clipped = " ".join(description[:description_words])
+        parts.append(clipped + (ELLIPSIS if len(description) > description_words else ""))
+    return " | ".join(parts)
+
+
+def render_chunk(doc: Document) -> str:
+    return collapse_whitespace(doc.page_content)
+
+
+def render_document(doc: Document, description_words: int = 60) -> str:
+    if (doc.metadata or {}).get("source") == "property_listing":
+        return render_listing(doc, description_words)
+    return render_chunk(doc)
+
+
+def shingles(text: str, size: int = 3) -> set:
+    words = SHINGLE_PATTERN.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+@dataclass
+class ContextItem:
+    rank: int
+    source: str
+    ref: str
+    text: str
+    tokens: int
+
+
+@dataclass
+class ContextResult:
+    text: str
+    tokens: int
+    included: List[Dict[str, Any]] = field(default_factory=list)
+    truncated: List[Dict[str, Any]] = field(default_factory=list)
+    dropped: List[Dict[str, Any]] = field(default_factory=list)  # {"rank", "source", "ref", "reason"}
+    tokens_before: int = 0
+
+
+class ContextBuilder:
+    """Ranked documents -> CONTEXT text within token_budget"""
+
+    def __init__(self, token_budget: int = 2500, max_item_tokens: int = 400, min_item_tokens: int = 40,
+                 dedup_threshold: float = 0.85, description_words: int = 60):
+        self.token_budget = token_budget
+        self.max_item_tokens = max_item_tokens  # one long PDF chunk cannot crowd out the rest
+        self.min_item_tokens = min_item_tokens  # below this an item is dropped rather than truncated
+        self.dedup_threshold = dedup_threshold
+        self.description_words = description_words
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.dropped_duplicate = 0
+        self.dropped_budget = 0
+        self.truncated = 0
+
+    def _truncate(self, item: ContextItem, max_tokens: int):
+        item.text = truncate_to_tokens(item.text, max_tokens - count_tokens(ELLIPSIS)) + ELLIPSIS
+        item.tokens = count_tokens(item.text)
+
+    def build(self, docs: Sequence[Document], token_budget: Optional[int] = None) -> ContextResult:
+        """docs are in rank order, best first"""
+        budget = self.token_budget if token_budget is None else token_budget
+        items: List[ContextItem] = []
+        dropped, truncated = [], []
+        seen: List[set] = []
+        tokens_before = 0
+        for rank, doc in enumerate(docs, start=1):
+            metadata = doc.metadata or {}
+            source = metadata.get("source") or "unknown"
+            ref = str(metadata.get("id") or metadata.get("chunk_id") or rank)
+            tokens_before += count_tokens(doc.page_content)
+            text = render_document(doc, self.description_words)
+            if not text:
+                continue
+            signature = shingles(text)
+            if any(jaccard(signature, other) >= self.dedup_threshold for other in seen):
+                dropped.append({"rank": rank, "source": source, "ref": ref, "reason": "duplicate"})
+                continue
+            seen.append(signature)
+            item = ContextItem(rank, source, ref, text, count_tokens(text))
+            if item.tokens > self.max_item_tokens:
+                self._truncate(item, self.max_item_tokens)
+                truncated.append({"rank": rank, "source": source, "ref": ref, "reason": "item_limit"})
+            items.append(item)
+
+        total = sum(item.tokens + ITEM_OVERHEAD_TOKENS for item in items)
+        while items and total > budget:
+            last = items[-1]
+            keep = last.tokens - (total - budget)
+            if keep >= self.min_item_tokens:
+                self._truncate(last, keep)
+                truncated.append({"rank": last.rank, "source": last.source, "ref": last.ref, "reason": "budget"})
+                break
+            items.pop()
+            total -= last.tokens + ITEM_OVERHEAD_TOKENS
+            dropped.append({"rank": last.rank, "source": last.source, "ref": last.ref, "reason": "budget"})
+
+        text = "\n\n".join(f"[{number}] {item.text}" for number, item in enumerate(items, start=1))
+        result = ContextResult(
+            text=text,
+            tokens=count_tokens(text),
+            included=[{"rank": item.rank, "source": item.source, "ref": item.ref, "tokens": item.tokens}
+                      for item in items],
+            truncated=truncated,
+            dropped=dropped,
+            tokens_before=tokens_before,
+        )
+        with self._lock:
+            self.builds += 1
+            self.tokens_in += tokens_before
+            self.tokens_out += result.tokens
+            self.dropped_duplicate += sum(1 for entry in dropped if entry["reason"] == "duplicate")
+            self.dropped_budget += sum(1 for entry in dropped if entry["reason"] == "budget")
+            self.truncated += len(truncated)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "builds": self.builds,
+            "token_budget": self.token_budget,
+            "avg_tokens_in": round(self.tokens_in / self.builds, 1) if self.builds else 0,
+            "avg_tokens_out": round(self.tokens_out / self.builds, 1) if self.builds else 0,
+            "dropped_duplicate": self.dropped_duplicate,
+            "dropped_budget": self.dropped_budget,
+            "truncated": self.truncated,
+        }
@@ -0,0 +1,190 @@
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from array import array
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+# --------------------------
+# Persistent embedding cache
+# --------------------------
+# Vectors are keyed by (model name, sha256 of whitespace-normalized text) and
+# stored as float32 blobs in SQLite. When the cache grows past max_entries the
+# least recently used rows are evicted.
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def cache_key(model_name: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model_name}:{digest}"
+
+
+class SQLiteEmbeddingStore:
+    """Size-bounded LRU store of embedding vectors backed by a SQLite file"""
+
+    def __init__(self, path: str, max_entries: int = 100_000):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        if not keys:
+            return found
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items.items()],
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # Evict down to 90% so we don't pay for eviction on every insert
+        excess = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (excess,),
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves repeated texts from an embedding store"""
+
+    def __init__(self, underlying: Embeddings, store: SQLiteEmbeddingStore, model_name: Optional[str] = None):
+        self.underlying = underlying
+        self.store = store
+        self.model_name = model_name or getattr(underlying, "model", underlying.__class__.__name__)
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def _record(self, hits: int, misses: int):
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += misses
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [cache_key(self.model_name, text) for text in texts]
+        cached = self.store.get_many(keys)
+
+        # Embed each distinct missing text once, in a single call
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.store.put_many(fresh)
+            cached.update(fresh)
+
+        self._record(hits=len(texts) - len(missing), misses=len(missing))
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model_name, text)
+        cached = self.store.get_many([key])
+        if key in cached:
+            self._record(hits=1, misses=0)
+            return cached[key]
+        vector = self.underlying.embed_query(text)
+        self.store.put_many({key: vector})
+        self._record(hits=0, misses=1)
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [cache_key(self.model_name, text) for text in texts]
+        cached = await asyncio.to_thread(self.store.get_many, keys)
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = await self.underlying.aembed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            await asyncio.to_thread(self.store.put_many, fresh)
+            cached.update(fresh)
+
+        self._record(hits=len(texts) - len(missing), misses=len(missing))
+        return [cached[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model_name, text)
+        cached = await asyncio.to_thread(self.store.get_many, [key])
+        if key in cached:
+            self._record(hits=1, misses=0)
+            return cached[key]
+        vector = await self.underlying.aembed_query(text)
+        await asyncio.to_thread(self.store.put_many, {key: vector})
+        self._record(hits=0, misses=1)
+        return vector
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "model": self.model_name,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "entries": len(self.store),
+            "max_entries": self.store.max_entries,
+        }
@@ -0,0 +1,148 @@
+import math
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# --------------------------
+# Spatial index for listings
+# --------------------------
+# An in-memory geohash bucket index over listing coordinates. It is rebuilt
+# from Chroma metadata on first use and then kept in step by the listing sync
+# hooks, so it never needs its own persistence.
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS_KM = 6371.0088
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int = 5) -> str:
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """(lat degrees, lng degrees) covered by one cell at this precision"""
+    lng_bits = math.ceil(precision * 5 / 2)
+    lat_bits = math.floor(precision * 5 / 2)
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def valid_coordinates(latitude, longitude) -> bool:
+    try:
+        return -90 <= float(latitude) <= 90 and -180 <= float(longitude) <= 180
+    except (TypeError, ValueError):
+        return False
+
+
+class GeoIndex:
+    """Geohash-bucketed point index with radius and bounding-box queries"""
+
+    def __init__(self, precision: int = 5):
+        self.precision = precision
+        self.cell_lat, self.cell_lng = geohash_cell_size(precision)
+        self._points: Dict[str, Tuple[float, float]] = {}
+        self._places: Dict[str, str] = {}
+        self._buckets: Dict[str, Set[str]] = defaultdict(set)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def upsert(self, item_id: str, latitude: float, longitude: float, places: Iterable[str] = ()):
+        with self._lock:
+            self.remove(item_id)
+            latitude, longitude = float(latitude), float(longitude)
+            self._points[item_id] = (latitude, longitude)
+            self._buckets[geohash_encode(latitude, longitude, self.precision)].add(item_id)
+            self._places[item_id] = "|".join(p.lower() for p in places if p)
+
+    def remove(self, item_id: str):
+        with self._lock:
+            point = self._points.pop(item_id, None)
+            self._places.pop(item_id, None)
+            if point is not None:
+                cell = geohash_encode(point[0], point[1], self.precision)
+                self._buckets[cell].discard(item_id)
+                if not self._buckets[cell]:
+                    del self._buckets[cell]
+
+    def clear(self):
+        with self._lock:
+            self._points.clear()
+            self._places.clear()
+            self._buckets.clear()
+
+    def _candidates_in_box(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> Iterable[str]:
+        rows = math.ceil((max_lat - min_lat) / self.cell_lat) + 1
+        cols = math.ceil((max_lng - min_lng) / self.cell_lng) + 1
+        if rows * cols > len(self._buckets):
+            # Box spans more cells than we have occupied buckets; scanning is cheaper
+            return list(self._points)
+        candidates = []
+        for row in range(rows):
+            lat = min(max_lat, min_lat + row * self.cell_lat)
+            for col in range(cols):
+                lng = min(max_lng, min_lng + col * self.cell_lng)
+                candidates.extend(self._buckets.get(geohash_encode(lat, lng, self.precision), ()))
+        return set(candidates)
+
+    def within_bbox(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> List[str]:
+        with self._lock:
+            return [
+                item_id for item_id in self._candidates_in_box(min_lat, min_lng, max_lat, max_lng)
+                if min_lat <= self._points[item_id][0] <= max_lat and min_lng <= self._points[item_id][1] <= max_lng
+            ]
+
+    def within_radius(self, latitude: float, longitude: float, radius_km: float,
+                      limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """(item_id, distance_km) pairs within radius_km, nearest first"""
+        d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        d_lng = d_lat / max(math.cos(math.radians(latitude)), 1e-6)
+        min_lat, max_lat = max(-90.0, latitude - d_lat), min(90.0, latitude + d_lat)
+        min_lng, max_lng = max(-180.0, longitude - d_lng), min(180.0, longitude + d_lng)
+        with self._lock:
+            hits = []
+            for item_id in self._candidates_in_box(min_lat, min_lng, max_lat, max_lng):
+                distance = haversine_km(latitude, longitude, *self._points[item_id])
+                if distance <= radius_km:
+                    hits.append((item_id, distance))
+        hits.sort(key=lambda hit: hit[1])
+        return hits[:limit] if limit else hits
+
+    def place_centroid(self, place: str) -> Optional[Tuple[float, float]]:
+        """Mean coordinates of indexed items tagged with a place name (e.g. a city)"""
+        place = place.strip().lower()
+        with self._lock:
+            points = [
+                self._points[item_id] for item_id, places in self._places.items()
+                if place in places.split("|")
+            ]
+        if not points:
+            return None
+        return sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points)
+
+    def known_places(self) -> Set[str]:
+        with self._lock:
+            return {place for places in self._places.values() for place in places.split("|") if place}
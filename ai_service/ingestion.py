@@ -0,0 +1,170 @@
+import time
+import random
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from langchain.schema import Document
+
+from tokens import count_tokens
+
+# --------------------------
+# Bulk ingestion pipeline
+# --------------------------
+# Documents are streamed in, grouped into token-budgeted batches, embedded by a
+# bounded worker pool (with backoff on rate limits) and written to the vector
+# store as each batch completes, so writes overlap with the next embeddings.
+# A failed batch is recorded and skipped instead of failing the whole run.
+
+# write(ids, documents, vectors) -> None
+BatchWriter = Callable[[List[str], List[Document], List[List[float]]], None]
+
+
+@dataclass
+class IngestionReport:
+    documents: int = 0
+    batches: int = 0
+    failed_batches: int = 0
+    failed_ids: List[str] = field(default_factory=list)
+    cancelled: bool = False
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def seconds(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.documents / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "documents": self.documents,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "failed_documents": len(self.failed_ids),
+            "cancelled": self.cancelled,
+            "seconds": round(self.seconds, 3),
+            "docs_per_second": round(self.docs_per_second, 2),
+        }
+
+
+def iter_batches(items: Iterable[Tuple[str, Document]], max_tokens: int,
+                 max_size: int) -> Iterator[List[Tuple[str, Document]]]:
+    """Group (id, document) pairs into batches bounded by token count and size"""
+    batch: List[Tuple[str, Document]] = []
+    batch_tokens = 0
+    for item in items:
+        tokens = count_tokens(item[1].page_content)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_size):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(item)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Rate limits, timeouts and 5xx responses are worth retrying"""
+    name = error.__class__.__name__
+    if "RateLimit" in name or "Timeout" in name or "APIConnection" in name:
+        return True
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or (isinstance(status, int) and status >= 500)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def chroma_batch_writer(vector_store) -> BatchWriter:
+    """Writer that upserts precomputed embeddings into a langchain Chroma store"""
+    def write(ids: List[str], docs: List[Document], vectors: List[List[float]]):
+        # Chroma only accepts scalar, non-null metadata values
+        metadatas = [{k: v for k, v in doc.metadata.items() if v is not None} or None for doc in docs]
+        vector_store._collection.upsert(
+            ids=ids,
+            embeddings=vectors,
+            documents=[doc.page_content for doc in docs],
+            metadatas=metadatas,
+        )
+    return write
+
+
+class BulkIngestionPipeline:
+    """Embeds and writes large document streams in concurrent, retryable batches"""
+
+    def __init__(self, embeddings, max_batch_tokens: int = 20_000, max_batch_size: int = 256,
+                 max_workers: int = 4, max_retries: int = 5, backoff_seconds: float = 1.0,
+                 max_backoff_seconds: float = 60.0,
+                 progress_callback: Optional[Callable[[IngestionReport], None]] = None):
+        self.embeddings = embeddings
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.progress_callback = progress_callback
+
+    def _embed_with_retry(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable_error(e):
+                    raise
+                delay = retry_after_seconds(e) or min(
+                    self.max_backoff_seconds, self.backoff_seconds * (2 ** attempt)
+                )
+                time.sleep(delay * (1 + random.random() * 0.25))
+
+    def run(self, documents: Iterable[Tuple[str, Document]], write: BatchWriter,
+            should_cancel: Optional[Callable[[], bool]] = None,
+            progress_callback: Optional[Callable[[IngestionReport], None]] = None) -> IngestionReport:
+        """Embed and write (id, document) pairs; returns a report of what was ingested"""
+        report = IngestionReport()
+        progress_callback = progress_callback or self.progress_callback
+        batches = iter_batches(documents, self.max_batch_tokens, self.max_batch_size)
+        max_in_flight = self.max_workers * 2
+        in_flight = {}
+
+        def finish(future):
+            batch = in_flight.pop(future)
+            ids = [doc_id for doc_id, _ in batch]
+            try:
+                vectors = future.result()
+                write(ids, [doc for _, doc in batch], vectors)
+                report.documents += len(batch)
+                report.batches += 1
+            except Exception as e:
+                print(f"Ingestion batch of {len(batch)} documents failed: {e}")
+                report.failed_batches += 1
+                report.failed_ids.extend(ids)
+            if progress_callback:
+                progress_callback(report)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed") as executor:
+            for batch in batches:
+                if should_cancel and should_cancel():
+                    report.cancelled = True
+                    break
+                while len(in_flight) >= max_in_flight:
+                    done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finish(future)
+                future = executor.submit(self._embed_with_retry, [doc.page_content for _, doc in batch])
+                in_flight[future] = batch
+            while in_flight:
+                done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future)
+
+        report.finished_at = time.time()
+        return report
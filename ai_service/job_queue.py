@@ -0,0 +1,294 @@
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+# --------------------------
+# Background job scheduler
+# --------------------------
+# Long-running ingestion work (listing syncs, PDF ingestion) runs as jobs on a
+# small, fixed pool of worker threads instead of inside HTTP requests. Job
+# state lives in SQLite so it survives restarts; jobs that were queued or
+# running when the process stopped are queued again on start (every handler is
+# an idempotent upsert). Enqueuing with the key of a job that is still queued
+# merges into that job instead of adding a duplicate.
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    params: Dict[str, Any]
+    key: Optional[str] = None
+    status: str = QUEUED
+    progress: Dict[str, Any] = field(default_factory=dict)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    cancel_requested: bool = False
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        end = self.finished_at or time.time()
+        data["seconds"] = round(end - self.started_at, 3) if self.started_at else 0.0
+        return data
+
+
+class JobContext:
+    """Handed to job handlers so they can report progress and notice cancellation"""
+
+    def __init__(self, scheduler: "JobScheduler", job: Job, progress_interval: float = 1.0):
+        self._scheduler = scheduler
+        self.job = job
+        self._progress_interval = progress_interval
+        self._last_saved = 0.0
+
+    def should_cancel(self) -> bool:
+        return self.job.cancel_requested
+
+    def report_progress(self, progress):
+        """Accepts a dict or anything with as_dict() (e.g. an IngestionReport)"""
+        self.job.progress = progress.as_dict() if hasattr(progress, "as_dict") else dict(progress)
+        if time.time() - self._last_saved >= self._progress_interval:
+            self._scheduler.store.save(self.job)
+            self._last_saved = time.time()
+
+
+class SQLiteJobStore:
+    """Persisted job records"""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, "
+            "created_at REAL NOT NULL, data TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        self._conn.commit()
+
+    def save(self, job: Job):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, status, created_at, data) VALUES (?, ?, ?, ?)",
+                (job.id, job.status, job.created_at, json.dumps(asdict(job), default=str)),
+            )
+            self._conn.commit()
+
+    def load(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(**json.loads(row[0])) if row else None
+
+    def list(self, statuses: Optional[List[str]] = None, limit: int = 50) -> List[Job]:
+        with self._lock:
+            if statuses:
+                placeholders = ",".join("?" * len(statuses))
+                rows = self._conn.execute(
+                    f"SELECT data FROM jobs WHERE status IN ({placeholders}) ORDER BY created_at DESC LIMIT ?",
+                    (*statuses, limit),
+                ).fetchall()
+            else:
+                rows = self._conn.execute("SELECT data FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [Job(**json.loads(row[0])) for row in rows]
+
+    def prune(self, max_age_seconds: float):
+        with self._lock:
+            self._conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({','.join('?' * len(FINISHED_STATUSES))}) AND created_at < ?",
+                (*FINISHED_STATUSES, time.time() - max_age_seconds),
+            )
+            self._conn.commit()
+
+
+# handler(params, context) -> result dict
+JobHandler = Callable[[Dict[str, Any], JobContext], Optional[Dict[str, Any]]]
+# merge(queued params, new params) -> params for the coalesced job
+ParamMerger = Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]
+
+
+class JobScheduler:
+    """FIFO job queue drained by a bounded number of worker threads"""
+
+    def __init__(self, store: SQLiteJobStore, max_workers: int = 1, retention_seconds: float = 7 * 24 * 3600):
+        self.store = store
+        self.max_workers = max_workers
+        self.retention_seconds = retention_seconds
+        self._handlers: Dict[str, JobHandler] = {}
+        self._mergers: Dict[str, ParamMerger] = {}
+        self._jobs: Dict[str, Job] = {}  # queued and running jobs
+        self._queued_by_key: Dict[str, str] = {}
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._interrupted: Set[str] = set()  # running jobs cancelled by stop(), requeued when they return
+        self._stopping = False
+
+    def register(self, kind: str, handler: JobHandler, merge: Optional[ParamMerger] = None):
+        self._handlers[kind] = handler
+        if merge is not None:
+            self._mergers[kind] = merge
+
+    def start(self):
+        if self._threads:
+            return
+        with self._lock:
+            self._stopping = False
+        # Drop IDs and sentinels left in the queue by an earlier stop(); the store is the source of truth
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self.store.prune(self.retention_seconds)
+        # Resume work that was interrupted by a restart
+        for job in reversed(self.store.list([QUEUED, RUNNING], limit=10_000)):
+            job.status = QUEUED
+            self._admit(job)
+        for index in range(self.max_workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            # Workers stop picking up queued jobs; those stay QUEUED and start() resumes them
+            self._stopping = True
+            for job in self._jobs.values():
+                if job.status == RUNNING:
+                    job.cancel_requested = True
+                    self._interrupted.add(job.id)
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _register(self, job: Job):
+        # Caller holds self._lock
+        self._jobs[job.id] = job
+        if job.key:
+            self._queued_by_key[job.key] = job.id
+
+    def _admit(self, job: Job):
+        with self._lock:
+            self._register(job)
+        self.store.save(job)
+        self._queue.put(job.id)
+
+    def enqueue(self, kind: str, params: Optional[Dict[str, Any]] = None, key: Optional[str] = None) -> Tuple[Job, bool]:
+        """Queue a job; returns (job, coalesced) where coalesced means an existing queued job absorbed it"""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        params = params or {}
+        with self._lock:
+            existing = self._jobs.get(self._queued_by_key.get(key)) if key else None
+            if existing is not None and existing.status == QUEUED:
+                merge = self._mergers.get(kind)
+                existing.params = merge(existing.params, params) if merge else params
+                self.store.save(existing)
+                return existing, True
+            job = Job(id=uuid.uuid4().hex, kind=kind, params=params, key=key)
+            self._register(job)
+        self.store.save(job)
+        self._queue.put(job.id)
+        return job, False
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job or self.store.load(job_id)
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Job]:
+        jobs = {job.id: job for job in self.store.list([status] if status else None, limit)}
+        with self._lock:
+            # Live objects carry fresher progress than the throttled store
+            for job_id in jobs:
+                if job_id in self._jobs:
+                    jobs[job_id] = self._jobs[job_id]
+        return sorted(jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return self.store.load(job_id)
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.finished_at = time.time()
+                self._release(job)
+            else:
+                job.cancel_requested = True
+        self.store.save(job)
+        return job
+
+    def _release(self, job: Job):
+        if job.key and self._queued_by_key.get(job.key) == job.id:
+            del self._queued_by_key[job.key]
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            with self._lock:
+                if self._stopping:
+                    return
+                job = self._jobs.get(job_id)
+                if job is None or job.status != QUEUED:
+                    self._jobs.pop(job_id, None)
+                    continue
+                job.status = RUNNING
+                job.started_at = time.time()
+                job.attempts += 1
+                # Later requests with this key must queue behind it, not merge into it
+                self._release(job)
+            self.store.save(job)
+            self._run(job)
+
+    def _run(self, job: Job):
+        context = JobContext(self, job)
+        try:
+            job.result = self._handlers[job.kind](job.params, context) or {}
+            with self._lock:
+                interrupted = job.id in self._interrupted
+                self._interrupted.discard(job.id)
+            if interrupted:
+                # Interrupted by shutdown rather than by a user: run it again on next start
+                job.status = QUEUED
+                job.started_at = None
+                job.cancel_requested = False
+                self.store.save(job)
+                return
+            job.status = CANCELLED if job.cancel_requested else SUCCEEDED
+        except Exception as e:
+            print(f"Job {job.id} ({job.kind}) failed: {e}")
+            with self._lock:
+                self._interrupted.discard(job.id)
+            job.error = str(e)
+            job.status = FAILED
+        job.finished_at = time.time()
+        self.store.save(job)
+        with self._lock:
+            self._jobs.pop(job.id, None)
+        print(f"Job {job.id} ({job.kind}) {job.status} in {round(job.finished_at - job.started_at, 3)}s")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            "workers": self.max_workers,
+            "queued": statuses.count(QUEUED),
+            "running": statuses.count(RUNNING),
+        }
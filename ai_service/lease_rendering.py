@@ -0,0 +1,289 @@
+import io
+import os
+import time
+import asyncio
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Optional
+
+# --------------------------
+# Lease PDF rendering
+# --------------------------
+# ReportLab layout for lease agreements. ReportLab is imported, and paragraph
+# and table styles are built, once per process on first use. LeaseRenderService runs doc.build in a process pool so
+# rendering neither blocks the event loop nor holds the API process's GIL,
+# and bounds how many renders may be queued at once: when the queue is full,
+# callers get RenderQueueFull instead of piling up behind it.
+
+_STYLES = None
+_TABLE_STYLES = None
+
+
+def get_lease_styles():
+    """Sample stylesheet plus the lease-specific styles, built once per process"""
+    global _STYLES
+    if _STYLES is None:
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib import colors
+
+        styles = getSampleStyleSheet()
+        styles.add(ParagraphStyle(
+            name='LeaseTitle',
+            parent=styles['Title'],
+            fontSize=16,
+            spaceAfter=20,
+            alignment=1  # Center alignment
+        ))
+        styles.add(ParagraphStyle(
+            name='SectionHeader',
+            parent=styles['Heading2'],
+            fontSize=12,
+            spaceBefore=15,
+            spaceAfter=10,
+            textColor=colors.darkblue
+        ))
+        styles.add(ParagraphStyle(
+            name='LeaseBody',
+            parent=styles['Normal'],
+            fontSize=10,
+            spaceBefore=6,
+            spaceAfter=6,
+            leftIndent=20
+        ))
+        _STYLES = styles
+    return _STYLES
+
+
+def get_table_styles():
+    """(party table style, signature table style), built once per process"""
+    global _TABLE_STYLES
+    if _TABLE_STYLES is None:
+        from reportlab.platypus import TableStyle
+        from reportlab.lib import colors
+
+        party = TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ])
+        signature = TableStyle([
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (-1, -1), 'BOTTOM'),
+        ])
+        _TABLE_STYLES = (party, signature)
+    return _TABLE_STYLES
+
+
+def is_section_header(section: str) -> bool:
+    return any(keyword in section.upper() for keyword in ['SECTION', 'ARTICLE', 'CLAUSE']) or section.strip().endswith(':')
+
+
+def render_lease_pdf(lease_content: str, lease: Dict[str, Any]) -> bytes:
+    """Render lease text and party details (LeaseData fields) to PDF bytes"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
+    from reportlab.lib.units import inch
+
+    styles = get_lease_styles()
+    party_table_style, signature_table_style = get_table_styles()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=72)
+    story = []
+
+    # Title
+    story.append(Paragraph("RESIDENTIAL LEASE AGREEMENT", styles['LeaseTitle']))
+    story.append(Spacer(1, 20))
+
+    # Property and Party Information Table
+    party_data = [
+        ['PROPERTY ADDRESS:', lease.get('property_address', '')],
+        ['LANDLORD:', f"{lease.get('landlord_name', '')}<br/>{lease.get('landlord_address', '')}<br/>"
+                      f"Phone: {lease.get('landlord_phone', '')}<br/>Email: {lease.get('landlord_email', '')}"],
+        ['TENANT:', f"{lease.get('tenant_name', '')}<br/>{lease.get('tenant_address', '')}<br/>"
+                    f"Phone: {lease.get('tenant_phone', '')}<br/>Email: {lease.get('tenant_email', '')}"],
+        ['LEASE PERIOD:', f"{lease.get('lease_start_date', '')} to {lease.get('lease_end_date', '')}"],
+        ['MONTHLY RENT:', f"${lease.get('monthly_rent', '')}"],
+        ['SECURITY DEPOSIT:', f"${lease.get('security_deposit', '')}"]
+    ]
+    party_table = Table(party_data, colWidths=[2*inch, 4*inch])
+    party_table.setStyle(party_table_style)
+    story.append(party_table)
+    story.append(Spacer(1, 20))
+
+    # Parse and add the generated lease content
+    for section in lease_content.split('\n\n'):
+        if section.strip():
+            style = styles['SectionHeader'] if is_section_header(section) else styles['LeaseBody']
+            story.append(Paragraph(section.strip(), style))
+            story.append(Spacer(1, 6))
+
+    # Signature Section
+    story.append(Spacer(1, 30))
+    story.append(Paragraph("SIGNATURES", styles['SectionHeader']))
+    signature_data = [
+        ['LANDLORD SIGNATURE:', '____________________', 'DATE:', '____________'],
+        [f"Print Name: {lease.get('landlord_name', '')}", '', '', ''],
+        ['', '', '', ''],
+        ['TENANT SIGNATURE:', '____________________', 'DATE:', '____________'],
+        [f"Print Name: {lease.get('tenant_name', '')}", '', '', '']
+    ]
+    signature_table = Table(signature_data, colWidths=[2*inch, 2*inch, 1*inch, 1*inch])
+    signature_table.setStyle(signature_table_style)
+    story.append(signature_table)
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def _warm_worker() -> bool:
+    get_lease_styles()
+    get_table_styles()
+    return True
+
+
+class RenderQueueFull(Exception):
+    """Raised when the render queue is at capacity; callers should retry later"""
+
+
+class LeaseRenderService:
+    """Long-lived process pool for lease PDF rendering with a bounded queue"""
+
+    def __init__(self, max_workers: Optional[int] = None, max_queue: int = 32, queue_timeout: float = 5.0):
+        self.max_workers = max_workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        # Rendering or waiting for a worker; beyond this, submit() waits then rejects
+        self._slots = threading.BoundedSemaphore(self.max_workers + max_queue)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.rendered = 0
+        self.rejected = 0
+        self.failed = 0
+        self.render_seconds = 0.0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn, not fork: the API process has live threads
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def warmup(self):
+        """Start the worker processes and import ReportLab in them ahead of the first request"""
+        pool = self._get_pool()
+        for future in [pool.submit(_warm_worker) for _ in range(self.max_workers)]:
+            future.result()
+
+    def submit(self, lease_content: str, lease: Dict[str, Any], timeout: Optional[float] = None) -> Future:
+        timeout = self.queue_timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=timeout):
+            with self._stats_lock:
+                self.rejected += 1
+            raise RenderQueueFull(f"Lease rendering is at capacity ({self.max_workers + self.max_queue} pending)")
+        started = time.time()
+        with self._stats_lock:
+            self.in_flight += 1
+        try:
+            future = self._get_pool().submit(render_lease_pdf, lease_content, dict(lease))
+        except Exception:
+            self._finished(started, failed=True)
+            raise
+        future.add_done_callback(lambda f: self._finished(started, failed=f.exception() is not None))
+        return future
+
+    def _finished(self, started: float, failed: bool):
+        with self._stats_lock:
+            self.in_flight -= 1
+            if failed:
+                self.failed += 1
+            else:
+                self.rendered += 1
+                self.render_seconds += time.time() - started
+        self._slots.release()
+
+    def render(self, lease_content: str, lease: Dict[str, Any]) -> bytes:
+        return self.submit(lease_content, lease).result()
+
+    async def arender(self, lease_content: str, lease: Dict[str, Any]) -> bytes:
+        # Waiting for a queue slot blocks, so do it off the event loop
+        future = await asyncio.to_thread(self.submit, lease_content, lease)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "rendered": self.rendered,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_render_seconds": round(self.render_seconds / self.rendered, 4) if self.rendered else 0.0,
+            }
+
+
+# --------------------------
+# Benchmark
+# --------------------------
+SAMPLE_LEASE = {
+    "property_address": "12 Canal View, Lahore", "landlord_name": "Ayesha Khan", "landlord_address": "5 Mall Road",
+    "landlord_phone": "0300-1234567", "landlord_email": "ayesha@example.com", "tenant_name": "Omar Ali",
+    "tenant_address": "88 Garden Town", "tenant_phone": "0311-7654321", "tenant_email": "omar@example.com",
+    "lease_start_date": "2025-01-01", "lease_end_date": "2025-12-31", "monthly_rent": "85000",
+    "security_deposit": "170000",
+}
+
+SAMPLE_CONTENT = "\n\n".join(
+    f"SECTION {i}: TERMS:\n\n" + " ".join(["The Tenant shall pay rent on or before the first day of each month."] * 8)
+    for i in range(1, 13)
+)
+
+
+def benchmark(count: int = 50, workers: Optional[int] = None) -> Dict[str, float]:
+    """PDFs/second rendering in-process versus through the process pool"""
+    started = time.time()
+    for _ in range(count):
+        render_lease_pdf(SAMPLE_CONTENT, SAMPLE_LEASE)
+    serial_seconds = time.time() - started
+
+    service = LeaseRenderService(max_workers=workers, max_queue=count)
+    service.warmup()
+    started = time.time()
+    futures = [service.submit(SAMPLE_CONTENT, SAMPLE_LEASE) for _ in range(count)]
+    for future in futures:
+        future.result()
+    pooled_seconds = time.time() - started
+    service.shutdown()
+
+    return {
+        "pdfs": count,
+        "workers": service.max_workers,
+        "serial_pdfs_per_second": round(count / serial_seconds, 2),
+        "pooled_pdfs_per_second": round(count / pooled_seconds, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark lease PDF rendering throughput")
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    print(benchmark(args.count, args.workers))
@@ -0,0 +1,491 @@
+import re
+import time
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# --------------------------
+# Lease slot filling
+# --------------------------
+# Lease details are collected from chat turns with regex recognizers for
+# emails, phones, dates, amounts, names and addresses. Which field a value
+# fills comes from nearby keywords ("tenant", "deposit", "starts"), then from
+# the fields the assistant last asked for. Filled slots are kept per
+# conversation, so each turn parses only its newest message; the LLM is only
+# consulted when the recognizers leave a field the assistant asked for empty.
+
+MONTHS = {
+    name: number
+    for number, names in enumerate([
+        ("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"), ("may",),
+        ("june", "jun"), ("july", "jul"), ("august", "aug"), ("september", "sep", "sept"),
+        ("october", "oct"), ("november", "nov"), ("december", "dec"),
+    ], start=1)
+    for name in names
+}
+_MONTH = "|".join(sorted(MONTHS, key=len, reverse=True))
+_ORDINAL = r"(?:st|nd|rd|th)?"
+
+EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+DATE_RES = [
+    ("ymd", re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b")),
+    ("numeric", re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})\b")),
+    ("dmy", re.compile(rf"(?i)\b(\d{{1,2}}){_ORDINAL}\s+(?:of\s+)?({_MONTH})\.?,?\s+(\d{{4}})\b")),
+    ("mdy", re.compile(rf"(?i)\b({_MONTH})\.?\s+(\d{{1,2}}){_ORDINAL},?\s+(\d{{4}})\b")),
+]
+PHONE_RE = re.compile(r"(?<![\w@])\+?\(?\d[\d\s().-]{5,}\d(?![\w@])")
+AMOUNT_RE = re.compile(
+    r"(?i)(?<![\w.])(?:(?:rs\.?|pkr|usd|\$)\s*)?(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d+))?"
+    r"(?:\s*(k|thousand|lakh|lac|m|million)\b)?"
+)
+NAME_RE = re.compile(
+    r"(?i:\b(landlord|lessor|owner|tenant|lessee|renter)(?:'s)?(?:\s+(?:full\s+)?name)?)"
+    r"\s*(?i:is|will\s+be|:|-|=)?\s*(?i:called|named)?\s*(?:(?:Mr|Mrs|Ms|Miss|Dr)\.?\s+)?"
+    r"([A-Z][a-zA-Z'.-]+(?:\s+[A-Z][a-zA-Z'.-]+){0,3})"
+)
+ADDRESS_RE = re.compile(
+    r"(?i)\b(?:(landlord|lessor|owner|tenant|lessee|renter)(?:'s)?\s+)?"
+    r"(?:(?:address|addr)\s*(?:is|:|-)?|(?:property|premises|unit|house|apartment|flat)\s+(?:is\s+)?(?:located\s+)?at|located\s+at)"
+    r"\s+(.+?)(?=\s*(?:[;\n]|\.\s|\.$|$|\s+(?:and|with|for)\s|,\s*(?:rent|the|landlord|tenant|phone|email|lease|deposit)\b))"
+)
+DURATION_RE = re.compile(
+    r"(?i)\b(?:for\s+)?(\d{1,2}|a|an|one|two|three|six|twelve|eighteen|twenty[- ]four)[- ](year|month)s?\b"
+    r"(?=[^.;\n]*\b(?:lease|term|tenancy|contract)\b)|\b(?:lease|term|tenancy|contract)\b[^.;\n]*?\bfor\s+"
+    r"(\d{1,2}|a|an|one|two|three|six|twelve|eighteen|twenty[- ]four)\s+(year|month)s?\b"
+)
+PET_RE = re.compile(
+    r"(?i)\b(no\s+pets?(?:\s+allowed)?|pets?\s+(?:are\s+)?(?:not\s+)?allowed(?:\s+with\s+[^.;\n]+)?|pet[- ]friendly"
+    r"|(?:cats?|dogs?|small\s+pets?)\s+(?:only|allowed|are\s+allowed)[^.;\n]*)"
+)
+RENT_MULTIPLE_RE = re.compile(
+    r"(?i)\b(\d{1,2}|one|two|three|six|twelve)\s*(?:x\s*|times\s+|months?(?:'s|')?\s+(?:of\s+)?)"
+    r"(?:the\s+)?(?:monthly\s+)?rent\b"
+)
+DURATION_UNIT_RE = re.compile(r"(?i)\s*[- ]?(?:years?|months?|weeks?|days?)\b")
+BARE_NAME_RE = re.compile(r"(?i)(?:(?:mr|mrs|ms|miss|dr)\.?\s+)?([a-z][a-z'.-]*(?:\s+[a-z][a-z'.-]*){0,3})")
+NUMBER_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "six": 6, "twelve": 12,
+                "eighteen": 18, "twenty-four": 24, "twenty four": 24}
+MULTIPLIERS = {"k": 1_000, "thousand": 1_000, "lakh": 100_000, "lac": 100_000, "m": 1_000_000, "million": 1_000_000}
+
+# keyword pattern -> slot the following value most likely belongs to
+ROLE_KEYWORDS = re.compile(r"(?i)\b(landlord|lessor|owner|tenant|lessee|renter)")
+AMOUNT_KEYWORDS = [
+    (re.compile(r"(?i)\blate\s+(?:fee|charge|payment\s+fee)|\bpenalty"), "late_fee"),
+    (re.compile(r"(?i)\bdeposit"), "security_deposit"),
+    (re.compile(r"(?i)\brent\b|\bper\s+month|\bmonthly|\ba\s+month\b"), "monthly_rent"),
+]
+DATE_KEYWORDS = [
+    (re.compile(r"(?i)\b(?:start|starts|starting|begin|begins|beginning|commenc\w*|from|move[- ]in|effective)\b"),
+     "lease_start_date"),
+    (re.compile(r"(?i)\b(?:end|ends|ending|until|till|through|expir\w*|terminat\w*|to|move[- ]out)\b"),
+     "lease_end_date"),
+]
+PHONE_KEYWORDS = re.compile(r"(?i)\b(?:phone|cell|mobile|number|contact|call|whatsapp|tel)\b")
+TITLE_STOPWORDS = {"phone", "email", "address", "the", "and", "rent", "deposit", "lease", "tenant", "landlord"}
+# Words that mark a message as something other than a bare name or address answer
+BARE_ANSWER_STOPWORDS = {
+    "yes", "no", "ok", "okay", "sure", "thanks", "thank", "hi", "hello", "please", "skip", "later", "none",
+    "i", "i'm", "im", "my", "we", "you", "it", "is", "are", "what", "why", "how", "when", "who", "which",
+    "can", "could", "want", "need", "don't", "dont", "know", "not", "generate", "create", "draft", "make",
+    "prepare", "download", "lease", "rent", "deposit", "phone", "email", "month", "months", "year", "years",
+    "tenant", "landlord",
+}
+ROLE_PREFIX = {"landlord": "landlord", "lessor": "landlord", "owner": "landlord",
+               "tenant": "tenant", "lessee": "tenant", "renter": "tenant"}
+
+# Recognized value kind -> slots that kind can fill, in the order they are asked for
+SLOT_KINDS = {
+    "email": ["landlord_email", "tenant_email"],
+    "phone": ["landlord_phone", "tenant_phone"],
+    "name": ["landlord_name", "tenant_name"],
+    "address": ["property_address", "landlord_address", "tenant_address"],
+    "date": ["lease_start_date", "lease_end_date"],
+    "amount": ["monthly_rent", "security_deposit", "late_fee"],
+}
+
+LEASE_SLOT_FALLBACK_PROMPT = """Extract lease details from the user's message below. Return ONLY a JSON object with any of these fields that the message states: {fields}. Use YYYY-MM-DD for dates and plain numbers without currency symbols for amounts. Return {{}} if the message states none of them.
+
+Message: {message}"""
+
+
+def _add_months(start: date, months: int) -> date:
+    month = start.month - 1 + months
+    year, month = start.year + month // 12, month % 12 + 1
+    days = [31, 29 if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0) else 28,
+            31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month - 1]
+    return date(year, month, min(start.day, days))
+
+
+def _preceding(patterns, text: str, position: int) -> Optional[str]:
+    """Slot of the keyword closest before position, if any"""
+    best, best_end = None, -1
+    for pattern, slot in patterns:
+        for match in pattern.finditer(text, 0, position):
+            if match.end() <= position and match.end() > best_end:
+                best, best_end = slot, match.end()
+    return best
+
+
+def _sentence_bounds(text: str, position: int) -> Tuple[int, int]:
+    start = max(text.rfind(mark, 0, position) for mark in (". ", "\n", ";", "?", "!")) + 1
+    ends = [i for i in (text.find(mark, position) for mark in (". ", "\n", ";", "?", "!")) if i != -1]
+    return start, min(ends) if ends else len(text)
+
+
+def _role_before(text: str, position: int) -> Optional[str]:
+    """Closest party mentioned before position in the message: values carry the last one named"""
+    matches = list(ROLE_KEYWORDS.finditer(text, 0, position))
+    return ROLE_PREFIX[matches[-1].group(1).lower()] if matches else None
+
+
+def format_amount(value: float) -> str:
+    return str(int(value)) if value.is_integer() else f"{value:.2f}"
+
+
+def parse_amount(match) -> str:
+    value = float(match.group(1).replace(",", "") + ("." + match.group(2) if match.group(2) else ""))
+    if match.group(3):
+        value *= MULTIPLIERS[match.group(3).lower()]
+    return format_amount(value)
+
+
+def parse_date(kind: str, match, day_first: bool = False) -> Optional[str]:
+    try:
+        if kind == "ymd":
+            year, month, day = (int(g) for g in match.groups())
+        elif kind == "numeric":
+            first, second, year = (int(g) for g in match.groups())
+            if first > 12 or (day_first and second <= 12):
+                day, month = first, second
+            else:
+                month, day = first, second
+        elif kind == "dmy":
+            day, month, year = int(match.group(1)), MONTHS[match.group(2).lower()], int(match.group(3))
+        else:
+            month, day, year = MONTHS[match.group(1).lower()], int(match.group(2)), int(match.group(3))
+        return date(year, month, day).isoformat()
+    except (ValueError, KeyError):
+        return None
+
+
+@dataclass
+class LeaseSlotState:
+    fields: Dict[str, Any] = field(default_factory=dict)
+    messages_seen: int = 0  # conversation messages already parsed, including the last query
+    last_digest: str = ""  # digest of the last parsed message, to notice edited histories
+    asked: List[str] = field(default_factory=list)  # fields the last reply asked for
+    updated_at: float = field(default_factory=time.time)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def conversation_key(user, conversation_history, query: str) -> str:
+    """Stable per-conversation key: the user plus the conversation's first message"""
+    user_id = ""
+    if user:
+        user_id = str(user.get("id") or user.get("_id") or user.get("email") or "")
+    first = conversation_history[0].content if conversation_history else query
+    return _digest(f"{user_id}\n{first}")
+
+
+class LeaseSlotExtractor:
+    """Deterministic recognizers mapping one message to lease fields"""
+
+    def __init__(self, fields_spec: Dict[str, Dict[str, Any]], validate: Callable[[str, Any], Optional[str]],
+                 day_first: bool = False):
+        # Flatten get_lease_template_fields() groups into field -> spec
+        self.specs = {name: spec for group in fields_spec.values() for name, spec in group.items()}
+        self.validate = validate
+        self.day_first = day_first
+
+    def _pick(self, kind: str, role: Optional[str], keyword_slot: Optional[str], asked: List[str],
+              found: Dict[str, Any], fields: Dict[str, Any]) -> Optional[str]:
+        candidates = SLOT_KINDS[kind]
+        if keyword_slot in candidates:
+            return keyword_slot
+        if role is not None:
+            for slot in candidates:
+                if slot.startswith(role):
+                    return slot
+        # No keyword: fill what the assistant asked for, then the first empty slot
+        for slot in asked + candidates:
+            if slot in candidates and slot not in found and not fields.get(slot):
+                if kind in ("name", "phone", "email") and slot not in asked:
+                    return None  # a bare name or contact is too ambiguous without a question
+                return slot
+        return None
+
+    def extract(self, message: str, fields: Dict[str, Any], asked: List[str]) -> Dict[str, Any]:
+        found: Dict[str, Any] = {}
+        text = message
+        masked = list(message)
+
+        def mask(match):
+            for i in range(match.start(), match.end()):
+                masked[i] = " "
+
+        def assign(kind, value, position, keyword_slot=None, use_role=True) -> bool:
+            role = _role_before(text, position) if use_role else None
+            slot = self._pick(kind, role, keyword_slot, asked, found, fields)
+            if slot and self.validate(slot, value) is None:
+                found[slot] = value
+                return True
+            return False
+
+        for match in EMAIL_RE.finditer(text):
+            assign("email", match.group(0).lower(), match.start())
+            mask(match)
+
+        dates = []
+        for kind, pattern in DATE_RES:
+            for match in pattern.finditer("".join(masked)):
+                value = parse_date(kind, match, self.day_first)
+                if value:
+                    dates.append((match.start(), value))
+                    mask(match)
+        for position, value in sorted(dates):
+            start, _ = _sentence_bounds(text, position)
+            keyword = _preceding(DATE_KEYWORDS, text[start:position], position - start)
+            assign("date", value, position, keyword, use_role=False)
+
+        for match in NAME_RE.finditer(text):
+            words = match.group(2).split()
+            while words and words[-1].lower().strip(".") in TITLE_STOPWORDS:
+                words.pop()
+            if words:
+                slot = f"{ROLE_PREFIX[match.group(1).lower()]}_name"
+                if self.validate(slot, " ".join(words)) is None:
+                    found[slot] = " ".join(words)
+                mask(match)
+
+        for match in ADDRESS_RE.finditer(text):
+            value = match.group(2).strip(" ,.")
+            if len(value) >= 5 and (any(ch.isdigit() for ch in value) or "," in value):
+                role = ROLE_PREFIX.get((match.group(1) or "").lower())
+                slot = f"{role}_address" if role else "property_address"
+                found[slot] = value
+                mask(match)
+
+        current = "".join(masked)
+        for match in PHONE_RE.finditer(current):
+            digits = re.sub(r"\D", "", match.group(0))
+            start, _ = _sentence_bounds(text, match.start())
+            has_keyword = PHONE_KEYWORDS.search(text, start, match.start()) is not None
+            is_money = _preceding(AMOUNT_KEYWORDS, text[start:match.start()], match.start() - start) is not None
+            looks_like_phone = match.group(0).lstrip().startswith(("+", "0", "(")) or re.search(r"\d[\s.-]\d", match.group(0))
+            if len(digits) >= 7 and (has_keyword or (looks_like_phone and not is_money)):
+                assign("phone", match.group(0).strip(), match.start())
+                mask(match)
+
+        # "2 months rent" is a multiple of the rent, not an amount of 2
+        current = "".join(masked)
+        rent_multiples = list(RENT_MULTIPLE_RE.finditer(current))
+        for match in rent_multiples:
+            mask(match)
+
+        current = "".join(masked)
+        for match in AMOUNT_RE.finditer(current):
+            start, end = _sentence_bounds(text, match.start())
+            has_currency = bool(re.match(r"(?i)\s*(?:rs|pkr|usd|\$)", match.group(0)))
+            if not has_currency and DURATION_UNIT_RE.match(current, match.end()):
+                continue  # "12 months" is a lease term
+            # Keywords are read from the masked text so "2 months rent" labels nothing after it
+            keyword = _preceding(AMOUNT_KEYWORDS, current[start:match.start()], match.start() - start)
+            if keyword is None:
+                # "85,000 monthly rent": look a few words ahead
+                after = current[match.end():min(end, match.end() + 30)]
+                keyword = next((slot for pattern, slot in AMOUNT_KEYWORDS if pattern.search(after)), None)
+            if keyword is None and not has_currency and not any(slot in SLOT_KINDS["amount"] for slot in asked):
+                continue
+            if assign("amount", parse_amount(match), match.start(), keyword, use_role=False):
+                mask(match)
+
+        rent = found.get("monthly_rent") or fields.get("monthly_rent")
+        for match in rent_multiples:
+            count = match.group(1)
+            count = int(count) if count.isdigit() else NUMBER_WORDS.get(count.lower(), 0)
+            start, _ = _sentence_bounds(text, match.start())
+            keyword = _preceding(AMOUNT_KEYWORDS, text[start:match.start()], match.start() - start)
+            if rent and count:
+                value = format_amount(count * float(str(rent).replace(",", "")))
+                slot = keyword if keyword in ("security_deposit", "late_fee") else "security_deposit"
+                assign("amount", value, match.start(), slot, use_role=False)
+
+        self._extract_bare_answer("".join(masked), asked, found, fields)
+        self._extract_options(text, found)
+
+        duration = DURATION_RE.search("".join(masked))
+        start_date = found.get("lease_start_date") or fields.get("lease_start_date")
+        if duration and start_date and "lease_end_date" not in found:
+            count, unit = (duration.group(1), duration.group(2)) if duration.group(1) else (duration.group(3), duration.group(4))
+            count = int(count) if count.isdigit() else NUMBER_WORDS.get(count.lower().replace(" ", "-"), 0)
+            months = count * 12 if unit.lower() == "year" else count
+            if months:
+                end = _add_months(date.fromisoformat(start_date), months) - timedelta(days=1)
+                found["lease_end_date"] = end.isoformat()
+        return found
+
+    def _extract_bare_answer(self, remaining: str, asked: List[str], found: Dict[str, Any], fields: Dict[str, Any]):
+        """A reply that is only a name or an address fills the name or address slot the assistant asked for"""
+        value = " ".join(remaining.split()).strip(" ,.;:!")
+        words = re.findall(r"[a-z']+", value.lower())
+        if not value or value.endswith("?") or any(word in BARE_ANSWER_STOPWORDS for word in words):
+            return
+        for kind in ("address", "name"):
+            if any(slot in found for slot in SLOT_KINDS[kind]):
+                continue
+            slot = next((s for s in asked if s in SLOT_KINDS[kind] and not fields.get(s)), None)
+            if slot is None:
+                continue
+            if kind == "address":
+                if len(value) < 5 or len(words) > 15 or not (any(ch.isdigit() for ch in value) or "," in value):
+                    continue
+            else:
+                match = BARE_NAME_RE.fullmatch(value)
+                if not match or any(word in TITLE_STOPWORDS for word in words):
+                    continue
+                value = match.group(1)
+                if value.islower():
+                    value = value.title()
+            if self.validate(slot, value) is None:
+                found[slot] = value
+                return
+
+    def _extract_options(self, text: str, found: Dict[str, Any]):
+        lowered = text.lower()
+        property_options = self.specs.get("property_type", {}).get("options", [])
+        aliases = {"flat": "Apartment", "home": "House", "condominium": "Condo", "town house": "Townhouse"}
+        for option in property_options:
+            aliases[option.lower()] = option
+        for alias, option in sorted(aliases.items(), key=lambda item: -len(item[0])):
+            if re.search(rf"\b{alias}s?\b", lowered):
+                found["property_type"] = option
+                break
+
+        if re.search(r"\butilit|\bincluded\b|\bincludes\b|\bcovers\b|\bpaid by (?:the )?landlord", lowered):
+            options = self.specs.get("utilities_included", {}).get("options", [])
+            utilities = [option for option in options if re.search(rf"\b{option.lower()}\b", lowered)]
+            if utilities:
+                found["utilities_included"] = utilities
+
+        pets = PET_RE.search(text)
+        if pets:
+            found["pet_policy"] = pets.group(1).strip().capitalize()
+
+
+class LeaseSlotStore:
+    """Per-conversation slot state, LRU-bounded with an idle TTL"""
+
+    def __init__(self, max_conversations: int = 10_000, ttl_seconds: float = 24 * 3600):
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self._states: "OrderedDict[str, LeaseSlotState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[LeaseSlotState]:
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                return None
+            if time.time() - state.updated_at > self.ttl_seconds:
+                del self._states[key]
+                return None
+            self._states.move_to_end(key)
+            return state
+
+    def put(self, key: str, state: LeaseSlotState):
+        state.updated_at = time.time()
+        with self._lock:
+            self._states[key] = state
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_conversations:
+                self._states.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+
+class LeaseSlotFiller:
+    """Carries lease fields across chat turns, parsing only messages not seen before"""
+
+    def __init__(self, extractor: LeaseSlotExtractor, store: Optional[LeaseSlotStore] = None, llm=None):
+        self.extractor = extractor
+        self.store = store or LeaseSlotStore()
+        self.llm = llm
+        self.messages_parsed = 0
+        self.llm_fallbacks = 0
+
+    def _llm_extract(self, message: str, missing: List[str]) -> Dict[str, Any]:
+        if self.llm is None or not missing:
+            return {}
+        self.llm_fallbacks += 1
+        prompt = LEASE_SLOT_FALLBACK_PROMPT.format(fields=", ".join(missing), message=message)
+        try:
+            response = self.llm.invoke(prompt).content.strip()
+            response = response.replace("```json", "").replace("```", "").strip()
+            values = json.loads(response)
+        except Exception as e:
+            print(f"Lease slot fallback failed: {e}")
+            return {}
+        if not isinstance(values, dict):
+            return {}
+        return {
+            slot: value for slot, value in values.items()
+            if slot in missing and value not in (None, "", []) and self.extractor.validate(slot, value) is None
+        }
+
+    def _parse(self, state: LeaseSlotState, message: str, missing: List[str], use_llm: bool):
+        self.messages_parsed += 1
+        found = self.extractor.extract(message, state.fields, state.asked)
+        # A partial hit must not stop the fallback from filling a field the assistant asked for
+        unanswered = [slot for slot in state.asked if slot in missing and slot not in found]
+        if use_llm and (not found or unanswered) and re.search(r"\d|@|\b[A-Z][a-z]+\s+[A-Z][a-z]+", message):
+            found.update(self._llm_extract(message, [slot for slot in missing if slot not in found]))
+        state.fields.update(found)
+        return found
+
+    def update(self, key: str, conversation_history, query: str, missing: List[str],
+               tracked: bool = False) -> Tuple[LeaseSlotState, Dict[str, Any]]:
+        """Fold messages not yet seen (normally just the query) into the conversation's slots.
+
+        tracked=True means the caller keeps the conversation itself (a server-side session) and
+        its history may be compacted: stored state is trusted and only the query is parsed.
+        """
+        history = list(conversation_history or [])
+        if history and history[-1].role == "user" and history[-1].content == query:
+            history = history[:-1]  # the client already appended the current query
+        state = self.store.get(key)
+        if state is not None and not tracked and (
+            state.messages_seen > len(history) + 1
+            or (state.messages_seen and state.messages_seen <= len(history)
+                and _digest(history[state.messages_seen - 1].content) != state.last_digest)
+        ):
+            state = None  # history was edited or does not belong to this state
+        if state is None:
+            # First turn, or state lost: rebuild from earlier user messages without the LLM
+            state = LeaseSlotState()
+            for message in history:
+                if message.role == "user":
+                    self._parse(state, message.content, missing, use_llm=False)
+        elif not tracked:
+            for message in history[state.messages_seen:]:
+                if message.role == "user":
+                    self._parse(state, message.content, missing, use_llm=False)
+        found = self._parse(state, query, [slot for slot in missing if not state.fields.get(slot)], use_llm=True)
+        state.messages_seen = len(history) + 1
+        state.last_digest = _digest(query)
+        self.store.put(key, state)
+        return state, found
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "conversations": len(self.store),
+            "messages_parsed": self.messages_parsed,
+            "llm_fallbacks": self.llm_fallbacks,
+        }
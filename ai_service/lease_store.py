@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+
+# --------------------------
+# Lease artifact store
+# --------------------------
+# Generated lease PDFs are stored on disk under a key derived from the
+# normalized lease fields and the clause template version, so a repeated or
+# retried request for the same lease is served from disk instead of being
+# drafted and rendered again. Entries expire after max_age_seconds and the
+# least recently used are evicted once the store grows past max_bytes.
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        return sorted(_normalize(item) for item in value)
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in sorted(value.items())}
+    return value
+
+
+def lease_artifact_key(lease: Dict[str, Any], template_version: str) -> str:
+    fields = {key: _normalize(value) for key, value in lease.items() if value not in (None, "", [])}
+    for key in ("landlord_email", "tenant_email"):
+        if key in fields:
+            fields[key] = fields[key].lower()
+    for key in ("monthly_rent", "security_deposit", "late_fee"):
+        if key in fields:
+            fields[key] = str(fields[key]).replace(",", "")
+    payload = json.dumps({"template_version": template_version, "lease": fields}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def lease_id_for_key(key: str) -> str:
+    """Stable lease ID, so retries of the same lease report the same ID"""
+    return str(uuid.UUID(key[:32]))
+
+
+class LeaseArtifactStore:
+    """Content-addressed PDF files on local disk with age and size based eviction"""
+
+    def __init__(self, root: str, max_bytes: int = 1 << 30, max_age_seconds: float = 30 * 24 * 3600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._scan())
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        directory = os.path.join(self.root, key[:2])
+        return os.path.join(directory, f"{key}.pdf"), os.path.join(directory, f"{key}.json")
+
+    def _scan(self) -> Iterator[Tuple[str, int, float]]:
+        """(key, size, last used) for every stored PDF"""
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".pdf"):
+                    try:
+                        stat = os.stat(os.path.join(directory, name))
+                    except FileNotFoundError:
+                        continue
+                    yield name[:-4], stat.st_size, stat.st_mtime
+
+    def open(self, key: str) -> Optional[Tuple[BinaryIO, Dict[str, Any]]]:
+        """Open a stored PDF for streaming along with its metadata, or None on a miss"""
+        pdf_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if time.time() - meta["created_at"] > self.max_age_seconds:
+                self._remove(key)
+                raise FileNotFoundError(pdf_path)
+            # An open handle keeps streaming even if the file is evicted meanwhile
+            handle = open(pdf_path, "rb")
+        except (FileNotFoundError, KeyError, ValueError):
+            self.misses += 1
+            return None
+        try:
+            os.utime(pdf_path)  # mtime doubles as the LRU timestamp
+        except FileNotFoundError:
+            pass  # evicted since it was opened; the handle still streams
+        self.hits += 1
+        return handle, meta
+
+    def put(self, key: str, data: bytes, meta: Dict[str, Any]) -> Dict[str, Any]:
+        pdf_path, meta_path = self._paths(key)
+        os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+        meta = dict(meta, key=key, size=len(data), created_at=time.time())
+        suffix = f".{uuid.uuid4().hex}.tmp"
+        with open(pdf_path + suffix, "wb") as f:
+            f.write(data)
+        with open(meta_path + suffix, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        with self._lock:
+            previous = os.path.getsize(pdf_path) if os.path.exists(pdf_path) else 0
+            os.replace(pdf_path + suffix, pdf_path)
+            os.replace(meta_path + suffix, meta_path)
+            self._total_bytes += len(data) - previous
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+        return meta
+
+    def _remove(self, key: str) -> int:
+        pdf_path, meta_path = self._paths(key)
+        size = 0
+        try:
+            size = os.path.getsize(pdf_path)
+            os.remove(pdf_path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.remove(meta_path)
+        except FileNotFoundError:
+            pass
+        return size
+
+    def _evict(self):
+        # Caller holds the lock. Drop the least recently used down to 90% of the budget.
+        target = int(self.max_bytes * 0.9)
+        for key, _, _ in sorted(self._scan(), key=lambda entry: entry[2]):
+            if self._total_bytes <= target:
+                break
+            self._total_bytes -= self._remove(key)
+            self.evictions += 1
+
+    def purge_expired(self) -> int:
+        """Remove entries past max_age_seconds; open() only expires the ones it reads"""
+        removed = 0
+        cutoff = time.time() - self.max_age_seconds
+        with self._lock:
+            for key, _, _ in list(self._scan()):
+                _, meta_path = self._paths(key)
+                try:
+                    with open(meta_path, "r", encoding="utf-8") as f:
+                        expired = json.load(f)["created_at"] < cutoff
+                except (FileNotFoundError, KeyError, ValueError):
+                    expired = True
+                if expired:
+                    self._total_bytes -= self._remove(key)
+                    removed += 1
+        self.evictions += removed
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def iter_file(handle: BinaryIO, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Stream an open file in chunks and close it afterwards"""
+    try:
+        while True:
+            chunk = handle.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        handle.close()
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+
+# --------------------------
+# Clause-template lease drafting
+# --------------------------
+# Standard clauses are versioned templates filled from LeaseData fields and
+# rendered locally. The LLM is only asked to word the variable parts (special
+# conditions and free-text customisations), and its output is cached by the
+# exact inputs, so identical leases render identically without a second call.
+
+TEMPLATE_VERSION = "2025.1"
+
+# (key, title, body). Bodies are str.format templates over the lease fields
+# plus the derived values added in lease_fields().
+CLAUSE_TEMPLATES: List[tuple] = [
+    ("premises", "PARTIES AND PREMISES",
+     "This Residential Lease Agreement is made between {landlord_name} (\"Landlord\") and {tenant_name} "
+     "(\"Tenant\"). Landlord leases to Tenant the {property_type_phrase} located at {property_address} "
+     "(the \"Premises\"){property_description_phrase}."),
+    ("term", "LEASE TERM",
+     "The lease begins on {lease_start_date} and ends on {lease_end_date}. Tenant shall vacate the Premises "
+     "at the end of the term unless this Agreement is renewed or extended in writing."),
+    ("rent", "RENT PAYMENT",
+     "Tenant shall pay monthly rent of ${monthly_rent}, due in advance on the first day of each month, by "
+     "bank transfer or another method agreed in writing by Landlord. Rent for any partial month shall be prorated."),
+    ("late_fee", "LATE PAYMENT",
+     "If rent is not received within five (5) days of its due date, Tenant shall pay a late fee of ${late_fee}. "
+     "Acceptance of a late payment does not waive Landlord's right to timely payment in future."),
+    ("deposit", "SECURITY DEPOSIT",
+     "On signing, Tenant shall pay a security deposit of ${security_deposit}. Landlord shall return the deposit "
+     "within thirty (30) days after Tenant vacates, less itemised deductions for unpaid rent and for damage "
+     "beyond normal wear and tear."),
+    ("utilities", "UTILITIES",
+     "{utilities_sentence}"),
+    ("maintenance", "MAINTENANCE AND REPAIRS",
+     "{maintenance_responsibility} is responsible for routine maintenance and repairs of the Premises. Tenant "
+     "shall keep the Premises clean, promptly report any damage or needed repairs, and shall not make "
+     "alterations without Landlord's written consent."),
+    ("pets", "PETS",
+     "Pet policy: {pet_policy}."),
+    ("use", "USE AND OCCUPANCY",
+     "The Premises shall be used only as a private residence by Tenant and members of Tenant's household. "
+     "Tenant shall not sublet or assign this Agreement without Landlord's written consent."),
+    ("entry", "LANDLORD ACCESS",
+     "Landlord may enter the Premises at reasonable times, with at least twenty-four (24) hours' notice, to "
+     "inspect, make repairs or show the Premises, except in an emergency."),
+    ("renewal", "RENEWAL AND TERMINATION",
+     "Either party may end this Agreement at the end of the term by giving at least thirty (30) days' written "
+     "notice. If Tenant remains in possession with Landlord's consent after the term ends, the tenancy continues "
+     "month to month on the same terms. Landlord may terminate this Agreement for non-payment of rent or "
+     "material breach in accordance with applicable law."),
+    ("disputes", "DISPUTE RESOLUTION",
+     "The parties shall first attempt to resolve any dispute arising from this Agreement through good-faith "
+     "negotiation and, failing that, mediation, before pursuing other remedies."),
+    ("law", "GOVERNING LAW",
+     "This Agreement is governed by the laws of the jurisdiction in which the Premises are located."),
+    ("entire", "ENTIRE AGREEMENT",
+     "This Agreement is the entire agreement between the parties. Any amendment must be in writing and signed "
+     "by both parties. If any provision is held invalid, the remaining provisions remain in effect."),
+]
+
+SPECIAL_CONDITIONS_PROMPT = """You are drafting one section of a residential lease agreement. Rewrite the landlord's special conditions and customisation notes below as clear, numbered lease clauses in formal legal language. Do not add conditions that are not listed, do not repeat standard clauses (rent, deposit, maintenance, renewal, disputes, governing law), and return only the clause text.
+
+Property: {property_address}
+Special conditions:
+{special_conditions}
+Customisation notes:
+{customizations}"""
+
+
+def _as_list(value) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(",") if part.strip()]
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+def lease_fields(lease: Dict[str, Any]) -> Dict[str, Any]:
+    """LeaseData fields plus the phrases the clause templates need"""
+    fields = {key: ("" if value is None else value) for key, value in lease.items()}
+    property_type = str(fields.get("property_type") or "").strip()
+    description = str(fields.get("property_description") or "").strip()
+    utilities = _as_list(fields.get("utilities_included"))
+    fields["property_type_phrase"] = property_type.lower() if property_type else "residential property"
+    fields["property_description_phrase"] = f", described as: {description}" if description else ""
+    fields["utilities_sentence"] = (
+        f"Landlord shall pay for the following utilities: {', '.join(utilities)}. Tenant shall pay for all "
+        "other utilities and services used at the Premises."
+        if utilities else "Tenant shall pay for all utilities and services used at the Premises."
+    )
+    fields["late_fee"] = fields.get("late_fee") or "50"
+    fields["pet_policy"] = str(fields.get("pet_policy") or "No pets allowed").rstrip(".")
+    fields["maintenance_responsibility"] = fields.get("maintenance_responsibility") or "Landlord"
+    return fields
+
+
+def variable_inputs(lease: Dict[str, Any]) -> Dict[str, Any]:
+    """The inputs the LLM-drafted section depends on; also its cache key material"""
+    return {
+        "property_address": str(lease.get("property_address") or "").strip(),
+        "special_conditions": _as_list(lease.get("special_conditions")),
+        "customizations": str(lease.get("customizations") or "").strip(),
+    }
+
+
+class ClauseVariantCache:
+    """SQLite cache of LLM-drafted clause text keyed by template version and inputs"""
+
+    def __init__(self, path: str, max_entries: int = 10_000):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS clauses (key TEXT PRIMARY KEY, text TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(inputs: Dict[str, Any]) -> str:
+        payload = json.dumps({"version": TEMPLATE_VERSION, **inputs}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM clauses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE clauses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, text: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO clauses (key, text, last_used) VALUES (?, ?, ?)",
+                               (key, text, time.time()))
+            count = self._conn.execute("SELECT COUNT(*) FROM clauses").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM clauses WHERE key IN (SELECT key FROM clauses ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+
+class LeaseClauseEngine:
+    """Renders a lease from clause templates; only variable clauses go to the LLM"""
+
+    def __init__(self, llm, cache: Optional[ClauseVariantCache] = None):
+        self.llm = llm
+        self.cache = cache
+        self.llm_calls = 0
+
+    def _special_prompt(self, inputs: Dict[str, Any]) -> Optional[str]:
+        if not inputs["special_conditions"] and not inputs["customizations"]:
+            return None
+        return SPECIAL_CONDITIONS_PROMPT.format(
+            property_address=inputs["property_address"],
+            special_conditions="\n".join(f"- {c}" for c in inputs["special_conditions"]) or "None",
+            customizations=inputs["customizations"] or "None",
+        )
+
+    def _cached(self, inputs: Dict[str, Any]):
+        key = ClauseVariantCache.key(inputs)
+        return key, (self.cache.get(key) if self.cache else None)
+
+    def _store(self, key: str, text: str):
+        if self.cache:
+            self.cache.put(key, text)
+
+    def draft_special_conditions(self, lease: Dict[str, Any]) -> str:
+        inputs = variable_inputs(lease)
+        prompt = self._special_prompt(inputs)
+        if prompt is None:
+            return ""
+        key, text = self._cached(inputs)
+        if text is None:
+            self.llm_calls += 1
+            text = self.llm.invoke(prompt).content.strip()
+            self._store(key, text)
+        return text
+
+    async def adraft_special_conditions(self, lease: Dict[str, Any]) -> str:
+        inputs = variable_inputs(lease)
+        prompt = self._special_prompt(inputs)
+        if prompt is None:
+            return ""
+        key, text = self._cached(inputs)
+        if text is None:
+            self.llm_calls += 1
+            text = (await self.llm.ainvoke(prompt)).content.strip()
+            self._store(key, text)
+        return text
+
+    def render(self, lease: Dict[str, Any], special_conditions_text: str = "") -> str:
+        """Lease body in the section format the PDF renderer expects"""
+        fields = lease_fields(lease)
+        sections = []
+        for number, (_, title, body) in enumerate(CLAUSE_TEMPLATES, start=1):
+            sections.append(f"SECTION {number}: {title}")
+            sections.append(body.format(**fields))
+        if special_conditions_text:
+            sections.append(f"SECTION {len(CLAUSE_TEMPLATES) + 1}: SPECIAL CONDITIONS")
+            sections.append(special_conditions_text)
+        sections.append(f"Template version {TEMPLATE_VERSION}")
+        return "\n\n".join(sections)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "template_version": TEMPLATE_VERSION,
+            "llm_calls": self.llm_calls,
+            "cache_hits": self.cache.hits if self.cache else 0,
+            "cache_misses": self.cache.misses if self.cache else 0,
+        }
@@ -0,0 +1,301 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from langchain.schema import Document
+
+from ingestion import BulkIngestionPipeline, IngestionReport, chroma_batch_writer
+
+# --------------------------
+# Incremental listing sync
+# --------------------------
+# Listings are stored in Chroma under stable IDs derived from their Mongo _id,
+# so every write is an upsert. A small JSON state file next to the Chroma store
+# remembers the content hash of every synced listing plus an updatedAt
+# high-water mark, so unchanged listings are never re-embedded.
+
+LISTING_SOURCE = "property_listing"
+
+
+def listing_doc_id(listing_id: Any) -> str:
+    """Stable Chroma document ID for a listing"""
+    return f"listing:{listing_id}"
+
+
+def document_fingerprint(doc: Document) -> str:
+    """Hash of everything we write to Chroma for a document"""
+    payload = json.dumps(
+        {"content": doc.page_content, "metadata": doc.metadata},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def iter_listing_batches(collection, query: Optional[dict] = None, projection: Optional[dict] = None,
+                         batch_size: int = 500, after_id: Any = None) -> Iterator[List[dict]]:
+    """Stream listings in _id order, one page at a time.
+
+    Pages are fetched by _id range rather than skip/offset, so memory stays
+    bounded by batch_size and iteration can resume from any after_id.
+    """
+    query = dict(query or {})
+    last_id = after_id
+    while True:
+        page_query = query if last_id is None else {"$and": [query, {"_id": {"$gt": last_id}}]}
+        page = list(collection.find(page_query, projection).sort("_id", 1).limit(batch_size))
+        if not page:
+            return
+        yield page
+        last_id = page[-1]["_id"]
+
+
+class SyncState:
+    """Persisted per-listing content hashes and the updatedAt high-water mark"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.listings: Dict[str, str] = {}
+        self.high_water_mark: Optional[datetime] = None
+        self.resume_token: Optional[dict] = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.listings = data.get("listings", {})
+            if data.get("high_water_mark"):
+                self.high_water_mark = datetime.fromisoformat(data["high_water_mark"])
+            self.resume_token = data.get("resume_token")
+        except Exception as e:
+            print(f"Ignoring unreadable sync state {self.path}: {e}")
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        data = {
+            "listings": self.listings,
+            "high_water_mark": self.high_water_mark.isoformat() if self.high_water_mark else None,
+            "resume_token": self.resume_token,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, default=str)
+        os.replace(tmp_path, self.path)
+
+
+class ListingSyncEngine:
+    """Keeps the Chroma listing vectors in step with the Mongo properties collection"""
+
+    def __init__(self, collection, vector_store, to_document: Callable[[dict], Document], state_path: str,
+                 pipeline: BulkIngestionPipeline, projection: Optional[dict] = None, batch_size: int = 500,
+                 save_interval: float = 10.0):
+        self.collection = collection
+        self.vector_store = vector_store
+        self.to_document = to_document
+        self.state = SyncState(state_path)
+        self.pipeline = pipeline
+        self.projection = projection
+        self.batch_size = batch_size
+        self.save_interval = save_interval
+        self.write_documents = chroma_batch_writer(vector_store)
+        # Listeners for derived indexes and caches: called with written Documents / deleted listing IDs
+        self.on_upserted: List[Callable[[List[Document]], None]] = []
+        self.on_deleted: List[Callable[[List[str]], None]] = []
+        # _lock guards the in-memory state and its file and is only held briefly;
+        # embedding and Chroma I/O run outside it, so per-listing writes never
+        # wait behind a catalogue sync. _sync_lock serializes whole syncs.
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+
+    def _notify(self, listeners, payload):
+        for listener in listeners:
+            try:
+                listener(payload)
+            except Exception as e:
+                print(f"Listing sync listener failed: {e}")
+
+    # ---- writes -------------------------------------------------------
+
+    def upsert_listings(self, listings: Iterable[dict], yield_to_concurrent: bool = False,
+                        **run_kwargs) -> IngestionReport:
+        """Embed and upsert listings whose content changed since the last sync.
+
+        With yield_to_concurrent, listings another writer updated while these
+        were being embedded are skipped, so a catalogue sync reading older
+        Mongo data never overwrites a newer per-listing write.
+        """
+        pending: Dict[str, tuple] = {}  # listing ID -> (hash when read, new hash)
+
+        def changed_documents():
+            for listing in listings:
+                doc = self.to_document(listing)
+                listing_id = doc.metadata["id"]
+                fingerprint = document_fingerprint(doc)
+                previous = self.state.listings.get(listing_id)
+                if previous == fingerprint:
+                    continue
+                pending[listing_id] = (previous, fingerprint)
+                yield listing_doc_id(listing_id), doc
+
+        def write(ids, docs, vectors):
+            nonlocal last_saved
+            with self._lock:
+                keep = []
+                for n, doc in enumerate(docs):
+                    listing_id = doc.metadata["id"]
+                    if not yield_to_concurrent or self.state.listings.get(listing_id) == pending[listing_id][0]:
+                        keep.append(n)
+                    else:
+                        del pending[listing_id]
+                unseen = [docs[n].metadata["id"] for n in keep if docs[n].metadata["id"] not in self.state.listings]
+            if len(keep) < len(docs):
+                ids, docs, vectors = [ids[n] for n in keep], [docs[n] for n in keep], [vectors[n] for n in keep]
+            if not docs:
+                return
+            if unseen:
+                # Clear any vectors written for these listings before stable IDs existed
+                self.vector_store.delete(where={"id": {"$in": unseen}})
+            self.write_documents(ids, docs, vectors)
+            self._notify(self.on_upserted, docs)
+            with self._lock:
+                for doc in docs:
+                    self.state.listings[doc.metadata["id"]] = pending.pop(doc.metadata["id"])[1]
+                # Persist progress periodically so an interrupted sync resumes cheaply
+                if time.time() - last_saved >= self.save_interval:
+                    self.state.save()
+                    last_saved = time.time()
+
+        last_saved = time.time()
+
+        try:
+            return self.pipeline.run(changed_documents(), write, **run_kwargs)
+        finally:
+            with self._lock:
+                self.state.save()
+
+    def delete_listings(self, listing_ids: Iterable[str]) -> int:
+        listing_ids = [str(i) for i in listing_ids]
+        if not listing_ids:
+            return 0
+        # Delete by metadata so vectors written before stable IDs existed go too
+        self.vector_store.delete(where={"id": {"$in": listing_ids}})
+        with self._lock:
+            for listing_id in listing_ids:
+                self.state.listings.pop(listing_id, None)
+            self.state.save()
+        self._notify(self.on_deleted, listing_ids)
+        return len(listing_ids)
+
+    # ---- full / incremental sync -------------------------------------
+
+    def sync(self, full: bool = False, after_id: Any = None, **run_kwargs) -> Dict[str, Any]:
+        """Sync changed listings, remove deleted ones and advance the high-water mark"""
+        started = time.time()
+        with self._sync_lock:
+            if not self.state.listings:
+                # First run (or lost state): drop vectors written without stable IDs
+                self.vector_store.delete(where={"source": LISTING_SOURCE})
+                full = True
+
+            query: Dict[str, Any] = {}
+            if not full and self.state.high_water_mark is not None:
+                query = {"$or": [
+                    {"updatedAt": {"$gte": self.state.high_water_mark}},
+                    {"updatedAt": {"$exists": False}},
+                ]}
+
+            high_water_mark = self.state.high_water_mark
+            scanned = 0
+
+            def changed_listings():
+                nonlocal high_water_mark, scanned
+                for page in iter_listing_batches(self.collection, query, self.projection,
+                                                 self.batch_size, after_id):
+                    for listing in page:
+                        scanned += 1
+                        updated_at = listing.get("updatedAt")
+                        if isinstance(updated_at, datetime) and (high_water_mark is None or updated_at > high_water_mark):
+                            high_water_mark = updated_at
+                        yield listing
+
+            report = self.upsert_listings(changed_listings(), yield_to_concurrent=True, **run_kwargs)
+
+            deleted = 0
+            if not report.cancelled:
+                # Only listings known before reading the live IDs: one created meanwhile is not stale
+                with self._lock:
+                    known = list(self.state.listings)
+                live_ids = {str(row["_id"]) for row in self.collection.find({}, {"_id": 1}).batch_size(self.batch_size * 10)}
+                deleted = self.delete_listings([i for i in known if i not in live_ids])
+
+            # Listings past a failed batch or a cancellation were never written, so the
+            # mark only moves once everything it covers is in Chroma; the next run
+            # rescans from the old mark and skips what was written via the hashes
+            with self._lock:
+                if not report.cancelled and not report.failed_ids:
+                    self.state.high_water_mark = high_water_mark
+                self.state.save()
+
+        return {
+            "scanned": scanned,
+            "upserted": report.documents,
+            "failed": len(report.failed_ids),
+            "deleted": deleted,
+            "cancelled": report.cancelled,
+            "total": len(self.state.listings),
+            "seconds": round(time.time() - started, 3),
+        }
+
+    # ---- change stream -----------------------------------------------
+
+    def follow(self, stop_event: Optional[threading.Event] = None, poll_interval: float = 30.0):
+        """Apply changes as they happen; polls with sync() when change streams are unavailable"""
+        stop_event = stop_event or threading.Event()
+        try:
+            self._follow_change_stream(stop_event)
+        except Exception as e:
+            # Standalone mongod and mongomock do not support change streams
+            print(f"Change stream unavailable ({e}); polling every {poll_interval}s")
+            while not stop_event.is_set():
+                try:
+                    stats = self.sync()
+                    if stats["upserted"] or stats["deleted"]:
+                        print(f"Listing sync: {stats}")
+                except Exception as sync_error:
+                    print(f"Error during listing poll sync: {sync_error}")
+                stop_event.wait(poll_interval)
+
+    def _follow_change_stream(self, stop_event: threading.Event):
+        # Catch up on anything missed while we were not watching
+        self.sync()
+        with self.collection.watch(full_document="updateLookup", resume_after=self.state.resume_token) as stream:
+            print("Following MongoDB change stream for listings")
+            while not stop_event.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is None:
+                    stop_event.wait(1.0)
+                    continue
+                self._apply_change(change)
+                with self._lock:
+                    self.state.resume_token = stream.resume_token
+                    self.state.save()
+
+    def _apply_change(self, change: dict):
+        operation = change.get("operationType")
+        listing_id = str(change.get("documentKey", {}).get("_id", ""))
+        if operation in ("insert", "update", "replace"):
+            listing = change.get("fullDocument")
+            if listing is None:
+                # Listing was deleted before the update could be looked up
+                self.delete_listings([listing_id])
+            else:
+                self.upsert_listings([listing])
+        elif operation == "delete":
+            self.delete_listings([listing_id])
@@ -0,0 +1,451 @@
+import os
+import json
+import asyncio
+import time
+import uuid
+import random
+import bisect
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# --------------------------
+# Metrics and tracing
+# --------------------------
+# Per-stage latency histograms and LLM/embedding token counters, rendered in
+# the Prometheus text format for /metrics, plus optional per-request traces:
+# every stage run inside a request becomes a span, and finished traces are
+# appended as JSON lines to a local file. The exposition format is written
+# here directly so the service needs no metrics client library.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labelnames), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List[float]] = {}  # per-bucket counts (+Inf last), then sum
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(str(labels.get(name, "")) for name in self.labelnames))
+        return int(sum(series[:-1])) if series else 0
+
+    def totals(self) -> Dict[LabelValues, Tuple[int, float]]:
+        """(count, sum) per label set"""
+        with self._lock:
+            return {key: (int(sum(series[:-1])), series[-1]) for key, series in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, ('le', _number(bound)))} "
+                                 f"{_number(cumulative)}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-1])}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {_number(cumulative)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Counters, histograms and stats callbacks rendered together for a scrape"""
+
+    def __init__(self, namespace: str = ""):
+        self.namespace = namespace
+        self._metrics: List[Any] = []
+        self._stats: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+
+    def _name(self, name: str) -> str:
+        return f"{self.namespace}_{name}" if self.namespace else name
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(self._name(name), documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(self._name(name), documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, prefix: str, stats: Callable[[], Dict[str, Any]]):
+        """Expose the numeric values of an existing stats() dict as gauges, read at scrape time"""
+        self._stats.append((prefix, stats))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for prefix, stats in self._stats:
+            try:
+                values = stats() or {}
+            except Exception as e:
+                print(f"Skipping {prefix} stats in metrics: {e}")
+                continue
+            for key, value in values.items():
+                # Nested dicts and strings are left to the JSON stats endpoints
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = self._name(f"{prefix}_{key}")
+                lines += [f"# TYPE {name} gauge", f"{name} {_number(value)}"]
+        return "\n".join(lines) + "\n"
+
+
+class TraceSink:
+    """Finished traces appended as JSON lines to a local file, rotated once past max_bytes"""
+
+    def __init__(self, path: str, sample_rate: float = 1.0, max_bytes: int = 50 * 1024 * 1024):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.written = 0
+        self.failures = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def write(self, trace: Dict[str, Any]):
+        line = json.dumps(trace, default=str) + "\n"
+        with self._lock:
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+                self.written += 1
+            except OSError as e:
+                self.failures += 1
+                print(f"Could not write trace to {self.path}: {e}")
+
+
+class Trace:
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = attributes
+        self.started = time.time()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add_span(self, span: Dict[str, Any]):
+        with self._lock:
+            self.spans.append(span)
+
+    def as_dict(self, status: str) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "status": status,
+            "start": self.started,
+            "duration_ms": round((time.time() - self.started) * 1000, 3),
+            "attributes": self.attributes,
+            "spans": sorted(self.spans, key=lambda span: span["start"]),
+        }
+
+
+# The request being traced and the innermost open span; both follow the
+# request into awaited coroutines and asyncio.to_thread/run_in_threadpool calls
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+_current_span: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_span", default=None)
+_current_stage: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_stage", default=None)
+
+
+class PipelineMetrics:
+    """Stage timings, token counts and request traces for the RAG pipeline"""
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None, sink: Optional[TraceSink] = None):
+        self.registry = registry or MetricsRegistry("rag")
+        self.sink = sink
+        self.stage_seconds = self.registry.histogram(
+            "stage_duration_seconds", "Time spent in each pipeline stage", ("stage", "outcome"))
+        self.tokens = self.registry.counter(
+            "tokens_total", "Tokens sent to (prompt) and received from (completion) the models", ("stage", "kind"))
+        self.request_seconds = self.registry.histogram(
+            "http_request_duration_seconds", "HTTP request latency", ("method", "path", "status"))
+
+    @contextmanager
+    def stage(self, name: str, **attributes) -> Iterator[Dict[str, Any]]:
+        """Time a stage; yields a dict the caller may add span attributes to"""
+        if _current_stage.get() == name:
+            # Re-entered (an async wrapper around its sync counterpart): the outer run is timed
+            yield attributes
+            return
+        span_id = uuid.uuid4().hex[:16]
+        parent = _current_span.get()
+        token = _current_span.set(span_id)
+        stage_token = _current_stage.set(name)
+        started_at, started = time.time(), time.perf_counter()
+        outcome = "ok"
+        try:
+            yield attributes
+        except (GeneratorExit, asyncio.CancelledError):
+            outcome = "cancelled"  # e.g. the client disconnected mid-stream
+            raise
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            try:
+                _current_span.reset(token)
+                _current_stage.reset(stage_token)
+            except ValueError:
+                pass  # closed from another context, as when an abandoned stream is finalized
+            self.stage_seconds.observe(seconds, stage=name, outcome=outcome)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.add_span({"span_id": span_id, "parent_id": parent, "stage": name, "outcome": outcome,
+                                "start": started_at, "duration_ms": round(seconds * 1000, 3),
+                                "attributes": attributes})
+
+    def timed(self, name: str):
+        """Decorator form of stage() for plain and async functions"""
+        def decorator(fn):
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with self.stage(name):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def current_stage(self) -> str:
+        return _current_stage.get() or "unattributed"
+
+    def record_tokens(self, stage: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+        if prompt_tokens:
+            self.tokens.inc(prompt_tokens, stage=stage, kind="prompt")
+        if completion_tokens:
+            self.tokens.inc(completion_tokens, stage=stage, kind="completion")
+
+    def start_trace(self, name: str, **attributes) -> Optional[contextvars.Token]:
+        """Begin tracing the current request when a sink is configured and the request is sampled"""
+        if self.sink is None or not self.sink.sampled():
+            return None
+        return _current_trace.set(Trace(name, attributes))
+
+    def current_trace_id(self) -> Optional[str]:
+        trace = _current_trace.get()
+        return trace.trace_id if trace else None
+
+    def finish_trace(self, token: Optional[contextvars.Token], status: str = "ok", **attributes):
+        if token is None:
+            return
+        trace = _current_trace.get()
+        _current_trace.reset(token)
+        if trace is not None:
+            trace.attributes.update(attributes)
+            self.sink.write(trace.as_dict(status))
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        """Calls and mean milliseconds per stage, all outcomes together"""
+        totals: Dict[str, List[float]] = {}
+        for (stage, _), (count, seconds) in self.stage_seconds.totals().items():
+            entry = totals.setdefault(stage, [0, 0.0])
+            entry[0] += count
+            entry[1] += seconds
+        return {stage: {"calls": int(count), "mean_ms": round(seconds / count * 1000, 3) if count else 0.0}
+                for stage, (count, seconds) in sorted(totals.items())}
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+class InstrumentedChatModel:
+    """Chat model wrapper timing each call and counting its tokens under the stage that made it"""
+
+    def __init__(self, underlying, metrics: PipelineMetrics, count_tokens: Callable[[str], int]):
+        self.underlying = underlying
+        self.metrics = metrics
+        self.count_tokens = count_tokens
+
+    def __getattr__(self, attr: str):
+        return getattr(self.underlying, attr)
+
+    def _record(self, stage: str, prompt, content: str, usage: Optional[Dict[str, Any]] = None):
+        usage = usage or {}
+        self.metrics.record_tokens(
+            stage,
+            prompt_tokens=usage.get("input_tokens") or self.count_tokens(str(prompt)),
+            completion_tokens=usage.get("output_tokens") or self.count_tokens(content),
+        )
+
+    def invoke(self, prompt, *args, **kwargs):
+        stage = self.metrics.current_stage()
+        with self.metrics.stage("llm", caller=stage):
+            response = self.underlying.invoke(prompt, *args, **kwargs)
+        self._record(stage, prompt, response.content, getattr(response, "usage_metadata", None))
+        return response
+
+    async def ainvoke(self, prompt, *args, **kwargs):
+        stage = self.metrics.current_stage()
+        with self.metrics.stage("llm", caller=stage):
+            response = await self.underlying.ainvoke(prompt, *args, **kwargs)
+        self._record(stage, prompt, response.content, getattr(response, "usage_metadata", None))
+        return response
+
+    async def astream(self, prompt, *args, **kwargs):
+        stage = self.metrics.current_stage()
+        parts = []
+        stream = self.underlying.astream(prompt, *args, **kwargs)
+        try:
+            with self.metrics.stage("llm", caller=stage, streamed=True):
+                async for chunk in stream:
+                    parts.append(chunk.content or "")
+                    yield chunk
+        finally:
+            await stream.aclose()
+            # Counted from the text: streamed chunks carry no usage unless stream_usage is enabled
+            self._record(stage, prompt, "".join(parts))
+
+
+class InstrumentedEmbeddings:
+    """Embeddings client wrapper timing each call to the provider and counting the tokens sent"""
+
+    def __init__(self, underlying, metrics: PipelineMetrics, count_tokens: Callable[[str], int],
+                 stage: str = "embedding"):
+        self.underlying = underlying
+        self.metrics = metrics
+        self.count_tokens = count_tokens
+        self.stage = stage
+        self.model = getattr(underlying, "model", underlying.__class__.__name__)
+
+    def _record(self, texts: List[str]):
+        self.metrics.record_tokens(self.stage, prompt_tokens=sum(self.count_tokens(text) for text in texts))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self.metrics.stage(self.stage, texts=len(texts)):
+            vectors = self.underlying.embed_documents(texts)
+        self._record(texts)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        with self.metrics.stage(self.stage, texts=1):
+            vector = self.underlying.embed_query(text)
+        self._record([text])
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self.metrics.stage(self.stage, texts=len(texts)):
+            vectors = await self.underlying.aembed_documents(texts)
+        self._record(texts)
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        with self.metrics.stage(self.stage, texts=1):
+            vector = await self.underlying.aembed_query(text)
+        self._record([text])
+        return vector
+
+
+class MetricsMiddleware:
+    """ASGI middleware: request latency by route template, one trace per request, X-Trace-Id header.
+
+    Latency runs until the last body chunk is sent, so streamed responses are measured in full.
+    """
+
+    def __init__(self, app, metrics: PipelineMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = self.metrics.start_trace(f"{scope['method']} {scope['path']}", method=scope["method"],
+                                         path=scope["path"])
+        trace_id = self.metrics.current_trace_id()
+        status = {"code": 500}
+        started = time.perf_counter()
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if trace_id:
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-trace-id", trace_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            # The route template rather than the raw path keeps IDs out of the label values
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.metrics.request_seconds.observe(time.perf_counter() - started, method=scope["method"],
+                                                 path=route, status=status["code"])
+            self.metrics.finish_trace(token, status="error" if status["code"] >= 500 else "ok",
+                                      route=route, status_code=status["code"])
@@ -0,0 +1,185 @@
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+from langchain.schema import Document
+
+# --------------------------
+# Multi-query retrieval
+# --------------------------
+# Replacement for LangChain's MultiQueryRetriever on the market_trends and
+# legal_faq routes. The original query is searched while the LLM writes the
+# variants, the variant searches then run concurrently, and all result lists
+# are merged with reciprocal rank fusion (RRF) and de-duplicated by content.
+
+RRF_K = 60
+
+EXPANSION_PROMPT = """You are an AI language model assistant. Your task is to generate {n} different versions of the given user question to retrieve relevant documents from a vector database. By generating multiple perspectives on the user question, your goal is to help the user overcome some of the limitations of distance-based similarity search. Provide these alternative questions separated by newlines, without numbering.
+Original question: {query}"""
+
+SearchFn = Callable[..., List[Document]]  # search(query, **search_kwargs)
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def content_hash(doc: Document) -> str:
+    return hashlib.sha256(" ".join(doc.page_content.split()).encode("utf-8")).hexdigest()
+
+
+def parse_variants(text: str, limit: int) -> List[str]:
+    variants = []
+    for line in text.splitlines():
+        line = line.strip().lstrip("-*0123456789.) ").strip()
+        if line and line not in variants:
+            variants.append(line)
+    return variants[:limit]
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[List[Document]], k: int = RRF_K,
+                           weights: Optional[Sequence[float]] = None) -> List[Document]:
+    """Merge ranked lists, scoring each distinct chunk by sum(weight / (k + rank))"""
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for index, results in enumerate(result_lists):
+        weight = weights[index] if weights else 1.0
+        for rank, doc in enumerate(results, start=1):
+            key = content_hash(doc)
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class ExpansionCache:
+    """LRU + TTL cache of query variants keyed by normalized query"""
+
+    def __init__(self, max_entries: int = 2000, ttl_seconds: float = 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(entry[1])
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, variants: List[str]):
+        with self._lock:
+            self._entries[key] = (time.time(), list(variants))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class MultiQueryEngine:
+    """LLM query expansion with concurrent searches and RRF merging"""
+
+    def __init__(self, llm, search: SearchFn, embeddings=None, num_variants: int = 3,
+                 max_workers: int = 8, cache: Optional[ExpansionCache] = None):
+        self.llm = llm
+        self.search = search
+        # When set, all variants are embedded in one batch call before the fan-out
+        # so the individual searches hit the embedding cache
+        self.embeddings = embeddings
+        self.num_variants = num_variants
+        self.cache = cache or ExpansionCache()
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Created on first search, so constructing the engine starts nothing"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="multi-query")
+            return self._executor
+
+    def _prompt(self, query: str) -> str:
+        return EXPANSION_PROMPT.format(n=self.num_variants, query=query)
+
+    def expand(self, query: str) -> List[str]:
+        key = normalize_query(query)
+        variants = self.cache.get(key)
+        if variants is None:
+            variants = parse_variants(self.llm.invoke(self._prompt(query)).content, self.num_variants)
+            self.cache.put(key, variants)
+        return variants
+
+    async def aexpand(self, query: str) -> List[str]:
+        key = normalize_query(query)
+        variants = self.cache.get(key)
+        if variants is None:
+            variants = parse_variants((await self.llm.ainvoke(self._prompt(query))).content, self.num_variants)
+            self.cache.put(key, variants)
+        return variants
+
+    def _warm_embeddings(self, variants: List[str]):
+        if self.embeddings is not None and variants:
+            try:
+                self.embeddings.embed_documents(variants)
+            except Exception as e:
+                print(f"Variant embedding prefetch failed: {e}")
+
+    def _safe_search(self, query: str, search_kwargs: dict) -> List[Document]:
+        try:
+            return self.search(query, **search_kwargs)
+        except Exception as e:
+            print(f"Search failed for query variant '{query[:60]}': {e}")
+            return []
+
+    def retrieve(self, query: str, limit: Optional[int] = None, **search_kwargs) -> List[Document]:
+        # The original query does not depend on the expansion, so search it right away
+        executor = self._get_executor()
+        original = executor.submit(self._safe_search, query, search_kwargs)
+        try:
+            variants = [v for v in self.expand(query) if normalize_query(v) != normalize_query(query)]
+        except Exception as e:
+            print(f"Query expansion failed, using the original query only: {e}")
+            variants = []
+        self._warm_embeddings(variants)
+        futures = [original] + [executor.submit(self._safe_search, v, search_kwargs) for v in variants]
+        merged = reciprocal_rank_fusion([future.result() for future in futures])
+        return merged[:limit] if limit else merged
+
+    async def aretrieve(self, query: str, limit: Optional[int] = None, **search_kwargs) -> List[Document]:
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        original = loop.run_in_executor(executor, self._safe_search, query, search_kwargs)
+        try:
+            variants = [v for v in await self.aexpand(query) if normalize_query(v) != normalize_query(query)]
+        except Exception as e:
+            print(f"Query expansion failed, using the original query only: {e}")
+            variants = []
+        if self.embeddings is not None and variants and hasattr(self.embeddings, "aembed_documents"):
+            try:
+                await self.embeddings.aembed_documents(variants)
+            except Exception as e:
+                print(f"Variant embedding prefetch failed: {e}")
+        searches = [loop.run_in_executor(executor, self._safe_search, v, search_kwargs) for v in variants]
+        results = await asyncio.gather(original, *searches)
+        merged = reciprocal_rank_fusion(results)
+        return merged[:limit] if limit else merged
+
+    def stats(self) -> Dict[str, float]:
+        total = self.cache.hits + self.cache.misses
+        return {
+            "expansion_cache_entries": len(self.cache._entries),
+            "expansion_cache_hits": self.cache.hits,
+            "expansion_cache_misses": self.cache.misses,
+            "expansion_cache_hit_rate": round(self.cache.hits / total, 4) if total else 0.0,
+        }
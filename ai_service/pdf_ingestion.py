@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain.schema import Document
+from langchain_community.document_loaders import PyMuPDFLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from ingestion import BatchWriter, BulkIngestionPipeline, IngestionReport
+
+# --------------------------
+# Incremental PDF ingestion
+# --------------------------
+# Each file is fingerprinted (size, mtime, sha256) and recorded in a manifest
+# together with the chunk IDs it produced. Unchanged files are skipped; changed
+# files are re-split and upserted, and chunks that no longer exist are deleted.
+# Parsing and splitting run in a process pool and feed the embedding pipeline
+# as each file finishes. Chunk IDs are derived from the file path, file hash,
+# page and character offset, so re-ingesting a file is always an upsert and
+# identical copies at different paths never share (or delete) each other's chunks.
+
+_SPLITTERS: Dict[str, RecursiveCharacterTextSplitter] = {}
+
+
+def get_splitter(source_type: str) -> RecursiveCharacterTextSplitter:
+    """One splitter per source type, built once per process"""
+    if source_type not in _SPLITTERS:
+        if source_type == "market_trends":
+            # Split when there is a heading followed by 1-2 blank lines
+            splitter = RecursiveCharacterTextSplitter(
+                chunk_size=2000, chunk_overlap=0, separators=["\n\n"], add_start_index=True
+            )
+        elif source_type == "legal_faq":
+            # Split on numbered Q/A style headings like "9. Lease of State Land?"
+            splitter = RecursiveCharacterTextSplitter(
+                chunk_size=1500, chunk_overlap=0, separators=["\n\n"], add_start_index=True
+            )
+        else:
+            # Default: chunk by character size
+            splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100, add_start_index=True)
+        _SPLITTERS[source_type] = splitter
+    return _SPLITTERS[source_type]
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source_type: str, path: str, file_hash: str, page, start_index) -> str:
+    path_hash = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:12]
+    return f"{source_type}:{path_hash}:{file_hash[:24]}:p{page}:o{start_index}"
+
+
+def split_pdf(path: str, source_type: str, file_hash: str) -> Tuple[List[Tuple[str, str, dict]], float]:
+    """Parse and split one PDF; returns ([(chunk id, text, metadata)], seconds). Runs in a worker process."""
+    started = time.time()
+    raw_docs = PyMuPDFLoader(path).load()
+    chunks = []
+    for doc in get_splitter(source_type).split_documents(raw_docs):
+        doc.metadata["source"] = source_type
+        doc.metadata["file_hash"] = file_hash
+        doc_id = chunk_id(source_type, path, file_hash, doc.metadata.get("page"), doc.metadata.get("start_index"))
+        doc.metadata["chunk_id"] = doc_id
+        chunks.append((doc_id, doc.page_content, doc.metadata))
+    return chunks, time.time() - started
+
+
+class PdfManifest:
+    """Persisted fingerprint and chunk IDs of every ingested PDF, keyed by absolute path"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.files = json.load(f).get("files", {})
+            except Exception as e:
+                print(f"Ignoring unreadable PDF manifest {path}: {e}")
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f)
+        os.replace(tmp_path, self.path)
+
+    def fingerprint(self, path: str) -> dict:
+        """size + mtime + sha256; the hash is reused when size and mtime are unchanged"""
+        stat = os.stat(path)
+        known = self.files.get(os.path.abspath(path))
+        if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+            sha256 = known["sha256"]
+        else:
+            sha256 = file_sha256(path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256}
+
+
+class PdfIngestionEngine:
+    """Fingerprint, parse in parallel, embed and upsert PDFs; skips files that did not change"""
+
+    def __init__(self, manifest: PdfManifest, pipeline: BulkIngestionPipeline,
+                 delete: Callable[[List[str]], None],
+                 legacy_ids: Optional[Callable[[str, str], List[str]]] = None,
+                 max_workers: Optional[int] = None):
+        self.manifest = manifest
+        self.pipeline = pipeline
+        self.delete = delete
+        # Finds chunks a file produced before it was tracked in the manifest
+        self.legacy_ids = legacy_ids
+        self.max_workers = max_workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+
+    def _plan(self, pdf_paths: List[str], source_type: str, force: bool) -> Tuple[Dict[str, dict], List[dict]]:
+        plan, files, seen = {}, [], set()
+        for path in pdf_paths:
+            key = os.path.abspath(path)
+            if key in seen:
+                continue  # "a.pdf" and "/data/a.pdf" are one file
+            seen.add(key)
+            entry = {"path": path, "status": "unchanged", "chunks": 0, "parse_seconds": 0.0,
+                     "seconds": 0.0, "stale_removed": 0}
+            files.append(entry)
+            try:
+                fingerprint = self.manifest.fingerprint(path)
+            except OSError as e:
+                entry.update(status="error", error=str(e))
+                continue
+            known = self.manifest.files.get(key)
+            if known and known["sha256"] == fingerprint["sha256"] and known["source"] == source_type and not force:
+                entry["chunks"] = len(known["chunk_ids"])
+                if known["mtime"] != fingerprint["mtime"]:
+                    known["mtime"] = fingerprint["mtime"]  # touched but identical
+                continue
+            entry["status"] = "changed" if known else "new"
+            plan[key] = {"entry": entry, "fingerprint": fingerprint, "known": known}
+        return plan, files
+
+    def _parsed_chunks(self, plan: Dict[str, dict], source_type: str, chunk_files: Dict[str, str],
+                       started: float) -> Iterator[Tuple[str, Document]]:
+        def emit(key, chunks, parse_seconds):
+            item = plan[key]
+            item["entry"]["parse_seconds"] = round(parse_seconds, 3)
+            item["entry"]["chunks"] = len(chunks)
+            item["chunk_ids"] = [doc_id for doc_id, _, _ in chunks]
+            item["pending"] = len(chunks)
+            if not chunks:
+                item["entry"]["seconds"] = round(time.time() - started, 3)
+            for doc_id, text, metadata in chunks:
+                chunk_files[doc_id] = key
+                yield doc_id, Document(page_content=text, metadata=metadata)
+
+        def fail(key, error):
+            print(f"Failed to parse PDF {plan[key]['entry']['path']}: {error}")
+            plan[key]["entry"].update(status="error", error=str(error))
+
+        if len(plan) <= 1 or self.max_workers <= 1:
+            for key, item in plan.items():
+                try:
+                    chunks, parse_seconds = split_pdf(item["entry"]["path"], source_type, item["fingerprint"]["sha256"])
+                except Exception as e:
+                    fail(key, e)
+                    continue
+                yield from emit(key, chunks, parse_seconds)
+            return
+
+        # spawn, not fork: the API process has live threads (followers, thread pools)
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(self.max_workers, len(plan)), mp_context=context) as pool:
+            futures = {
+                pool.submit(split_pdf, item["entry"]["path"], source_type, item["fingerprint"]["sha256"]): key
+                for key, item in plan.items()
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    try:
+                        chunks, parse_seconds = future.result()
+                    except BrokenProcessPool:
+                        # A crashed worker takes the pool down; finish this file in-process
+                        chunks, parse_seconds = split_pdf(plan[key]["entry"]["path"], source_type,
+                                                          plan[key]["fingerprint"]["sha256"])
+                except Exception as e:
+                    fail(key, e)
+                    continue
+                yield from emit(key, chunks, parse_seconds)
+
+    def ingest(self, pdf_paths: List[str], source_type: str, write: BatchWriter, force: bool = False,
+               should_cancel: Optional[Callable[[], bool]] = None,
+               progress_callback: Optional[Callable[[IngestionReport], None]] = None) -> dict:
+        started = time.time()
+        plan, files = self._plan(pdf_paths, source_type, force)
+
+        # Files ingested before the manifest existed have chunks under other IDs
+        if self.legacy_ids is not None:
+            for key, item in plan.items():
+                if item["known"] is None:
+                    stale = self.legacy_ids(item["entry"]["path"], source_type)
+                    if stale:
+                        self.delete(stale)
+                        item["entry"]["stale_removed"] += len(stale)
+
+        chunk_files: Dict[str, str] = {}
+
+        def tracked_write(ids, docs, vectors):
+            write(ids, docs, vectors)
+            now = time.time()
+            for doc_id in ids:
+                item = plan[chunk_files[doc_id]]
+                item["pending"] -= 1
+                if item["pending"] == 0:
+                    item["entry"]["seconds"] = round(now - started, 3)
+
+        report = self.pipeline.run(self._parsed_chunks(plan, source_type, chunk_files, started), tracked_write,
+                                   should_cancel=should_cancel, progress_callback=progress_callback)
+
+        failed_files = {chunk_files[doc_id] for doc_id in report.failed_ids if doc_id in chunk_files}
+        for key, item in plan.items():
+            entry = item["entry"]
+            if entry["status"] == "error":
+                continue
+            if key in failed_files or item.get("pending", 1) != 0:
+                # Leave the manifest untouched so the next run retries this file
+                entry["status"] = "failed" if key in failed_files else "incomplete"
+                continue
+            if item["known"]:
+                stale = sorted(set(item["known"]["chunk_ids"]) - set(item["chunk_ids"]))
+                if stale:
+                    self.delete(stale)
+                    entry["stale_removed"] += len(stale)
+            self.manifest.files[key] = dict(item["fingerprint"], source=source_type,
+                                            chunk_ids=item["chunk_ids"], ingested_at=time.time())
+        self.manifest.save()
+
+        stats = report.as_dict()
+        stats["files"] = files
+        stats["skipped_files"] = sum(1 for entry in files if entry["status"] == "unchanged")
+        return stats
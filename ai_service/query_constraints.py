@@ -0,0 +1,211 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+# --------------------------
+# Structured query constraints
+# --------------------------
+# Pulls hard constraints (price range, bedrooms, city, ...) out of a property
+# query so retrieval can pre-filter on typed Chroma metadata instead of scoring
+# the whole catalogue. Values mirror the backend Property model enums.
+
+PROPERTY_TYPES = {
+    "Apartment": r"apartments?|flats?|studios?",
+    "House": r"houses?|villas?|bungalows?",
+    "Condo": r"condos?|condominiums?",
+    "Commercial": r"commercial|offices?|shops?|retail",
+    "Land": r"land|plots?",
+}
+
+AMENITIES = {
+    "Pool": r"(swimming )?pool",
+    "Gym": r"gym|fitness",
+    "Parking": r"parking|garage",
+    "Elevator": r"elevator|lift",
+    "Balcony": r"balcon(y|ies)",
+    "Garden": r"garden|lawn",
+    "Security": r"security|guarded|gated",
+    "AC": r"ac|air[- ]?condition(ed|ing)?",
+    "Heating": r"heating|heater",
+    "Pet-Friendly": r"pet[- ]friendly|pets? allowed|allows? pets",
+    "Laundry": r"laundry|washer",
+}
+
+NUMBER = r"(\d[\d,]*(?:\.\d+)?)\s*(k|thousand|m|mn|million|lakh|lac|crore|cr)?\b"
+DISTANCE_UNIT = r"(?:km|kms|kilomet(?:er|re)s?|mi|miles?)\b"
+# A number followed by one of these is an age, size, distance or room count, never a price
+NON_PRICE_UNIT = (r"(?:years?|yrs?|months?|weeks?|days?|minutes?|mins?|km|kms|kilomet(?:er|re)s?|mi|miles?"
+                  r"|marlas?|kanals?|acres?|sq\.?\s?(?:ft|feet|m|yds?)|sqft|square|feet|ft|floors?|stor(?:e)?ys?"
+                  r"|bed(?:room)?s?|bath(?:room)?s?|br|bhk|percent)\b|%")
+PRICE = rf"\$?{NUMBER}(?!\s*{NON_PRICE_UNIT})"
+PRICE_CONTEXT = re.compile(r"\$|\b(?:budget|price[ds]?|cost|costs|rent|rental|pkr|rs|rupees?|afford)\b")
+MIN_BARE_PRICE = 1000  # below this a number with no unit or price word is rarely a price
+MULTIPLIERS = {
+    "k": 1e3, "thousand": 1e3,
+    "m": 1e6, "mn": 1e6, "million": 1e6,
+    "lakh": 1e5, "lac": 1e5,
+    "crore": 1e7, "cr": 1e7,
+}
+
+
+def amenity_key(amenity: str) -> str:
+    """Metadata flag name for an amenity, e.g. 'Pet-Friendly' -> 'amenity_pet_friendly'"""
+    return "amenity_" + re.sub(r"[^a-z0-9]+", "_", amenity.lower()).strip("_")
+
+
+def _to_number(digits: str, unit: Optional[str]) -> float:
+    value = float(digits.replace(",", ""))
+    return value * MULTIPLIERS.get((unit or "").lower(), 1)
+
+
+@dataclass
+class QueryConstraints:
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    min_bedrooms: Optional[int] = None
+    max_bedrooms: Optional[int] = None
+    min_bathrooms: Optional[int] = None
+    city: Optional[str] = None
+    category: Optional[str] = None  # "Sale" or "Rent"
+    property_type: Optional[str] = None
+    amenities: List[str] = field(default_factory=list)
+    furnished: Optional[bool] = None
+    near_place: Optional[str] = None  # resolved to coordinates by the geo index
+    radius_km: Optional[float] = None
+
+    def is_empty(self) -> bool:
+        return self.to_conditions(include_soft=True) == []
+
+    def to_conditions(self, include_soft: bool = True, include_city: bool = True) -> List[Dict[str, Any]]:
+        conditions: List[Dict[str, Any]] = []
+        if self.min_price is not None:
+            conditions.append({"price": {"$gte": self.min_price}})
+        if self.max_price is not None:
+            conditions.append({"price": {"$lte": self.max_price}})
+        if self.min_bedrooms is not None:
+            conditions.append({"bedrooms": {"$gte": self.min_bedrooms}})
+        if self.max_bedrooms is not None:
+            conditions.append({"bedrooms": {"$lte": self.max_bedrooms}})
+        if self.min_bathrooms is not None:
+            conditions.append({"bathrooms": {"$gte": self.min_bathrooms}})
+        if self.city and include_city:
+            conditions.append({"city": {"$eq": self.city}})
+        if self.category:
+            conditions.append({"category": {"$eq": self.category}})
+        if self.property_type:
+            conditions.append({"property_type": {"$eq": self.property_type}})
+        # Amenities and furnishing are often nice-to-haves; callers may relax them
+        if include_soft:
+            for amenity in self.amenities:
+                conditions.append({amenity_key(amenity): {"$eq": True}})
+            if self.furnished is not None:
+                conditions.append({"furnished": {"$eq": self.furnished}})
+        return conditions
+
+    def to_where(self, source: str = "property_listing", include_soft: bool = True,
+                 include_city: bool = True, extra: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Chroma `where` filter for these constraints, scoped to a source"""
+        conditions = [{"source": {"$eq": source}}] + self.to_conditions(include_soft, include_city) + (extra or [])
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def _is_price(text: str, value: float, *units: Optional[str]) -> bool:
+    """A bare number only counts as a price with a money unit, price wording or a plausible size"""
+    return any(units) or bool(PRICE_CONTEXT.search(text)) or value >= MIN_BARE_PRICE
+
+
+def _extract_price(text: str, constraints: QueryConstraints):
+    between = re.search(rf"\b(?:between|from)\s+\$?{NUMBER}\s*(?:and|to|-)\s*{PRICE}", text)
+    if between:
+        low = _to_number(between.group(1), between.group(2))
+        high = _to_number(between.group(3), between.group(4) or between.group(2))
+        if _is_price(text, high, between.group(2), between.group(4)):
+            constraints.min_price, constraints.max_price = min(low, high), max(low, high)
+            return
+
+    upper = re.search(rf"\b(?:under|below|less than|up ?to|max(?:imum)?|within|budget(?: of| is)?|cheaper than)\s+{PRICE}", text)
+    if upper:
+        value = _to_number(upper.group(1), upper.group(2))
+        if _is_price(text, value, upper.group(2)):
+            constraints.max_price = value
+
+    lower = re.search(rf"\b(?:over|above|more than|at least|min(?:imum)?|starting at)\s+{PRICE}", text)
+    if lower:
+        value = _to_number(lower.group(1), lower.group(2))
+        if _is_price(text, value, lower.group(2)):
+            constraints.min_price = value
+
+
+def _extract_rooms(text: str, constraints: QueryConstraints):
+    bedrooms = re.search(r"\b(at least |min(?:imum)? )?(\d+)\s*(\+|or more)?\s*[- ]?(?:bed(?:room)?s?|br|bhk)\b", text)
+    if bedrooms:
+        count = int(bedrooms.group(2))
+        constraints.min_bedrooms = count
+        if not (bedrooms.group(1) or bedrooms.group(3)):
+            constraints.max_bedrooms = count
+
+    bathrooms = re.search(r"\b(\d+)\s*\+?\s*[- ]?(?:bath(?:room)?s?|ba)\b", text)
+    if bathrooms:
+        constraints.min_bathrooms = int(bathrooms.group(1))
+
+
+def _extract_city(query: str, known_cities: Iterable[str]) -> Optional[str]:
+    lowered = query.lower()
+    known_cities = [c for c in known_cities if c]
+    # Only filter on cities we actually have listings in, longest name first
+    for city in sorted(known_cities, key=len, reverse=True):
+        if re.search(rf"\b{re.escape(city.lower())}\b", lowered):
+            return city.lower()
+    if known_cities:
+        return None
+    match = re.search(r"\b(?:in|at|around)\s+([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)?)", query)
+    return match.group(1).lower() if match else None
+
+
+def _extract_location(text: str, constraints: QueryConstraints) -> str:
+    """Sets near_place/radius_km; returns text with the matched phrase blanked out"""
+    place = (r"([a-z][a-z0-9 .'-]*?)(?=\s+(?:with|under|below|for|that|which|and|having|priced)\b"
+             r"|\s+\d+\s*\+?\s*[- ]?(?:bed|bath|br\b|bhk)|[,.?!]|$)")
+    within = re.search(rf"\bwithin\s+(\d+(?:\.\d+)?)\s*({DISTANCE_UNIT})\s+(?:of|from)\s+(?:the\s+)?{place}", text)
+    if within:
+        radius = float(within.group(1))
+        constraints.radius_km = radius * 1.609 if within.group(2).startswith("mi") else radius
+        constraints.near_place = within.group(3).strip()
+        match = within
+    else:
+        match = re.search(rf"\b(?:near|nearby|close to|around|next to)\s+(?:the\s+)?{place}", text)
+        if not match:
+            return text
+        constraints.near_place = match.group(1).strip()
+    # Keep "within 5 km" and place names like "phase 5" out of price and room parsing
+    return text[:match.start()] + " " + text[match.end():]
+
+
+def extract_constraints(query: str, known_cities: Iterable[str] = ()) -> QueryConstraints:
+    """Parse price, rooms, location, category, type, amenities and furnishing from a query"""
+    text = query.lower()
+    constraints = QueryConstraints()
+
+    remaining = _extract_location(text, constraints)
+    _extract_price(remaining, constraints)
+    _extract_rooms(remaining, constraints)
+    constraints.city = _extract_city(query, known_cities)
+
+    if re.search(r"\b(for rent|to rent|rental|renting|lease|per month|monthly)\b", text):
+        constraints.category = "Rent"
+    elif re.search(r"\b(for sale|to buy|buy|buying|purchase)\b", text):
+        constraints.category = "Sale"
+
+    for property_type, pattern in PROPERTY_TYPES.items():
+        if re.search(rf"\b(?:{pattern})\b", text):
+            constraints.property_type = property_type
+            break
+
+    constraints.amenities = [name for name, pattern in AMENITIES.items() if re.search(rf"\b(?:{pattern})\b", text)]
+
+    if re.search(r"\b(unfurnished|not furnished)\b", text):
+        constraints.furnished = False
+    elif re.search(r"\b(fully |semi[- ])?furnished\b", text):
+        constraints.furnished = True
+
+    return constraints
@@ -0,0 +1,200 @@
+import re
+import math
+import asyncio
+import threading
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# --------------------------
+# Query routing
+# --------------------------
+# A /rag_query is classified exactly once and the resulting QueryRoute is
+# shared by retrieval and augmentation. Classification runs in tiers, cheapest
+# first: keyword rules, then (optionally) embedding centroids, and only then
+# the LLM classifier.
+
+CATEGORIES = ["property_recommendation", "market_trends", "legal_faq", "lease_generation", "none"]
+
+# (pattern, weight) pairs per category. Weights are tuned so that a single
+# strong signal (e.g. "lease agreement") is enough on its own, while weak
+# signals (e.g. "house") need support from other terms.
+KEYWORD_RULES: Dict[str, List[tuple]] = {
+    "lease_generation": [
+        (r"\b(generate|create|draft|make|prepare|write|download)\b.*\b(lease|rental agreement|tenancy agreement)\b", 3),
+        (r"\blease (agreement|contract|document|pdf)\b", 2),
+        (r"\b(landlord|tenant)('s)? (name|email|phone)\b", 2),
+    ],
+    "legal_faq": [
+        (r"\b(law|laws|legal|legally|regulations?|statute|ordinance|act of)\b", 2),
+        (r"\b(tax|taxes|stamp duty|capital gains|withholding|registration fee|mutation|fard|inheritance)\b", 2),
+        (r"\b(ownership rules?|title deed|transfer of (title|property)|eviction|rights of)\b", 2),
+        (r"\b(allowed|permitted|requirements?)\b", 1),
+    ],
+    "market_trends": [
+        (r"\b(market|trends?|forecast|outlook|appreciation|depreciation)\b", 2),
+        (r"\b(invest|investment|investing|roi|rental yield|returns?)\b", 2),
+        (r"\b(demand|supply|price index|growth rate|prices? (rising|falling|going))\b", 2),
+        (r"\b(quarter|q[1-4]|year[- ]over[- ]year|yoy)\b", 1),
+    ],
+    "property_recommendation": [
+        (r"\b\d+\s*(bed(room)?s?|bhk|br|bath(room)?s?)\b", 3),
+        (r"\b(looking for|show me|find me|recommend|suggest|any)\b.*\b(apartment|house|condo|flat|property|properties|home|villa|plot)s?\b", 3),
+        (r"\b(for rent|for sale|to rent|to buy|budget|under \d|below \d|less than \d)\b", 2),
+        (r"\b(apartment|house|condo|flat|villa|townhouse|plot|listing)s?\b", 1),
+        (r"\b(pool|gym|balcony|garden|furnished|parking)\b", 1),
+    ],
+    "none": [
+        (r"^\s*(hi|hello|hey|thanks|thank you|ok|okay|bye|good (morning|evening))[\s!.]*$", 3),
+    ],
+}
+
+# Short exemplar queries used to build one embedding centroid per category.
+CENTROID_EXEMPLARS: Dict[str, List[str]] = {
+    "property_recommendation": [
+        "Show me 3 bedroom apartments for rent under 2000",
+        "I am looking for a house to buy with a garden and parking",
+        "Any furnished flats available near the city centre?",
+    ],
+    "market_trends": [
+        "How have property prices changed over the last year?",
+        "Is it a good time to invest in real estate?",
+        "What is the rental yield and demand outlook this quarter?",
+    ],
+    "legal_faq": [
+        "What taxes do I pay when transferring property ownership?",
+        "What are the legal requirements to lease state land?",
+        "Can a foreigner legally own property here?",
+    ],
+    "lease_generation": [
+        "Please draft a lease agreement for my tenant",
+        "Generate a rental contract PDF for my apartment",
+        "I want to create a lease for my property",
+    ],
+}
+
+
+@dataclass
+class QueryRoute:
+    """Result of classifying a query, shared by retrieval and augmentation"""
+    query: str
+    category: str
+    tier: str  # "keyword", "centroid" or "llm"
+    confidence: float = 1.0
+    constraints: Optional[Any] = None  # QueryConstraints for property_recommendation
+
+
+def normalize_category(label: str) -> str:
+    """Map a raw classifier label onto one of CATEGORIES"""
+    cleaned = re.sub(r"[^a-z_ ]", "", (label or "").strip().lower()).replace(" ", "_")
+    for category in CATEGORIES:
+        if category in cleaned:
+            return category
+    return "none"
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class QueryRouter:
+    """Tiered query classifier: keyword rules, embedding centroids, then LLM"""
+
+    def __init__(self, llm_classifier: Callable[[str], str], embeddings=None,
+                 min_keyword_score: int = 2, min_centroid_score: float = 0.3,
+                 min_centroid_margin: float = 0.08,
+                 async_llm_classifier: Optional[Callable[[str], Awaitable[str]]] = None):
+        self.llm_classifier = llm_classifier
+        self.async_llm_classifier = async_llm_classifier
+        self.embeddings = embeddings
+        self.min_keyword_score = min_keyword_score
+        self.min_centroid_score = min_centroid_score
+        self.min_centroid_margin = min_centroid_margin
+        self._rules = {
+            category: [(re.compile(pattern, re.IGNORECASE), weight) for pattern, weight in rules]
+            for category, rules in KEYWORD_RULES.items()
+        }
+        self._centroids: Optional[Dict[str, List[float]]] = None
+        self._centroid_lock = threading.Lock()
+
+    def route(self, query: str) -> QueryRoute:
+        route = self._route_by_keywords(query)
+        if route is None and self.embeddings is not None:
+            route = self._route_by_centroids(query)
+        if route is None:
+            route = QueryRoute(query=query, category=normalize_category(self.llm_classifier(query)), tier="llm")
+        return route
+
+    async def aroute(self, query: str) -> QueryRoute:
+        """Async variant of route(): embedding and LLM calls do not block the event loop"""
+        route = self._route_by_keywords(query)
+        if route is None and self.embeddings is not None:
+            route = await self._aroute_by_centroids(query)
+        if route is None:
+            if self.async_llm_classifier is not None:
+                label = await self.async_llm_classifier(query)
+            else:
+                label = await asyncio.to_thread(self.llm_classifier, query)
+            route = QueryRoute(query=query, category=normalize_category(label), tier="llm")
+        return route
+
+    def keyword_scores(self, query: str) -> Dict[str, int]:
+        return {
+            category: sum(weight for pattern, weight in rules if pattern.search(query))
+            for category, rules in self._rules.items()
+        }
+
+    def _route_by_keywords(self, query: str) -> Optional[QueryRoute]:
+        scores = sorted(self.keyword_scores(query).items(), key=lambda item: item[1], reverse=True)
+        (best, best_score), (_, runner_up) = scores[0], scores[1]
+        # Only accept unambiguous matches: a strong signal that clearly beats the rest
+        if best_score >= self.min_keyword_score and best_score >= 2 * runner_up:
+            confidence = best_score / (best_score + runner_up)
+            return QueryRoute(query=query, category=best, tier="keyword", confidence=confidence)
+        return None
+
+    def warmup(self):
+        """Embed the category exemplars now rather than on the first ambiguous query"""
+        if self.embeddings is not None:
+            self._get_centroids()
+
+    def _get_centroids(self) -> Dict[str, List[float]]:
+        with self._centroid_lock:
+            if self._centroids is None:
+                centroids = {}
+                for category, exemplars in CENTROID_EXEMPLARS.items():
+                    vectors = self.embeddings.embed_documents(exemplars)
+                    centroids[category] = [sum(column) / len(vectors) for column in zip(*vectors)]
+                self._centroids = centroids
+            return self._centroids
+
+    def _route_by_centroids(self, query: str) -> Optional[QueryRoute]:
+        try:
+            query_vector = self.embeddings.embed_query(query)
+            centroids = self._get_centroids()
+        except Exception as e:
+            print(f"Centroid routing unavailable, falling back to LLM: {e}")
+            return None
+        return self._best_centroid(query, query_vector, centroids)
+
+    async def _aroute_by_centroids(self, query: str) -> Optional[QueryRoute]:
+        try:
+            query_vector = await self.embeddings.aembed_query(query)
+            centroids = self._centroids or await asyncio.to_thread(self._get_centroids)
+        except Exception as e:
+            print(f"Centroid routing unavailable, falling back to LLM: {e}")
+            return None
+        return self._best_centroid(query, query_vector, centroids)
+
+    def _best_centroid(self, query: str, query_vector: List[float],
+                       centroids: Dict[str, List[float]]) -> Optional[QueryRoute]:
+        scores = sorted(
+            ((category, _cosine(query_vector, centroid)) for category, centroid in centroids.items()),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        (best, best_score), (_, runner_up) = scores[0], scores[1]
+        if best_score >= self.min_centroid_score and best_score - runner_up >= self.min_centroid_margin:
+            return QueryRoute(query=query, category=best, tier="centroid", confidence=best_score)
+        return None
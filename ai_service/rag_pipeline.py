@@ -1,38 +1,81 @@
 import os
 import io
-from pydoc import doc
+import time
+
+_module_started = time.perf_counter()
+
 from pymongo import MongoClient
+from bson import ObjectId
 from dotenv import load_dotenv
 
-from langchain_openai import ChatOpenAI
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
 from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.retrievers.multi_query import MultiQueryRetriever
-
-# New imports for lease generation
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from datetime import datetime, timedelta
-import uuid
-from typing import Dict, Any, Optional
-import json
 
-from shapely import buffer
+from datetime import date, datetime, timedelta
+import hashlib
+import threading
+from typing import Dict, Any, Callable, List, Optional, AsyncIterator
+from dataclasses import asdict
+import asyncio
+import json
+import re
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:  # motor is optional; async listing loads fall back to pymongo in a thread
+    AsyncIOMotorClient = None
+
+from query_router import QueryRouter, QueryRoute
+from listing_sync import ListingSyncEngine, iter_listing_batches, listing_doc_id
+from write_buffer import ListingWriteBuffer
+from query_constraints import QueryConstraints, extract_constraints, amenity_key
+from geo_index import GeoIndex, valid_coordinates
+from response_cache import SemanticResponseCache
+from embedding_cache import CachedEmbeddings, SQLiteEmbeddingStore
+from ingestion import BulkIngestionPipeline, chroma_batch_writer
+from multi_query import MultiQueryEngine
+from bm25_index import BM25Index, fuse_scores
+from pdf_ingestion import PdfIngestionEngine, PdfManifest, file_sha256, split_pdf
+from job_queue import JobScheduler, SQLiteJobStore
+from lease_rendering import LeaseRenderService, RenderQueueFull, get_lease_styles, render_lease_pdf
+from lease_templates import TEMPLATE_VERSION, ClauseVariantCache, LeaseClauseEngine
+from lease_store import LeaseArtifactStore, lease_artifact_key, lease_id_for_key
+from lease_slots import LeaseSlotExtractor, LeaseSlotFiller, LeaseSlotStore, conversation_key
+from startup import StartupManager
+from session_store import MemorySessionBackend, SQLiteSessionBackend, SessionStore, trim_history
+from context_builder import ContextBuilder
+from metrics import InstrumentedChatModel, InstrumentedEmbeddings, PipelineMetrics, TraceSink
+from tokens import count_tokens
 
 load_dotenv()
 
+CHROMA_PERSIST_DIR = "./chroma_db"
+
+# Heavy clients below are built on first use (or by warmup, section 16)
+startup = StartupManager(check_interval=float(os.getenv("READINESS_CHECK_INTERVAL", "5")))
+
+# Stage latency histograms and token counters for /metrics; request traces are
+# appended to TRACE_SINK_PATH (JSON lines) when it is set
+TRACE_SINK_PATH = os.getenv("TRACE_SINK_PATH")
+pipeline_metrics = PipelineMetrics(
+    sink=TraceSink(TRACE_SINK_PATH, sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "1"))) if TRACE_SINK_PATH else None
+)
+
 # --------------------------
 # 1. MongoDB connection
 # --------------------------
-mongo_client = MongoClient(os.getenv("MONGODB_URI"))
-db = mongo_client["realestate"]
-listings_collection = db["properties"]
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "5000"))
+
+mongo_client = startup.component(
+    "mongo", lambda: MongoClient(os.getenv("MONGODB_URI"), serverSelectionTimeoutMS=MONGO_TIMEOUT_MS)
+)
+listings_collection = startup.component("listings_collection", lambda: mongo_client.resolve()["realestate"]["properties"])
+
+async_mongo_client = startup.component(
+    "async_mongo", lambda: AsyncIOMotorClient(os.getenv("MONGODB_URI"), serverSelectionTimeoutMS=MONGO_TIMEOUT_MS)
+) if AsyncIOMotorClient else None
+async_listings_collection = startup.component(
+    "async_listings_collection", lambda: async_mongo_client.resolve()["realestate"]["properties"]
+) if async_mongo_client else None
 
 # --------------------------
 # 2. Helper functions
@@ -75,81 +118,123 @@ def transform_property_for_embedding(listing: dict) -> str:
 # --------------------------
 # 3. Load listings from MongoDB
 # --------------------------
-def load_new_listings():
-    listings = list(listings_collection.find({}))
-    docs = []
+def _as_number(value, cast=float):
+    try:
+        return cast(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
 
-    for listing in listings:
-        page_content = transform_property_for_embedding(listing)
-        
-        metadata = {
-            "id": str(listing["_id"]),
-            "price": listing.get("price"),
-            "category": listing.get("category"),
-            "status": listing.get("status"),
-            "source": "property_listing"
-        }
-        
-        docs.append(Document(page_content=page_content.strip(), metadata=metadata))
+def listing_metadata(listing: dict) -> dict:
+    """Typed, filterable metadata stored alongside each listing vector"""
+    address = listing.get("address", {}) or {}
+    details = listing.get("details", {}) or {}
+    coordinates = listing.get("coordinates", {}) or {}
+    metadata = {
+        "id": str(listing.get("_id", "")),
+        "price": _as_number(listing.get("price")),
+        "category": listing.get("category"),
+        "status": listing.get("status"),
+        "property_type": listing.get("type"),
+        "city": (address.get("city") or "").strip().lower() or None,
+        "state": (address.get("state") or "").strip().lower() or None,
+        "bedrooms": _as_number(details.get("bedrooms"), int),
+        "bathrooms": _as_number(details.get("bathrooms"), int),
+        "area": _as_number(details.get("area")),
+        "furnished": bool(details.get("furnished", False)),
+        "latitude": _as_number(coordinates.get("latitude")),
+        "longitude": _as_number(coordinates.get("longitude")),
+        "source": "property_listing"
+    }
+    # Chroma metadata is scalar-only, so amenities become boolean flags
+    for amenity in listing.get("amenities", []) or []:
+        metadata[amenity_key(amenity)] = True
+    return metadata
 
-    return docs
+def listing_to_document(listing: dict) -> Document:
+    page_content = transform_property_for_embedding(listing)
+    return Document(page_content=page_content.strip(), metadata=listing_metadata(listing))
+
+# Only the fields listing_to_document reads (plus updatedAt for incremental sync);
+# images, videos and other large fields never leave the database
+LISTING_EMBEDDING_FIELDS = {
+    "title": 1,
+    "description": 1,
+    "type": 1,
+    "price": 1,
+    "amenities": 1,
+    "address": 1,
+    "coordinates": 1,
+    "details": 1,
+    "category": 1,
+    "status": 1,
+    "updatedAt": 1,
+}
+
+LISTING_BATCH_SIZE = int(os.getenv("LISTING_BATCH_SIZE", "500"))
+
+def load_new_listings(batch_size: int = LISTING_BATCH_SIZE, after_id=None):
+    """Yield listing Documents page by page; pass after_id to resume from a known _id"""
+    for page in iter_listing_batches(listings_collection, projection=LISTING_EMBEDDING_FIELDS,
+                                     batch_size=batch_size, after_id=after_id):
+        for listing in page:
+            yield listing_to_document(listing)
 
 # --------------------------
 # 4. Load PDFs for market trends & legal FAQs (with splitting)
 # --------------------------
-def load_pdfs(pdf_paths, source_type):
-    docs = []
+def iter_pdf_documents(pdf_paths, source_type):
+    """Yield split chunks file by file so ingestion can start before every PDF is parsed"""
     for path in pdf_paths:
-        loader = PyMuPDFLoader(path)
-        raw_docs = loader.load()
-
-        # Choose splitting method based on source type
-        if source_type == "market_trends":
-            # Split when there is a heading followed by 1-2 blank lines
-            splitter = RecursiveCharacterTextSplitter(
-    chunk_size=2000,  # large enough to keep full paragraph
-    chunk_overlap=0,
-    separators=["\n\n"]  # split only at double newlines
-)
-
-        elif source_type == "legal_faq":
-            # Split on numbered Q/A style headings like "9. Lease of State Land?"
-            splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1500,  # large enough to keep full paragraph
-    chunk_overlap=0,
-    separators=["\n\n"]  # split only at double newlines
-)
-        else:
-            # Default: chunk by character size
-            splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-
-        split_docs = splitter.split_documents(raw_docs)
-
-        # Add metadata for filtering later
-        for doc in split_docs:
-            doc.metadata["source"] = source_type
+        chunks, _ = split_pdf(path, source_type, file_sha256(path))
+        for _, text, metadata in chunks:
+            yield Document(page_content=text, metadata=metadata)
 
-        docs.extend(split_docs)
+def load_pdfs(pdf_paths, source_type):
+    return list(iter_pdf_documents(pdf_paths, source_type))
 
-    return docs
+def pdf_chunk_id(doc: Document) -> str:
+    """Deterministic ID for a PDF chunk so re-adding the same file is an upsert"""
+    key = f"{doc.metadata.get('file_path', '')}|{doc.metadata.get('page')}|{doc.page_content}"
+    return f"{doc.metadata['source']}:{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}"
 
 # --------------------------
 # 5. Models
 # --------------------------
-embedding_model = OpenAIEmbeddings(
-    model="text-embedding-3-large" 
-)
+EMBEDDING_MODEL_NAME = "text-embedding-3-large"
+
+def chat_model(**kwargs) -> Any:
+    # langchain_openai is slow to import; defer it to first use
+    from langchain_openai import ChatOpenAI
+    return InstrumentedChatModel(ChatOpenAI(model="gpt-4o-mini", **kwargs), pipeline_metrics, count_tokens)
+
+def build_embedding_model(client=None) -> CachedEmbeddings:
+    """Cached, instrumented embeddings over client (OpenAI unless another client is given)"""
+    if client is None:
+        from langchain_openai import OpenAIEmbeddings
+        client = OpenAIEmbeddings(model=EMBEDDING_MODEL_NAME)
+    return CachedEmbeddings(
+        # Only cache misses reach the provider, so only they are timed and counted
+        InstrumentedEmbeddings(client, pipeline_metrics, count_tokens),
+        store=SQLiteEmbeddingStore(
+            os.path.join(CHROMA_PERSIST_DIR, "embedding_cache.sqlite3"),
+            max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+        ),
+        model_name=getattr(client, "model", EMBEDDING_MODEL_NAME)
+    )
 
-model = ChatOpenAI(
-    model="gpt-4o-mini",  
-    temperature=0.7
-)
+# Document and query embeddings are served from an on-disk cache when the text was seen before
+embedding_model = startup.component("embeddings", build_embedding_model)
+
+def get_embedding_cache_stats() -> Dict[str, Any]:
+    return embedding_model.stats()
+
+model = startup.component("chat_model", lambda: chat_model(temperature=0.7))
 
 # --------------------------
 # 6. Query classification (Updated)
 # --------------------------
-def classify_query(query: str) -> str:
-    prompt = f"""
+def build_classification_prompt(query: str) -> str:
+    return f"""
     You are a classifier for a real estate platform.
 
     Categories:
@@ -165,46 +250,236 @@ def classify_query(query: str) -> str:
     Respond with only the category name: property_recommendation, market_trends, legal_faq, lease_generation, or none.
     """
 
-    response = model.invoke(prompt).content.strip().lower()
+def classify_query(query: str) -> str:
+    response = model.invoke(build_classification_prompt(query)).content.strip().lower()
+    return response
+
+async def aclassify_query(query: str) -> str:
+    response = (await model.ainvoke(build_classification_prompt(query))).content.strip().lower()
     return response
 
+query_router = QueryRouter(
+    llm_classifier=classify_query,
+    async_llm_classifier=aclassify_query,
+    embeddings=embedding_model
+)
+
+_known_cities = {"values": [], "loaded_at": 0.0}
+
+def get_known_cities(max_age: float = 600.0) -> list:
+    """Distinct listing cities, refreshed at most every max_age seconds"""
+    if time.time() - _known_cities["loaded_at"] > max_age:
+        try:
+            _known_cities["values"] = [c.lower() for c in listings_collection.distinct("address.city") if c]
+        except Exception as e:
+            print(f"Could not load listing cities: {e}")
+        _known_cities["loaded_at"] = time.time()
+    return _known_cities["values"]
+
+def extract_property_constraints(query: str) -> QueryConstraints:
+    return extract_constraints(query, known_cities=get_known_cities())
+
+def route_query(query: str) -> QueryRoute:
+    """Classify a query once; the returned route is passed through the pipeline"""
+    with pipeline_metrics.stage("classification") as span:
+        route = query_router.route(query)
+        if route.category == "property_recommendation":
+            route.constraints = extract_property_constraints(query)
+        span.update(category=route.category, tier=route.tier)
+    return route
+
 # --------------------------
 # 7. Chroma DB setup
 # --------------------------
-chroma_db = Chroma(
-    collection_name="proptech_rag",
-    embedding_function=embedding_model,
-    persist_directory="./chroma_db"
+def build_chroma_db():
+    from langchain_chroma import Chroma
+    return Chroma(
+        collection_name="proptech_rag",
+        embedding_function=embedding_model.resolve(),
+        persist_directory=CHROMA_PERSIST_DIR
+    )
+
+chroma_db = startup.component("chroma", build_chroma_db)
+
+# Bulk embedding: token-budgeted batches, bounded concurrency, retry with backoff
+ingestion_pipeline = BulkIngestionPipeline(
+    embeddings=embedding_model,
+    max_batch_tokens=int(os.getenv("INGEST_BATCH_TOKENS", "20000")),
+    max_workers=int(os.getenv("INGEST_WORKERS", "4"))
 )
 
+# Listeners are collected here and attached when the engine is built, so
+# importing the module does not read the sync state file
+listing_upserted_listeners: List[Callable[[List[Document]], None]] = []
+listing_deleted_listeners: List[Callable[[List[str]], None]] = []
+
+def build_listing_sync_engine() -> ListingSyncEngine:
+    engine = ListingSyncEngine(
+        collection=listings_collection,
+        vector_store=chroma_db,
+        to_document=listing_to_document,
+        state_path=os.path.join(CHROMA_PERSIST_DIR, "listing_sync_state.json"),
+        pipeline=ingestion_pipeline,
+        projection=LISTING_EMBEDDING_FIELDS,
+        batch_size=LISTING_BATCH_SIZE
+    )
+    engine.on_upserted.extend(listing_upserted_listeners)
+    engine.on_deleted.extend(listing_deleted_listeners)
+    return engine
+
+listing_sync_engine = startup.component("listing_sync_engine", build_listing_sync_engine)
+
+# --------------------------
+# 7b. Spatial index over listing coordinates
+# --------------------------
+geo_index = GeoIndex(precision=5)
+_geo_index_state = {"loaded": False, "lock": threading.Lock()}
+
+def _index_listing_locations(docs):
+    for doc in docs:
+        metadata = doc.metadata
+        if valid_coordinates(metadata.get("latitude"), metadata.get("longitude")):
+            geo_index.upsert(metadata["id"], metadata["latitude"], metadata["longitude"],
+                             places=[metadata.get("city"), metadata.get("state")])
+        else:
+            geo_index.remove(metadata["id"])
+
+def _unindex_listing_locations(listing_ids):
+    for listing_id in listing_ids:
+        geo_index.remove(listing_id)
+
+listing_upserted_listeners.append(_index_listing_locations)
+listing_deleted_listeners.append(_unindex_listing_locations)
+
+def get_geo_index(page_size: int = 5000) -> GeoIndex:
+    """Geo index over all listings, built from Chroma metadata on first use"""
+    with _geo_index_state["lock"]:
+        if not _geo_index_state["loaded"]:
+            offset = 0
+            while True:
+                page = chroma_db.get(where={"source": "property_listing"}, include=["metadatas"],
+                                     limit=page_size, offset=offset)
+                metadatas = page.get("metadatas") or []
+                _index_listing_locations(Document(page_content="", metadata=m) for m in metadatas if m)
+                if len(metadatas) < page_size:
+                    break
+                offset += page_size
+            _geo_index_state["loaded"] = True
+            print(f"Geo index loaded with {len(geo_index)} listings")
+    return geo_index
+
+# --------------------------
+# 7c. Lexical (BM25) index over PDF chunks
+# --------------------------
+PDF_SOURCES = ["market_trends", "legal_faq"]
+
+bm25_index = startup.component("bm25_index", lambda: BM25Index(os.path.join(CHROMA_PERSIST_DIR, "bm25_index.json")))
+_bm25_state = {"loaded": False, "lock": threading.Lock()}
+
+def get_bm25_index(page_size: int = 2000) -> BM25Index:
+    """BM25 index over PDF chunks; rebuilt from Chroma once if no persisted index exists"""
+    with _bm25_state["lock"]:
+        index = bm25_index.resolve()
+        if not _bm25_state["loaded"]:
+            if len(index) == 0:
+                offset = 0
+                while True:
+                    page = chroma_db.get(where={"source": {"$in": PDF_SOURCES}}, include=["documents", "metadatas"],
+                                         limit=page_size, offset=offset)
+                    ids = page.get("ids") or []
+                    docs = [Document(page_content=text or "", metadata=metadata or {})
+                            for text, metadata in zip(page.get("documents") or [], page.get("metadatas") or [])]
+                    index.add_documents(ids, docs)
+                    if len(ids) < page_size:
+                        break
+                    offset += page_size
+                if len(index):
+                    index.save()
+                    print(f"BM25 index rebuilt from Chroma with {len(index)} chunks")
+            _bm25_state["loaded"] = True
+    return index
+
 # --------------------------
 # 8. Add new listings
 # --------------------------
-def sync_new_listings_to_chroma():
-    docs = load_new_listings()
-    if docs:
-        chroma_db.add_documents(docs)
-        print(f"Synced {len(docs)} listings to Chroma")
-    else:
-        print("No listings found to sync.")
+@pipeline_metrics.timed("listing_sync")
+def sync_new_listings_to_chroma(full: bool = False, **run_kwargs) -> Dict[str, Any]:
+    """Incrementally sync Mongo listings: re-embed changed ones, drop deleted ones"""
+    stats = listing_sync_engine.sync(full=full, **run_kwargs)
+    print(f"Synced listings to Chroma: {stats['upserted']} upserted, {stats['failed']} failed, "
+          f"{stats['deleted']} deleted, {stats['scanned']} scanned in {stats['seconds']}s")
+    return stats
+
+# Per-listing writes from the backend are micro-batched: one embedding batch
+# and one Chroma upsert per flush instead of one per request
+@pipeline_metrics.timed("listing_writes")
+def _apply_listing_writes(upserts: Dict[str, dict], deletes) -> Dict[str, Exception]:
+    errors: Dict[str, Exception] = {}
+    if deletes:
+        try:
+            listing_sync_engine.delete_listings(deletes)
+        except Exception as e:
+            errors.update({listing_id: e for listing_id in deletes})
+    if upserts:
+        listings = [dict(listing, _id=listing_id) for listing_id, listing in upserts.items()]
+        report = listing_sync_engine.upsert_listings(listings)
+        failed = set(report.failed_ids)
+        for listing_id in upserts:
+            if listing_doc_id(listing_id) in failed:
+                errors[listing_id] = RuntimeError(f"Failed to embed property {listing_id}")
+    print(f"Applied listing writes: {len(upserts)} upserts, {len(deletes)} deletes, {len(errors)} failed")
+    return errors
+
+listing_write_buffer = ListingWriteBuffer(
+    apply=_apply_listing_writes,
+    max_items=int(os.getenv("LISTING_WRITE_BATCH_SIZE", "64")),
+    max_delay_ms=float(os.getenv("LISTING_WRITE_DELAY_MS", "250"))
+)
 
-def sync_single_listing_to_chroma(listing: dict):
-    page_content = transform_property_for_embedding(listing)
-    metadata = {
-        "id": str(listing.get("_id", "")),
-        "price": listing.get("price"),
-        "category": listing.get("category"),
-        "status": listing.get("status"),
-        "source": "property_listing"
+def queue_listing_upsert(listing: dict):
+    """Buffered sync/update of one listing; returns a Future resolved once it is applied"""
+    return listing_write_buffer.upsert(str(listing["_id"]), listing)
+
+def queue_listing_delete(listing_id: str):
+    return listing_write_buffer.delete(listing_id)
+
+def get_listing_write_buffer_stats() -> Dict[str, Any]:
+    return listing_write_buffer.stats()
+
+@pipeline_metrics.timed("listing_sync")
+def sync_listings_by_id(listing_ids, **run_kwargs) -> Dict[str, Any]:
+    """Re-sync specific listings from Mongo; IDs no longer in Mongo are removed from Chroma"""
+    listing_ids = [str(i) for i in dict.fromkeys(listing_ids)]
+    keys = [ObjectId(i) if ObjectId.is_valid(i) else i for i in listing_ids]
+    listings = list(listings_collection.find({"_id": {"$in": keys}}, LISTING_EMBEDDING_FIELDS))
+    found = {str(listing["_id"]) for listing in listings}
+    report = listing_sync_engine.upsert_listings(listings, **run_kwargs)
+    deleted = listing_sync_engine.delete_listings([i for i in listing_ids if i not in found])
+    return {
+        "requested": len(listing_ids),
+        "upserted": report.documents,
+        "failed": len(report.failed_ids),
+        "deleted": deleted,
+        "seconds": round(report.seconds, 3),
     }
-    doc = Document(page_content=page_content.strip(), metadata=metadata)
-    chroma_db.add_documents([doc])
-    print(f"Synced property {metadata['id']} to ChromaDB")
+
+def follow_listing_changes(stop_event=None, poll_interval: float = 30.0):
+    """Follow the Mongo change stream (or poll) and keep Chroma in sync; blocks until stopped"""
+    listing_sync_engine.follow(stop_event=stop_event, poll_interval=poll_interval)
+
+def sync_single_listing_to_chroma(listing: dict):
+    listing_id = str(listing.get("_id", ""))
+    report = listing_sync_engine.upsert_listings([listing])
+    if report.failed_ids:
+        raise RuntimeError(f"Failed to embed property {listing_id}")
+    if report.documents:
+        print(f"Synced property {listing_id} to ChromaDB")
+    else:
+        print(f"Property {listing_id} unchanged, skipped re-embedding")
 
 def delete_single_listing_from_chroma(listing_id: str):
     try:
-        # Delete by metadata filter
-        chroma_db.delete(where={"id": listing_id})
+        listing_sync_engine.delete_listings([listing_id])
         print(f"Deleted property {listing_id} from ChromaDB")
     except Exception as e:
         print(f"Error deleting property {listing_id} from ChromaDB: {str(e)}")
@@ -212,10 +487,8 @@ def delete_single_listing_from_chroma(listing_id: str):
     
 def update_single_listing_in_chroma(listing_id: str, updated_listing: dict):
     try:
-        # First, delete the existing document
-        delete_single_listing_from_chroma(listing_id)
-        
-        # Then add the updated document
+        # Upsert under the stable listing ID replaces the old vector in place
+        updated_listing["_id"] = listing_id
         sync_single_listing_to_chroma(updated_listing)
         
         print(f"Updated property {listing_id} in ChromaDB")
@@ -226,35 +499,237 @@ def update_single_listing_in_chroma(listing_id: str, updated_listing: dict):
 # --------------------------
 # 9. Add PDFs
 # --------------------------
-def add_pdfs_to_chroma(pdf_paths, source_type):
-    docs = load_pdfs(pdf_paths, source_type)
-    if docs:
-        chroma_db.add_documents(docs)
-        print(f"Added {len(docs)} chunks from {source_type} to Chroma")
-    else:
-        print("No PDF docs found.")
+def delete_pdf_chunks(ids):
+    chroma_db.delete(ids=ids)
+    get_bm25_index().remove(ids)
+    response_cache.invalidate_documents(ids)
+
+def legacy_pdf_chunk_ids(path, source_type):
+    """IDs of chunks added for this file before it was tracked in the PDF manifest"""
+    where = {"$and": [{"source": source_type}, {"file_path": {"$in": [path, os.path.abspath(path)]}}]}
+    return chroma_db.get(where=where, include=[]).get("ids") or []
+
+pdf_ingestion_engine = PdfIngestionEngine(
+    manifest=startup.component("pdf_manifest", lambda: PdfManifest(os.path.join(CHROMA_PERSIST_DIR, "pdf_manifest.json"))),
+    pipeline=ingestion_pipeline,
+    delete=delete_pdf_chunks,
+    legacy_ids=legacy_pdf_chunk_ids,
+    max_workers=int(os.getenv("PDF_PARSE_WORKERS", "0")) or None
+)
+_pdf_ingest_lock = threading.Lock()
+
+@pipeline_metrics.timed("pdf_ingestion")
+def add_pdfs_to_chroma(pdf_paths, source_type, force: bool = False, **run_kwargs) -> Dict[str, Any]:
+    """Ingest new or changed PDFs (unchanged files are skipped unless force=True)"""
+    lexical_index = get_bm25_index()
+    write_vectors = chroma_batch_writer(chroma_db)
+
+    def write(ids, docs, vectors):
+        write_vectors(ids, docs, vectors)
+        lexical_index.add_documents(ids, docs)
+
+    # One run at a time: the manifest is read, diffed and rewritten per run
+    with _pdf_ingest_lock:
+        stats = pdf_ingestion_engine.ingest(pdf_paths, source_type, write, force=force, **run_kwargs)
+    lexical_index.save()
+    if stats["documents"] or any(f["stale_removed"] for f in stats["files"]):
+        # New chunks can change any answer for this source
+        response_cache.invalidate_category(source_type)
+    for f in stats["files"]:
+        print(f"PDF {f['path']}: {f['status']}, {f['chunks']} chunks, "
+              f"parsed in {f['parse_seconds']}s, done at {f['seconds']}s")
+    print(f"Added {stats['documents']} chunks from {source_type} to Chroma "
+          f"({stats['docs_per_second']} chunks/s, {stats['skipped_files']} files unchanged, "
+          f"{stats['failed_documents']} failed)")
+    return stats
+
+# --------------------------
+# 9b. Background ingestion jobs
+# --------------------------
+# A single worker by default, so catalogue-scale ingestion never competes with
+# chat requests for more than one thread and the embedding pipeline's workers
+job_scheduler = JobScheduler(
+    startup.component("job_store", lambda: SQLiteJobStore(os.path.join(CHROMA_PERSIST_DIR, "jobs.sqlite3"))),
+    max_workers=int(os.getenv("JOB_WORKERS", "1"))
+)
+
+def _run_listing_sync_job(params, context):
+    """params has "full" for a catalogue sync, "listing_ids" for specific listings, or both after merging"""
+    run_kwargs = {"should_cancel": context.should_cancel, "progress_callback": context.report_progress}
+    result = {}
+    if "full" in params:
+        result = sync_new_listings_to_chroma(full=params["full"], **run_kwargs)
+    if params.get("listing_ids") and not context.should_cancel():
+        by_id = sync_listings_by_id(params["listing_ids"], **run_kwargs)
+        result = dict(result, by_id=by_id) if result else by_id
+    return result
+
+def _merge_listing_sync_params(queued, new):
+    """A queued sync absorbs later requests: full wins over incremental, listing IDs are unioned.
+
+    An incremental sync only scans past the high-water mark, so listing IDs are
+    kept next to it and re-synced too; a full sync already covers them.
+    """
+    merged = {}
+    if "full" in queued or "full" in new:
+        merged["full"] = queued.get("full", False) or new.get("full", False)
+    listing_ids = list(dict.fromkeys(queued.get("listing_ids", []) + new.get("listing_ids", [])))
+    if listing_ids and not merged.get("full"):
+        merged["listing_ids"] = listing_ids
+    return merged
+
+def _run_pdf_ingest_job(params, context):
+    return add_pdfs_to_chroma(params["pdf_paths"], params["source_type"], force=params.get("force", False),
+                              should_cancel=context.should_cancel, progress_callback=context.report_progress)
+
+job_scheduler.register("sync_listings", _run_listing_sync_job, merge=_merge_listing_sync_params)
+job_scheduler.register("add_pdfs", _run_pdf_ingest_job)
+
+def enqueue_listing_sync(full: bool = False, listing_ids=None):
+    """Queue a listing sync; requests arriving while one is queued are coalesced into it"""
+    params = {"listing_ids": [str(i) for i in listing_ids]} if listing_ids else {"full": full}
+    return job_scheduler.enqueue("sync_listings", params, key="sync_listings")
+
+def enqueue_pdf_ingestion(pdf_paths, source_type, force: bool = False):
+    key = "add_pdfs:" + source_type + ":" + "|".join(sorted(os.path.abspath(p) for p in pdf_paths))
+    params = {"pdf_paths": list(pdf_paths), "source_type": source_type, "force": force}
+    return job_scheduler.enqueue("add_pdfs", params, key=key)
 
 # --------------------------
 # 10. Retrieval
 # --------------------------
-def retrieve_property_recommendations(query, k=10, lambda_mult=0.5):
-    search_kwargs = {
-        "k": k,
-        "lambda_mult": lambda_mult,
-        "filter": {"source": "property_listing"} 
-    }
-    retriever = chroma_db.as_retriever(
-        search_type="mmr",
-        search_kwargs=search_kwargs
-    )
-    return retriever.invoke(query)
+DEFAULT_SEARCH_RADIUS_KM = float(os.getenv("DEFAULT_SEARCH_RADIUS_KM", "10"))
+
+def resolve_search_location(constraints: QueryConstraints, location: Optional[dict] = None) -> Optional[dict]:
+    """Coordinates and radius to search around, from an explicit location or a "near X" phrase"""
+    radius_km = constraints.radius_km or DEFAULT_SEARCH_RADIUS_KM
+    if location and valid_coordinates(location.get("latitude"), location.get("longitude")):
+        return {
+            "latitude": float(location["latitude"]),
+            "longitude": float(location["longitude"]),
+            "radius_km": float(location.get("radius_km") or radius_km)
+        }
+    if constraints.near_place:
+        centroid = get_geo_index().place_centroid(constraints.near_place)
+        if centroid:
+            return {"latitude": centroid[0], "longitude": centroid[1], "radius_km": radius_km}
+    return None
+
+def retrieve_property_recommendations(query, k=10, lambda_mult=0.5, constraints: Optional[QueryConstraints] = None,
+                                      location: Optional[dict] = None):
+    """MMR search restricted to listings that satisfy the query's structured constraints"""
+    if constraints is None:
+        constraints = extract_property_constraints(query)
+
+    search_location = resolve_search_location(constraints, location)
+    if search_location:
+        return retrieve_nearby_properties(query, k=k, constraints=constraints, **search_location)
+
+    def search(where):
+        retriever = chroma_db.as_retriever(
+            search_type="mmr",
+            search_kwargs={"k": k, "lambda_mult": lambda_mult, "filter": where}
+        )
+        return retriever.invoke(query)
+
+    results = search(constraints.to_where())
+    if not results and (constraints.amenities or constraints.furnished is not None):
+        # Nothing matches every nice-to-have; keep the hard constraints only
+        results = search(constraints.to_where(include_soft=False))
+    if not results and constraints.to_conditions(include_soft=False):
+        # Parsed constraints can be wrong or too strict; plain semantic search beats no answer
+        results = search(QueryConstraints().to_where())
+    return results
+
+def retrieve_nearby_properties(query, latitude: float, longitude: float, radius_km: float = DEFAULT_SEARCH_RADIUS_KM,
+                               k=10, constraints: Optional[QueryConstraints] = None, max_candidates: int = 500,
+                               distance_weight: float = 0.3):
+    """Select listings within radius_km via the geo index, then rerank the subset semantically"""
+    nearby = get_geo_index().within_radius(latitude, longitude, radius_km, limit=max_candidates)
+    if not nearby:
+        return []
+    distances = dict(nearby)
+    constraints = constraints or QueryConstraints()
+
+    def search(include_soft):
+        # The radius replaces the city filter, so nearby suburbs still qualify
+        where = constraints.to_where(include_soft=include_soft, include_city=False,
+                                     extra=[{"id": {"$in": list(distances)}}])
+        return chroma_db.similarity_search_with_relevance_scores(query, k=min(len(distances), k * 3), filter=where)
+
+    scored = search(include_soft=True)
+    if not scored and (constraints.amenities or constraints.furnished is not None):
+        scored = search(include_soft=False)
+    if not scored and constraints.to_conditions(include_soft=False, include_city=False):
+        constraints = QueryConstraints()
+        scored = search(include_soft=False)
+
+    ranked = []
+    for doc, relevance in scored:
+        distance = distances.get(doc.metadata.get("id"), radius_km)
+        doc.metadata["distance_km"] = round(distance, 2)
+        ranked.append((relevance * (1 - distance_weight * distance / radius_km), doc))
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    return [doc for _, doc in ranked[:k]]
+
+def retrieve_for_route(route: QueryRoute, location: Optional[dict] = None):
+    """Run the retriever that matches a route's category"""
+    with pipeline_metrics.stage("retrieval", category=route.category) as span:
+        results = []
+        if route.category == "property_recommendation":
+            results = retrieve_property_recommendations(route.query, constraints=route.constraints, location=location)
+        elif route.category in ["market_trends", "legal_faq"]:
+            results = retrieve_market_trends_and_legal(route.query, route.category)
+        span["results"] = len(results)
+    return results
+
+def search_documents_by_source(query: str, source: str, k: int = 5):
+    return chroma_db.similarity_search(query, k=k, filter={"source": source})
+
+# One expansion client for the process (deterministic so cached variants stay valid)
+expansion_model = startup.component("expansion_model", lambda: chat_model(temperature=0))
+
+multi_query_engine = MultiQueryEngine(
+    llm=expansion_model,
+    search=search_documents_by_source,
+    embeddings=embedding_model,
+    num_variants=int(os.getenv("MULTI_QUERY_VARIANTS", "3")),
+    max_workers=int(os.getenv("MULTI_QUERY_WORKERS", "8"))
+)
+
+# Hybrid retrieval: BM25 and vector scores are fused; LLM query expansion is
+# only used when the query's terms are poorly covered by any chunk
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1").lower() in ("1", "true", "yes")
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.5"))  # weight of the lexical score
+HYBRID_MIN_TERM_COVERAGE = float(os.getenv("HYBRID_MIN_TERM_COVERAGE", "0.6"))
+
+def hybrid_retrieve(query, category, k=5) -> Optional[list]:
+    """Fused lexical + vector results, or None when lexical recall is too weak to skip expansion"""
+    lexical = get_bm25_index().search(query, k=k * 2, source=category)
+    if not lexical or max(coverage for _, _, coverage in lexical) < HYBRID_MIN_TERM_COVERAGE:
+        return None
+    dense = chroma_db.similarity_search_with_relevance_scores(query, k=k * 2, filter={"source": category})
+    return fuse_scores(lexical, dense, alpha=HYBRID_ALPHA)[:k * 2]
 
 def retrieve_market_trends_and_legal(query, category, k=5):
-    retriever = MultiQueryRetriever.from_llm(
-        retriever=chroma_db.as_retriever(search_kwargs={"k": k, "filter": {"source": category}}),
-        llm=ChatOpenAI(model="gpt-4o-mini")
-    )
-    return retriever.invoke(query)
+    if HYBRID_RETRIEVAL:
+        results = hybrid_retrieve(query, category, k)
+        if results is not None:
+            return results
+    # Each search fetches k chunks; keep the top 2k of the fused list, roughly
+    # what the MultiQueryRetriever union used to return
+    return multi_query_engine.retrieve(query, limit=k * 2, source=category, k=k)
+
+async def aretrieve_market_trends_and_legal(query, category, k=5):
+    if HYBRID_RETRIEVAL:
+        await embedding_model.aembed_query(query)
+        results = await asyncio.to_thread(hybrid_retrieve, query, category, k)
+        if results is not None:
+            return results
+    return await multi_query_engine.aretrieve(query, limit=k * 2, source=category, k=k)
+
+def get_multi_query_stats() -> Dict[str, Any]:
+    return multi_query_engine.stats()
 
 # --------------------------
 # 11. Lease Generation Classes
@@ -291,214 +766,159 @@ class LeaseData:
         
         # Additional Terms
         self.special_conditions = lease_info.get('special_conditions', [])
+        self.customizations = lease_info.get('customizations', '')  # free-text notes for the drafted clauses
         self.maintenance_responsibility = lease_info.get('maintenance_responsibility', 'Landlord')
 
 class LeaseGenerator:
     """Generates lease documents using LLM and converts to PDF"""
     
-    def __init__(self, llm_model):
+    def __init__(self, llm_model, clause_cache: Optional[ClauseVariantCache] = None):
         self.llm = llm_model
-        self.styles = getSampleStyleSheet()
-        self._setup_custom_styles()
-    
-    def _setup_custom_styles(self):
-        """Setup custom paragraph styles for the lease document"""
-        self.styles.add(ParagraphStyle(
-            name='LeaseTitle',
-            parent=self.styles['Title'],
-            fontSize=16,
-            spaceAfter=20,
-            alignment=1  # Center alignment
-        ))
-        
-        self.styles.add(ParagraphStyle(
-            name='SectionHeader',
-            parent=self.styles['Heading2'],
-            fontSize=12,
-            spaceBefore=15,
-            spaceAfter=10,
-            textColor=colors.darkblue
-        ))
-        
-        self.styles.add(ParagraphStyle(
-            name='LeaseBody',
-            parent=self.styles['Normal'],
-            fontSize=10,
-            spaceBefore=6,
-            spaceAfter=6,
-            leftIndent=20
-        ))
+        self.clauses = LeaseClauseEngine(llm_model, cache=clause_cache)
 
-    def generate_lease_content(self, lease_data: LeaseData, user) -> str:
-        """Use LLM to generate comprehensive lease content"""
-        
+    @property
+    def styles(self):
+        # Built once per process and shared by every generator
+        return get_lease_styles()
+
+    def _check_access(self, user):
         allowed_roles = ["admin", "owner", "agent"]
         if not user or user.get("role") not in allowed_roles:
             raise Exception("Access denied. Only admin, owner, or agent can generate lease PDFs.")
-        
-        prompt = f"""
-You are a legal document expert specializing in residential lease agreements. Generate a comprehensive, legally sound lease agreement based on the provided information.
-
-LEASE INFORMATION:
-- Property: {lease_data.property_address}
-- Property Type: {lease_data.property_type}
-- Description: {lease_data.property_description}
-- Landlord: {lease_data.landlord_name}
-- Tenant: {lease_data.tenant_name}
-- Lease Period: {lease_data.lease_start_date} to {lease_data.lease_end_date}
-- Monthly Rent: ${lease_data.monthly_rent}
-- Security Deposit: ${lease_data.security_deposit}
-- Late Fee: ${lease_data.late_fee}
-- Pet Policy: {lease_data.pet_policy}
-- Utilities Included: {', '.join(lease_data.utilities_included) if lease_data.utilities_included else 'None'}
-- Special Conditions: {', '.join(lease_data.special_conditions) if lease_data.special_conditions else 'None'}
-
-REQUIREMENTS:
-1. Create a professional residential lease agreement
-2. Include all standard lease clauses (rent payment, security deposit, maintenance, etc.)
-3. Incorporate the specific details provided above
-4. Use clear, legal language appropriate for a binding contract
-5. Structure the content with clear sections and numbered clauses
-6. Include signature lines at the end
-7. Add a clause about lease renewal and termination
-8. Include dispute resolution and governing law sections
-
-Generate the complete lease agreement content in a structured format with clear section headers.
-"""
 
-        response = self.llm.invoke(prompt)
-        return response.content.strip()
+    def generate_lease_content(self, lease_data: LeaseData, user) -> str:
+        """Fill the clause templates; the LLM only drafts special conditions"""
+        self._check_access(user)
+        lease = vars(lease_data)
+        return self.clauses.render(lease, self.clauses.draft_special_conditions(lease))
+
+    async def agenerate_lease_content(self, lease_data: LeaseData, user) -> str:
+        self._check_access(user)
+        lease = vars(lease_data)
+        return self.clauses.render(lease, await self.clauses.adraft_special_conditions(lease))
 
     def create_pdf_buffer(self, lease_content: str, lease_data: LeaseData) -> io.BytesIO:
         """Convert lease content to PDF document in memory buffer"""
-    
-        buffer = io.BytesIO()
-    
-        doc = SimpleDocTemplate(
-        buffer,
-        pagesize=letter,
-        rightMargin=72,
-        leftMargin=72,
-        topMargin=72,
-        bottomMargin=72
-        )
-    
-        story = []
-    
-        # Title
-        story.append(Paragraph("RESIDENTIAL LEASE AGREEMENT", self.styles['LeaseTitle']))
-        story.append(Spacer(1, 20))
-    
-        # Property and Party Information Table
-        party_data = [
-        ['PROPERTY ADDRESS:', lease_data.property_address],
-        ['LANDLORD:', f"{lease_data.landlord_name}<br/>{lease_data.landlord_address}<br/>Phone: {lease_data.landlord_phone}<br/>Email: {lease_data.landlord_email}"],
-        ['TENANT:', f"{lease_data.tenant_name}<br/>{lease_data.tenant_address}<br/>Phone: {lease_data.tenant_phone}<br/>Email: {lease_data.tenant_email}"],
-        ['LEASE PERIOD:', f"{lease_data.lease_start_date} to {lease_data.lease_end_date}"],
-        ['MONTHLY RENT:', f"${lease_data.monthly_rent}"],
-        ['SECURITY DEPOSIT:', f"${lease_data.security_deposit}"]
-        ]
-    
-        party_table = Table(party_data, colWidths=[2*inch, 4*inch])
-        party_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ]))
-    
-        story.append(party_table)
-        story.append(Spacer(1, 20))
-    
-        # Parse and add the generated lease content
-        sections = lease_content.split('\n\n')
-    
-        for section in sections:
-            if section.strip():
-                # Check if it's a section header
-                if any(keyword in section.upper() for keyword in ['SECTION', 'ARTICLE', 'CLAUSE']) or section.strip().endswith(':'):
-                    story.append(Paragraph(section.strip(), self.styles['SectionHeader']))
-                else:
-                    story.append(Paragraph(section.strip(), self.styles['LeaseBody']))
-                story.append(Spacer(1, 6))
-    
-        # Signature Section
-        story.append(Spacer(1, 30))
-        story.append(Paragraph("SIGNATURES", self.styles['SectionHeader']))
-    
-        signature_data = [
-        ['LANDLORD SIGNATURE:', '____________________', 'DATE:', '____________'],
-        [f"Print Name: {lease_data.landlord_name}", '', '', ''],
-        ['', '', '', ''],
-        ['TENANT SIGNATURE:', '____________________', 'DATE:', '____________'],
-        [f"Print Name: {lease_data.tenant_name}", '', '', '']
-        ]
-    
-        signature_table = Table(signature_data, colWidths=[2*inch, 2*inch, 1*inch, 1*inch])
-        signature_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'BOTTOM'),
-        ]))
-    
-        story.append(signature_table)
-    
-        # Build PDF
-        doc.build(story)
-    
-        # Reset buffer position to beginning
-        buffer.seek(0)
-        return buffer
+        return io.BytesIO(render_lease_pdf(lease_content, vars(lease_data)))
+
+# Deterministic drafting so cached clause variants match what a fresh call would produce
+lease_drafting_model = startup.component("lease_drafting_model", lambda: chat_model(temperature=0))
+
+lease_generator = LeaseGenerator(
+    lease_drafting_model,
+    clause_cache=startup.component(
+        "lease_clause_cache", lambda: ClauseVariantCache(os.path.join(CHROMA_PERSIST_DIR, "lease_clauses.sqlite3")))
+)
+
+# Renders run in worker processes; requests beyond the queue bound get RenderQueueFull
+lease_render_service = LeaseRenderService(
+    max_workers=int(os.getenv("LEASE_RENDER_WORKERS", "0")) or None,
+    max_queue=int(os.getenv("LEASE_RENDER_QUEUE", "32")),
+    queue_timeout=float(os.getenv("LEASE_RENDER_QUEUE_TIMEOUT", "5"))
+)
+
+# Finished PDFs keyed by normalized lease fields + template version, so identical
+# requests and retries are served from disk without drafting or rendering again
+lease_artifact_store = startup.component("lease_artifact_store", lambda: LeaseArtifactStore(
+    os.getenv("LEASE_STORE_DIR", os.path.join(CHROMA_PERSIST_DIR, "leases")),
+    max_bytes=int(os.getenv("LEASE_STORE_MAX_MB", "1024")) * 1024 * 1024,
+    max_age_seconds=float(os.getenv("LEASE_STORE_MAX_AGE_DAYS", "30")) * 24 * 3600
+))
+
+def _run_lease_purge_job(params, context):
+    return {"removed": lease_artifact_store.purge_expired()}
+
+job_scheduler.register("purge_leases", _run_lease_purge_job)
+
+def enqueue_lease_purge():
+    """Queue removal of expired lease PDFs that are never read again"""
+    return job_scheduler.enqueue("purge_leases", key="purge_leases")
+
+def get_lease_render_stats() -> Dict[str, Any]:
+    return {
+        **lease_render_service.stats(),
+        "clauses": lease_generator.clauses.stats(),
+        "artifacts": lease_artifact_store.stats(),
+        "slot_filling": lease_slot_filler.stats(),
+    }
 
 # --------------------------
 # 12. Enhanced RAG Functions for Lease Generation
 # --------------------------
 
+LEASE_REQUIRED_FIELDS = ['property_address', 'landlord_name', 'tenant_name',
+                         'lease_start_date', 'lease_end_date', 'monthly_rent', 'security_deposit']
+
+def prepare_lease(lease_info: Dict[str, Any], user):
+    """Validate the request and return (LeaseData, artifact key)"""
+    missing_fields = [field for field in LEASE_REQUIRED_FIELDS if not lease_info.get(field)]
+    if missing_fields:
+        raise ValueError(f"Missing required fields: {', '.join(missing_fields)}")
+    # Checked here as well as in the generator: a stored PDF must not bypass it
+    lease_generator._check_access(user)
+    # "2025-2-1" and "2025-02-01" are the same lease and must share one artifact key
+    lease_data = LeaseData(normalize_lease_dates(lease_info))
+    return lease_data, lease_artifact_key(vars(lease_data), TEMPLATE_VERSION)
+
+def stored_lease_result(key: str) -> Optional[Dict[str, Any]]:
+    """Result for a previously generated lease, with pdf_buffer an open file on disk"""
+    stored = lease_artifact_store.open(key)
+    if stored is None:
+        return None
+    handle, meta = stored
+    return {
+        "success": True,
+        "lease_id": meta["lease_id"],
+        "pdf_buffer": handle,
+        "filename": meta["filename"],
+        "cached": True,
+        "message": "Lease PDF generated successfully"
+    }
+
+def store_lease_result(key: str, pdf_bytes: bytes) -> Dict[str, Any]:
+    lease_id = lease_id_for_key(key)
+    filename = f"lease_agreement_{lease_id}.pdf"
+    try:
+        lease_artifact_store.put(key, pdf_bytes, {"lease_id": lease_id, "filename": filename})
+    except OSError as e:
+        # The PDF is still returned; only the next identical request pays again
+        print(f"Could not store lease PDF {lease_id}: {e}")
+    return {
+        "success": True,
+        "lease_id": lease_id,
+        "pdf_buffer": io.BytesIO(pdf_bytes),
+        "filename": filename,
+        "cached": False,
+        "message": "Lease PDF generated successfully"
+    }
+
+def lease_error_result(e: Exception) -> Dict[str, Any]:
+    print(f"Error generating lease PDF: {str(e)}")
+    return {
+        "success": False,
+        "error": str(e),
+        "busy": isinstance(e, RenderQueueFull),
+        "message": f"Failed to generate lease PDF: {str(e)}"
+    }
+
+@pipeline_metrics.timed("lease_generation")
 def generate_lease_pdf(lease_info: Dict[str, Any], user) -> Dict[str, Any]:
     try:
-        # Validate input data
-        required_fields = ['property_address', 'landlord_name', 'tenant_name', 
-                          'lease_start_date', 'lease_end_date', 'monthly_rent', 'security_deposit']
-        
-        missing_fields = [field for field in required_fields if not lease_info.get(field)]
-        if missing_fields:
-            raise ValueError(f"Missing required fields: {', '.join(missing_fields)}")
-        
-        # Generate unique lease ID
-        lease_id = str(uuid.uuid4())
-        
-        # Create lease data object
-        lease_data = LeaseData(lease_info)
-        
-        # Initialize lease generator
-        lease_generator = LeaseGenerator(model)
+        lease_data, key = prepare_lease(lease_info, user)
+        cached = stored_lease_result(key)
+        if cached is not None:
+            return cached
         
         # Generate lease content using LLM
         lease_content = lease_generator.generate_lease_content(lease_data, user)
         
-        # Create PDF in memory
-        pdf_buffer = lease_generator.create_pdf_buffer(lease_content, lease_data)
-        
-        return {
-            "success": True,
-            "lease_id": lease_id,
-            "pdf_buffer": pdf_buffer,
-            "filename": f"lease_agreement_{lease_id}.pdf",
-            "message": "Lease PDF generated successfully"
-        }
+        # Render the PDF in the worker pool
+        with pipeline_metrics.stage("pdf_rendering"):
+            pdf_bytes = lease_render_service.render(lease_content, vars(lease_data))
+        return store_lease_result(key, pdf_bytes)
         
     except Exception as e:
-        print(f"Error generating lease PDF: {str(e)}")
-        return {
-            "success": False,
-            "error": str(e),
-            "message": f"Failed to generate lease PDF: {str(e)}"
-        }
+        return lease_error_result(e)
 
 def get_lease_template_fields() -> Dict[str, Any]:
     """Returns the required fields for lease generation"""
@@ -528,40 +948,149 @@ def get_lease_template_fields() -> Dict[str, Any]:
             "late_fee": {"type": "number", "required": False, "default": 50},
             "pet_policy": {"type": "text", "required": False},
             "utilities_included": {"type": "array", "required": False, "options": ["Water", "Electricity", "Gas", "Internet", "Cable", "Trash"]},
-            "special_conditions": {"type": "array", "required": False}
+            "special_conditions": {"type": "array", "required": False},
+            "customizations": {"type": "text", "required": False}
         }
     }
 
-def handle_lease_generation_query(query: str, conversation_history=None, user=None) -> str:
-    """Handle queries related to lease generation"""
+LEASE_EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+LEASE_FIELD_SPECS = {field: spec for group in get_lease_template_fields().values() for field, spec in group.items()}
+
+def validate_lease_field(field: str, value: Any) -> Optional[str]:
+    """Problem with one non-empty lease field value according to get_lease_template_fields(), if any"""
+    spec = LEASE_FIELD_SPECS.get(field, {})
+    kind = spec.get("type")
+    if kind == "number":
+        try:
+            float(str(value).replace(",", ""))
+        except ValueError:
+            return f"{field} must be a number"
+    elif kind == "date":
+        try:
+            datetime.strptime(str(value), "%Y-%m-%d")
+        except ValueError:
+            return f"{field} must be a YYYY-MM-DD date"
+    elif kind == "email" and not LEASE_EMAIL_PATTERN.match(str(value)):
+        return f"{field} must be an email address"
+    elif kind == "array" and not isinstance(value, (list, str)):
+        return f"{field} must be a list"
+    if "options" in spec and kind != "array" and str(value).lower() not in [o.lower() for o in spec["options"]]:
+        return f"{field} must be one of {', '.join(spec['options'])}"
+    return None
+
+def parse_lease_date(value) -> date:
+    """YYYY-MM-DD lease date; unpadded months and days ("2025-2-1") are accepted"""
+    return datetime.strptime(str(value), "%Y-%m-%d").date()
+
+def lease_dates_in_order(lease_info: Dict[str, Any]) -> bool:
+    """True when lease_end_date is after lease_start_date (compared as dates, not strings)"""
+    try:
+        return parse_lease_date(lease_info["lease_end_date"]) > parse_lease_date(lease_info["lease_start_date"])
+    except (KeyError, ValueError):
+        return False
+
+def normalize_lease_dates(lease_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of lease_info with every valid date field rewritten as ISO YYYY-MM-DD"""
+    normalized = dict(lease_info)
+    for field, spec in LEASE_FIELD_SPECS.items():
+        if spec.get("type") == "date" and normalized.get(field):
+            try:
+                normalized[field] = parse_lease_date(normalized[field]).isoformat()
+            except ValueError:
+                pass
+    return normalized
+
+def validate_lease_info(lease_info: Dict[str, Any]) -> list:
+    """Problems with a lease_info dict according to get_lease_template_fields()"""
+    if not isinstance(lease_info, dict):
+        return ["lease_info must be an object"]
+    errors = []
+    for field, spec in LEASE_FIELD_SPECS.items():
+        value = lease_info.get(field)
+        if value in (None, "", []):
+            if spec.get("required"):
+                errors.append(f"{field} is required")
+            continue
+        error = validate_lease_field(field, value)
+        if error:
+            errors.append(error)
+    if not errors and not lease_dates_in_order(lease_info):
+        errors.append("lease_end_date must be after lease_start_date")
+    return errors
+
+# Lease details are filled from chat turns by regex recognizers; state is kept per
+# conversation so each turn parses only its newest message, and the LLM is only
+# asked when the recognizers leave a requested field empty
+lease_slot_filler = LeaseSlotFiller(
+    LeaseSlotExtractor(get_lease_template_fields(), validate_lease_field),
+    store=LeaseSlotStore(max_conversations=int(os.getenv("LEASE_SLOT_CONVERSATIONS", "10000"))),
+    llm=model
+)
+
+# The order details are asked for in the chat
+LEASE_SLOT_ORDER = ['property_address', 'landlord_name', 'landlord_phone', 'landlord_email',
+                    'tenant_name', 'tenant_phone', 'tenant_email', 'lease_start_date', 'lease_end_date',
+                    'monthly_rent', 'security_deposit']
+
+LEASE_SLOT_HINTS = {
+    'lease_start_date': ' (YYYY-MM-DD)',
+    'lease_end_date': ' (YYYY-MM-DD)',
+    'monthly_rent': ' (numbers only)',
+    'security_deposit': ' (numbers only)',
+}
+
+def lease_slot_label(field: str) -> str:
+    return field.replace('_', ' ')
+
+def lease_slot_value(value) -> str:
+    return ", ".join(value) if isinstance(value, list) else str(value)
+
+def lease_slot_reply(found: Dict[str, Any], missing: list, generate_requested: bool) -> str:
+    """Acknowledge the details just captured and ask for the next missing ones"""
+    parts = []
+    if found:
+        captured = ", ".join(f"{lease_slot_label(field)}: {lease_slot_value(value)}" for field, value in found.items())
+        parts.append(f"Got it - {captured}.")
+    if not missing:
+        parts.append('I have all the details needed. Say "generate the lease" whenever you are ready.')
+        return "\n\n".join(parts)
+    if generate_requested:
+        parts.append("Before I can generate the lease I still need a few details.")
+    parts.append("Still needed: " + ", ".join(lease_slot_label(field) for field in missing) + ".")
+    parts.append("Could you share the " + " and ".join(
+        lease_slot_label(field) + LEASE_SLOT_HINTS.get(field, "") for field in missing[:2]
+    ) + "?")
+    return "\n\n".join(parts)
+
+@pipeline_metrics.timed("lease_slot_filling")
+def handle_lease_generation_query(query: str, conversation_history=None, user=None,
+                                  conversation_id: Optional[str] = None) -> str:
+    """Handle queries related to lease generation; conversation_id is set for server-side sessions"""
     
     allowed_roles = ["admin", "owner", "agent"]
     if not user or user.get("role") not in allowed_roles:
         raise Exception("Access denied. Only admin, owner, or agent can generate lease PDFs.")
     
-    conversation_context = ""
-    if conversation_history and len(conversation_history) > 0:
-        conversation_context = "PREVIOUS CONVERSATION:\n"
-        for msg in conversation_history:
-            role = "User" if msg.role == "user" else "Assistant"
-            conversation_context += f"{role}: {msg.content}\n"
-        conversation_context += "\n"
+    # Fold the newest message into this conversation's lease fields
+    key = conversation_id or conversation_key(user, conversation_history, query)
+    state, found = lease_slot_filler.update(key, conversation_history, query, LEASE_SLOT_ORDER,
+                                            tracked=conversation_id is not None)
+    lease_info = dict(state.fields)
+    missing = [field for field in LEASE_SLOT_ORDER if not lease_info.get(field)]
+    state.asked = missing[:2]
 
     # Check if user is asking to generate/create/draft a lease
     generate_keywords = ['generate', 'create', 'draft', 'make', 'prepare', 'download']
-    if any(keyword in query.lower() for keyword in generate_keywords) and 'lease' in query.lower():
-        
-        # Try to extract lease information from conversation
-        lease_info = extract_lease_info_from_conversation(conversation_history)
-        
-        # Check if we have all required fields
-        required_fields = ['property_address', 'landlord_name', 'tenant_name', 
-                          'lease_start_date', 'lease_end_date', 'monthly_rent', 'security_deposit']
-        
-        if lease_info and all(lease_info.get(field) for field in required_fields):
-            # We have enough info - return special marker for frontend to detect
-            import json
-            return f"""**LEASE_GENERATION_READY**
+    generate_requested = any(keyword in query.lower() for keyword in generate_keywords) and 'lease' in query.lower()
+    
+    if generate_requested and all(lease_info.get(field) for field in LEASE_REQUIRED_FIELDS):
+        if not lease_dates_in_order(lease_info):
+            state.asked = ['lease_start_date', 'lease_end_date']
+            return ("The lease end date must be after the start date. Could you confirm the lease start date "
+                    "and lease end date (YYYY-MM-DD)?")
+        # We have enough info - return special marker for frontend to detect
+        return f"""**LEASE_GENERATION_READY**
 
 I have all the required information to generate your lease agreement. Let me create the PDF for you now.
 
@@ -571,108 +1100,98 @@ I have all the required information to generate your lease agreement. Let me cre
 
 **GENERATE_LEASE_PDF**"""
 
-    # If not enough info, guide them through collection
+    if found or generate_requested:
+        return lease_slot_reply(found, missing, generate_requested)
+
+    # A question rather than details: answer it, with a prompt that does not grow with the history
+    known = "; ".join(f"{lease_slot_label(field)}: {lease_slot_value(value)}" for field, value in lease_info.items()) or "nothing yet"
     prompt = f"""
 You are Estatify's AI assistant helping with lease document generation.
 
-{conversation_context}
-
-The user is asking about lease generation. Guide them through collecting this required information:
-
-**Required Information:**
-1. Property address
-2. Landlord full name  
-3. Landlord phone and email
-4. Tenant full name
-5. Tenant phone and email
-6. Lease start date (YYYY-MM-DD format)
-7. Lease end date (YYYY-MM-DD format)  
-8. Monthly rent amount (numbers only, no $ sign)
-9. Security deposit amount (numbers only, no $ sign)
+Details collected so far: {known}
+Details still needed: {", ".join(lease_slot_label(field) for field in missing) or "none"}
 
-Ask for missing information in a friendly, step-by-step manner. If they provide information, acknowledge it and ask for the next missing piece.
+Answer the user's question briefly, then ask for the next missing details in a friendly way.
+Dates should be in YYYY-MM-DD format and amounts in numbers only, with no currency symbol.
 
 Current user question: {query}
-
-Respond helpfully and guide them to provide the needed information.
 """
     
     return model.invoke(prompt).content.strip()
-
-def extract_lease_info_from_conversation(conversation_history):
-    """Extract lease information from conversation history using LLM"""
-    if not conversation_history:
-        return None
-        
-    conversation_text = ""
-    for msg in conversation_history[-20:]:  # Last 20 messages only
-        role = "User" if msg.role == "user" else "Assistant"
-        conversation_text += f"{role}: {msg.content}\n"
-    
-    prompt = f"""
-Extract lease information from this conversation. Return ONLY a valid JSON object with the lease details, or return "INSUFFICIENT_DATA" if not enough information is provided.
-
-Required fields that MUST be present:
-- property_address (full address as string)
-- landlord_name (full name)
-- tenant_name (full name)  
-- lease_start_date (YYYY-MM-DD format)
-- lease_end_date (YYYY-MM-DD format)
-- monthly_rent (number only, no currency symbols)
-- security_deposit (number only, no currency symbols)
-
-Optional fields:
-- landlord_phone, landlord_email, landlord_address
-- tenant_phone, tenant_email, tenant_address
-- property_type, late_fee, pet_policy
-
-Conversation:
-{conversation_text}
-
-Return ONLY valid JSON or "INSUFFICIENT_DATA":
-"""
-    
-    try:
-        response = model.invoke(prompt).content.strip()
-        if response == "INSUFFICIENT_DATA":
-            return None
-        
-        import json
-        # Remove any markdown formatting
-        if response.startswith('```json'):
-            response = response.replace('```json', '').replace('```', '').strip()
-        
-        lease_data = json.loads(response)
-        return lease_data
-    except Exception as e:
-        print(f"Error extracting lease info: {e}")
-        return None
     
+# --------------------------
+# 12b. Conversation sessions
+# --------------------------
+# Prompt space for conversation history; server-side sessions summarize beyond it
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "1500"))
+
+def build_session_backend():
+    if os.getenv("SESSION_BACKEND", "memory").lower() == "sqlite":
+        return SQLiteSessionBackend(
+            os.getenv("SESSION_DB_PATH", os.path.join(CHROMA_PERSIST_DIR, "sessions.sqlite3")),
+            max_sessions=int(os.getenv("SESSION_MAX", "100000"))
+        )
+    return MemorySessionBackend(max_sessions=int(os.getenv("SESSION_MAX", "10000")))
+
+summary_model = startup.component("summary_model", lambda: chat_model(temperature=0))
+
+@pipeline_metrics.timed("session_summary")
+def summarize_session(prompt: str) -> str:
+    return summary_model.invoke(prompt).content
+
+session_store = startup.component("session_store", lambda: SessionStore(
+    build_session_backend(),
+    ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", "86400")),
+    max_recent_turns=int(os.getenv("SESSION_RECENT_TURNS", "8")),
+    token_budget=SESSION_TOKEN_BUDGET,
+    summarizer=summarize_session
+))
+
+def get_session_stats() -> Dict[str, Any]:
+    return session_store.stats()
+
 # --------------------------
 # 13. Enhanced Augmentation (Updated)
 # --------------------------
-def augment_with_context(query, retrieved_docs, conversation_history=None, user=None):
-    """Enhanced version that handles lease generation queries"""
-    
-    # Classify the query
-    query_type = classify_query(query)
-    
-    if query_type == "lease_generation":
-        return handle_lease_generation_query(query, conversation_history, user)
-    
-    # Original logic for other query types
-    context_text = "\n\n".join([doc.page_content for doc in retrieved_docs])
+# Retrieved documents are packed into the prompt in rank order within a token budget
+context_builder = ContextBuilder(
+    token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "2500")),
+    max_item_tokens=int(os.getenv("CONTEXT_MAX_ITEM_TOKENS", "400")),
+    dedup_threshold=float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.85")),
+    description_words=int(os.getenv("CONTEXT_DESCRIPTION_WORDS", "60"))
+)
+
+def get_context_stats() -> Dict[str, Any]:
+    return context_builder.stats()
+
+@pipeline_metrics.timed("context_assembly")
+def build_context_text(retrieved_docs) -> str:
+    context = context_builder.build(retrieved_docs or [])
+    if context.dropped or context.truncated:
+        print(f"Context: {len(context.included)} of {len(retrieved_docs)} documents, "
+              f"{context.tokens_before} -> {context.tokens} tokens, "
+              f"dropped {[(d['rank'], d['reason']) for d in context.dropped]}, "
+              f"truncated {[(t['rank'], t['reason']) for t in context.truncated]}")
+    return context.text
+
+def build_augmentation_prompt(query, retrieved_docs, conversation_history=None) -> str:
+    """Prompt for the final answer over the retrieved CONTEXT"""
+    context_text = build_context_text(retrieved_docs)
     
-    # Build conversation history string
+    # Build conversation history string; client-sent histories are cut to the newest turns that fit
     conversation_context = ""
+    conversation_history = trim_history(conversation_history, SESSION_TOKEN_BUDGET)
     if conversation_history and len(conversation_history) > 0:
         conversation_context = "PREVIOUS CONVERSATION:\n"
         for msg in conversation_history:
+            if msg.role == "summary":
+                conversation_context += f"(Summary of earlier messages: {msg.content})\n"
+                continue
             role = "User" if msg.role == "user" else "Assistant"
             conversation_context += f"{role}: {msg.content}\n"
         conversation_context += "\n"
 
-    prompt = f"""
+    return f"""
 You are Estatify's AI real estate assistant - a knowledgeable, professional, and helpful expert in property buying, selling, and market insights.
 
 {conversation_context}GUIDELINES:
@@ -691,5 +1210,295 @@ CONTEXT:
 
 CURRENT USER QUESTION:
 {query}
-"""    
-    return model.invoke(prompt).content.strip()
\ No newline at end of file
+"""
+
+def augment_with_context(query, retrieved_docs, conversation_history=None, user=None, route: Optional[QueryRoute] = None,
+                         conversation_id: Optional[str] = None):
+    """Enhanced version that handles lease generation queries"""
+    
+    # Reuse the caller's classification when available
+    if route is None:
+        route = route_query(query)
+    
+    if route.category == "lease_generation":
+        return handle_lease_generation_query(query, conversation_history, user, conversation_id)
+    
+    with pipeline_metrics.stage("augmentation", category=route.category):
+        prompt = build_augmentation_prompt(query, retrieved_docs, conversation_history)
+        return model.invoke(prompt).content.strip()
+
+async def astream_augmented_answer(query, retrieved_docs, conversation_history=None, user=None,
+                                   route: Optional[QueryRoute] = None,
+                                   conversation_id: Optional[str] = None) -> AsyncIterator[str]:
+    """Streaming counterpart of augment_with_context that yields answer text as it is generated"""
+    if route is None:
+        route = await aroute_query(query)
+    
+    if route.category == "lease_generation":
+        # Lease replies carry markers the frontend parses as a whole, so send them in one piece
+        yield await asyncio.to_thread(handle_lease_generation_query, query, conversation_history, user,
+                                      conversation_id)
+        return
+    
+    with pipeline_metrics.stage("augmentation", category=route.category, streamed=True):
+        prompt = build_augmentation_prompt(query, retrieved_docs, conversation_history)
+        stream = model.astream(prompt)
+        try:
+            async for chunk in stream:
+                if chunk.content:
+                    yield chunk.content
+        finally:
+            # Closing the upstream stream aborts the OpenAI request when the client goes away
+            await stream.aclose()
+
+# --------------------------
+# 14. Semantic response cache
+# --------------------------
+CACHEABLE_CATEGORIES = {"property_recommendation", "market_trends", "legal_faq", "none"}
+
+response_cache = SemanticResponseCache(
+    embeddings=embedding_model,
+    similarity_threshold=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95")),
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000")),
+    # Newly created listings cannot invalidate by dependency, so recommendations expire sooner
+    ttl_by_category={"property_recommendation": float(os.getenv("RESPONSE_CACHE_LISTING_TTL_SECONDS", "300"))}
+)
+
+def _invalidate_listing_answers(docs_or_ids):
+    ids = [item.metadata["id"] if isinstance(item, Document) else item for item in docs_or_ids]
+    response_cache.invalidate_documents(ids)
+
+listing_upserted_listeners.append(_invalidate_listing_answers)
+listing_deleted_listeners.append(_invalidate_listing_answers)
+
+def response_cache_key(route: QueryRoute, location: Optional[dict] = None) -> str:
+    """Category plus anything else that changes the answer besides the query wording"""
+    parts = [route.category]
+    if route.constraints is not None:
+        parts.append(json.dumps(asdict(route.constraints), sort_keys=True))
+    if location:
+        parts.append(json.dumps(location, sort_keys=True))
+    return "|".join(parts)
+
+def document_dependency_id(doc: Document) -> str:
+    """ID used to invalidate cached answers built from this document"""
+    if doc.metadata.get("source") == "property_listing" and doc.metadata.get("id"):
+        return doc.metadata["id"]
+    return doc.metadata.get("chunk_id") or getattr(doc, "id", None) or pdf_chunk_id(doc)
+
+def is_cacheable_query(route: QueryRoute, conversation_history=None) -> bool:
+    # Answers that depend on earlier turns are not reusable across users
+    return route.category in CACHEABLE_CATEGORIES and not conversation_history
+
+def get_cached_answer(route: QueryRoute, location: Optional[dict] = None) -> Optional[str]:
+    entry = response_cache.lookup(response_cache_key(route, location), route.query)
+    return entry.answer if entry else None
+
+def cache_answer(route: QueryRoute, retrieved_docs, answer: str, location: Optional[dict] = None):
+    doc_ids = [document_dependency_id(doc) for doc in retrieved_docs]
+    response_cache.store(response_cache_key(route, location), route.query, doc_ids, answer)
+
+def get_response_cache_stats() -> Dict[str, Any]:
+    return response_cache.stats()
+
+# --------------------------
+# 15. Async execution path
+# --------------------------
+# Network waits (OpenAI, Mongo) are awaited; local blocking work (Chroma
+# search) runs in worker threads and PDF rendering in the render process pool,
+# so the event loop stays free.
+
+async def aget_known_cities(max_age: float = 600.0) -> list:
+    if time.time() - _known_cities["loaded_at"] > max_age:
+        if async_listings_collection is None:
+            return await asyncio.to_thread(get_known_cities, max_age)
+        try:
+            cities = await async_listings_collection.distinct("address.city")
+            _known_cities["values"] = [c.lower() for c in cities if c]
+        except Exception as e:
+            print(f"Could not load listing cities: {e}")
+        _known_cities["loaded_at"] = time.time()
+    return _known_cities["values"]
+
+async def aload_new_listings(batch_size: int = LISTING_BATCH_SIZE, after_id=None):
+    """Async counterpart of load_new_listings, paging by _id through the motor driver"""
+    if async_listings_collection is None:
+        docs = await asyncio.to_thread(lambda: list(load_new_listings(batch_size, after_id)))
+        for doc in docs:
+            yield doc
+        return
+    last_id = after_id
+    while True:
+        query = {} if last_id is None else {"_id": {"$gt": last_id}}
+        cursor = async_listings_collection.find(query, LISTING_EMBEDDING_FIELDS).sort("_id", 1).limit(batch_size)
+        page = await cursor.to_list(length=batch_size)
+        if not page:
+            return
+        for listing in page:
+            yield listing_to_document(listing)
+        last_id = page[-1]["_id"]
+
+async def aroute_query(query: str) -> QueryRoute:
+    with pipeline_metrics.stage("classification") as span:
+        route = await query_router.aroute(query)
+        if route.category == "property_recommendation":
+            route.constraints = extract_constraints(query, known_cities=await aget_known_cities())
+        span.update(category=route.category, tier=route.tier)
+    return route
+
+@pipeline_metrics.timed("response_cache")
+async def aget_cached_answer(route: QueryRoute, location: Optional[dict] = None) -> Optional[str]:
+    # Embed asynchronously; the cache lookup and later searches then hit the embedding cache
+    await embedding_model.aembed_query(route.query)
+    return await asyncio.to_thread(get_cached_answer, route, location)
+
+async def acache_answer(route: QueryRoute, retrieved_docs, answer: str, location: Optional[dict] = None):
+    await asyncio.to_thread(cache_answer, route, retrieved_docs, answer, location)
+
+async def aretrieve_for_route(route: QueryRoute, location: Optional[dict] = None):
+    with pipeline_metrics.stage("retrieval", category=route.category) as span:
+        results = []
+        if route.category in ("market_trends", "legal_faq"):
+            results = await aretrieve_market_trends_and_legal(route.query, route.category)
+        elif route.category == "property_recommendation":
+            await embedding_model.aembed_query(route.query)
+            results = await asyncio.to_thread(retrieve_for_route, route, location)
+        span["results"] = len(results)
+    return results
+
+async def aaugment_with_context(query, retrieved_docs, conversation_history=None, user=None,
+                                route: Optional[QueryRoute] = None, conversation_id: Optional[str] = None) -> str:
+    if route is None:
+        route = await aroute_query(query)
+    
+    if route.category == "lease_generation":
+        return await asyncio.to_thread(handle_lease_generation_query, query, conversation_history, user,
+                                       conversation_id)
+    
+    with pipeline_metrics.stage("augmentation", category=route.category):
+        prompt = build_augmentation_prompt(query, retrieved_docs, conversation_history)
+        return (await model.ainvoke(prompt)).content.strip()
+
+# Identical leases being generated right now, so concurrent retries share one generation
+_lease_generations: Dict[str, asyncio.Future] = {}
+
+async def _agenerate_and_store(lease_data: LeaseData, key: str, user) -> Dict[str, Any]:
+    lease_content = await lease_generator.agenerate_lease_content(lease_data, user)
+    with pipeline_metrics.stage("pdf_rendering"):
+        pdf_bytes = await lease_render_service.arender(lease_content, vars(lease_data))
+    return store_lease_result(key, pdf_bytes)
+
+@pipeline_metrics.timed("lease_generation")
+async def agenerate_lease_pdf(lease_info: Dict[str, Any], user) -> Dict[str, Any]:
+    """Async generate_lease_pdf: awaits the LLM and the render process pool"""
+    try:
+        lease_data, key = prepare_lease(lease_info, user)
+        cached = stored_lease_result(key)
+        if cached is not None:
+            return cached
+        
+        generation = _lease_generations.get(key)
+        if generation is None:
+            generation = asyncio.ensure_future(_agenerate_and_store(lease_data, key, user))
+            _lease_generations[key] = generation
+            generation.add_done_callback(lambda _: _lease_generations.pop(key, None))
+            # shield: one caller disconnecting must not cancel the others' generation
+            return await asyncio.shield(generation)
+        
+        await asyncio.shield(generation)
+        # Each waiter needs its own read handle on the stored file
+        stored = stored_lease_result(key)
+        if stored is None:
+            # Storing failed; copy so waiters do not share one buffer position
+            result = generation.result()
+            stored = {**result, "pdf_buffer": io.BytesIO(result["pdf_buffer"].getvalue())}
+        return stored
+    except Exception as e:
+        return lease_error_result(e)
+
+async def agenerate_lease_batch(lease_infos, user, concurrency: int = 4):
+    """Generate many leases with at most `concurrency` in flight; yields (index, result) as each finishes"""
+    pending = set()
+    items = iter(enumerate(lease_infos))
+
+    async def generate(index, lease_info):
+        return index, await agenerate_lease_pdf(lease_info, user)
+
+    def fill():
+        for index, lease_info in items:
+            pending.add(asyncio.ensure_future(generate(index, lease_info)))
+            if len(pending) >= concurrency:
+                break
+
+    fill()
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pending.discard(task)
+                yield task.result()
+            fill()
+    finally:
+        # Client went away: stop the remaining generations
+        for task in pending:
+            task.cancel()
+
+# --------------------------
+# 16. Warmup and readiness
+# --------------------------
+def warm_vector_index():
+    """Open the Chroma collection and run one vector query so the index is loaded before traffic"""
+    collection = chroma_db._collection
+    if collection.count() == 0:
+        return
+    sample = collection.peek(limit=1).get("embeddings")
+    if sample is not None and len(sample):
+        collection.query(query_embeddings=[list(sample[0])], n_results=1, include=[])
+
+def warm_models():
+    for component in (model, expansion_model, lease_drafting_model):
+        component.resolve()
+
+def warm_lease_rendering():
+    get_lease_styles()
+    # Spawning render workers costs a few seconds of CPU; skip where that hurts
+    if os.getenv("LEASE_RENDER_WARMUP", "1").lower() in ("1", "true", "yes"):
+        lease_render_service.warmup()
+
+startup.add_warmup_step("mongo", lambda: mongo_client.admin.command("ping"))
+startup.add_warmup_step("embeddings", embedding_model.resolve)
+startup.add_warmup_step("chat_models", warm_models)
+startup.add_warmup_step("vector_index", warm_vector_index)
+startup.add_warmup_step("query_router", query_router.warmup)
+startup.add_warmup_step("bm25_index", get_bm25_index)
+startup.add_warmup_step("listing_sync_state", listing_sync_engine.resolve)
+startup.add_warmup_step("session_store", session_store.resolve)
+startup.add_warmup_step("geo_index", get_geo_index)
+startup.add_warmup_step("lease_rendering", warm_lease_rendering)
+
+startup.add_check("mongo", lambda: mongo_client.admin.command("ping"))
+startup.add_check("chroma", lambda: chroma_db._collection.count())
+
+def get_startup_report() -> Dict[str, Any]:
+    return startup.report()
+
+# --------------------------
+# 17. Metrics
+# --------------------------
+# Existing stats() counters are exported next to the stage histograms
+pipeline_metrics.registry.register_stats(
+    "embedding_cache", lambda: embedding_model.stats() if embedding_model.loaded else {})
+pipeline_metrics.registry.register_stats("response_cache", get_response_cache_stats)
+pipeline_metrics.registry.register_stats("multi_query", get_multi_query_stats)
+pipeline_metrics.registry.register_stats("listing_writes", get_listing_write_buffer_stats)
+pipeline_metrics.registry.register_stats("lease_render", lease_render_service.stats)
+pipeline_metrics.registry.register_stats(
+    "lease_artifacts", lambda: lease_artifact_store.stats() if lease_artifact_store.loaded else {})
+pipeline_metrics.registry.register_stats("context", get_context_stats)
+pipeline_metrics.registry.register_stats("sessions", get_session_stats)
+
+def get_metrics_text() -> str:
+    return pipeline_metrics.render()
+
+startup.module_seconds = time.perf_counter() - _module_started
@@ -0,0 +1,163 @@
+import time
+import threading
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Set
+
+import numpy as np
+
+# --------------------------
+# Semantic response cache
+# --------------------------
+# Caches final /rag_query answers. A lookup matches an entry with the same
+# route key (category plus any structured constraints) whose query embedding
+# is within a cosine-similarity threshold. Every entry remembers the document
+# IDs its answer was built from, so touching one of those documents evicts it.
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+@dataclass
+class CachedResponse:
+    route_key: str
+    query: str
+    vector: np.ndarray
+    doc_ids: Set[str]
+    answer: str
+    created_at: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+class SemanticResponseCache:
+    """LRU + TTL cache of answers keyed by route and query-embedding similarity"""
+
+    def __init__(self, embeddings, similarity_threshold: float = 0.95, ttl_seconds: float = 3600.0,
+                 max_entries: int = 1000, ttl_by_category: Optional[Dict[str, float]] = None):
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.ttl_by_category = ttl_by_category or {}
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, CachedResponse]" = OrderedDict()
+        self._by_route: Dict[str, Set[int]] = defaultdict(set)
+        self._by_doc: Dict[str, Set[int]] = defaultdict(set)
+        self._by_text: Dict[tuple, int] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _embed(self, query: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _ttl(self, route_key: str) -> float:
+        return self.ttl_by_category.get(route_key.split("|", 1)[0], self.ttl_seconds)
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        self._by_route[entry.route_key].discard(entry_id)
+        if not self._by_route[entry.route_key]:
+            del self._by_route[entry.route_key]
+        for doc_id in entry.doc_ids:
+            self._by_doc[doc_id].discard(entry_id)
+            if not self._by_doc[doc_id]:
+                del self._by_doc[doc_id]
+        text_key = (entry.route_key, normalize_query(entry.query))
+        if self._by_text.get(text_key) == entry_id:
+            del self._by_text[text_key]
+
+    def _is_expired(self, entry: CachedResponse) -> bool:
+        return time.time() - entry.created_at > self._ttl(entry.route_key)
+
+    def lookup(self, route_key: str, query: str) -> Optional[CachedResponse]:
+        with self._lock:
+            # Exact repeats skip the embedding call entirely
+            entry_id = self._by_text.get((route_key, normalize_query(query)))
+            if entry_id is None and not self._by_route.get(route_key):
+                self.misses += 1
+                return None
+
+        vector = None if entry_id is not None else self._embed(query)
+
+        with self._lock:
+            if entry_id is None:
+                candidates = [i for i in self._by_route.get(route_key, ()) if i in self._entries]
+                if candidates:
+                    matrix = np.stack([self._entries[i].vector for i in candidates])
+                    scores = matrix @ vector
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.similarity_threshold:
+                        entry_id = candidates[best]
+
+            entry = self._entries.get(entry_id) if entry_id is not None else None
+            if entry is not None and self._is_expired(entry):
+                self._remove(entry_id)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry_id)
+            entry.hits += 1
+            self.hits += 1
+            return entry
+
+    def store(self, route_key: str, query: str, doc_ids: Iterable[str], answer: str):
+        vector = self._embed(query)
+        with self._lock:
+            existing = self._by_text.get((route_key, normalize_query(query)))
+            if existing is not None:
+                self._remove(existing)
+            entry_id = self._next_id
+            self._next_id += 1
+            entry = CachedResponse(route_key=route_key, query=query, vector=vector,
+                                   doc_ids=set(doc_ids), answer=answer)
+            self._entries[entry_id] = entry
+            self._by_route[route_key].add(entry_id)
+            for doc_id in entry.doc_ids:
+                self._by_doc[doc_id].add(entry_id)
+            self._by_text[(route_key, normalize_query(query))] = entry_id
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_documents(self, doc_ids: Iterable[str]) -> int:
+        """Drop every cached answer that was built from any of these documents"""
+        with self._lock:
+            affected = set()
+            for doc_id in doc_ids:
+                affected |= self._by_doc.get(doc_id, set())
+            for entry_id in affected:
+                self._remove(entry_id)
+            self.invalidations += len(affected)
+            return len(affected)
+
+    def invalidate_category(self, category: str) -> int:
+        with self._lock:
+            affected = [i for key, ids in self._by_route.items() if key.split("|", 1)[0] == category for i in ids]
+            for entry_id in affected:
+                self._remove(entry_id)
+            self.invalidations += len(affected)
+            return len(affected)
+
+    def clear(self):
+        with self._lock:
+            for entry_id in list(self._entries):
+                self._remove(entry_id)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "invalidations": self.invalidations,
+            }
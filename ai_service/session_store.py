@@ -0,0 +1,324 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, List, Optional
+
+from tokens import count_tokens
+
+# --------------------------
+# Conversation sessions
+# --------------------------
+# Conversations are kept server-side, so a client sends only its new message.
+# A session holds a rolling summary plus the most recent turns; once the turns
+# outgrow max_recent_turns or the token budget, the oldest are folded into the
+# summary in the background. context() always returns summary + recent turns
+# within the budget, so prompt size stays flat however long the chat runs.
+
+SUMMARY_PROMPT = """You maintain a running summary of a chat between a home buyer or renter and a real estate assistant. Update the summary with the new messages. Keep the user's requirements (budget, locations, bedrooms, amenities), the properties discussed with their prices and addresses, any lease details, and open questions. Drop pleasantries. Reply with the updated summary only, in at most {max_words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}"""
+
+
+@dataclass
+class SessionMessage:
+    role: str  # 'user', 'assistant', or 'summary' for the rolling summary
+    content: str
+
+
+@dataclass
+class Session:
+    id: str
+    user_id: str
+    summary: str = ""
+    turns: List[Dict[str, str]] = field(default_factory=list)  # {"role", "content"}, oldest first
+    summarized_messages: int = 0
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def session_user_id(user) -> str:
+    if not user:
+        return ""
+    return str(user.get("id") or user.get("_id") or user.get("email") or "")
+
+
+def trim_history(messages, token_budget: int) -> list:
+    """Newest messages whose combined size fits token_budget, oldest first"""
+    kept, used = [], 0
+    for message in reversed(list(messages or [])):
+        tokens = count_tokens(message.content) + 4
+        if used + tokens > token_budget:
+            break
+        kept.append(message)
+        used += tokens
+    return kept[::-1]
+
+
+def extractive_summary(summary: str, messages: List[Dict[str, str]], max_words: int) -> str:
+    """LLM-free summary: the user's messages, clipped, newest kept when over length"""
+    lines = [summary] if summary else []
+    lines += [f"User: {m['content'][:200]}" for m in messages if m["role"] == "user"]
+    words = " ".join(lines).split()
+    return " ".join(words[-max_words:])
+
+
+class MemorySessionBackend:
+    """Sessions in process memory, least recently used evicted beyond max_sessions"""
+
+    def __init__(self, max_sessions: int = 10_000):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            data = self._sessions.get(session_id)
+            if data is None:
+                return None
+            self._sessions.move_to_end(session_id)
+        return Session(**json.loads(json.dumps(data)))  # a copy, like reading from disk
+
+    def save(self, session: Session):
+        with self._lock:
+            self._sessions[session.id] = session.as_dict()
+            self._sessions.move_to_end(session.id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def purge(self, updated_before: float) -> int:
+        with self._lock:
+            expired = [sid for sid, data in self._sessions.items() if data["updated_at"] < updated_before]
+            for session_id in expired:
+                del self._sessions[session_id]
+        return len(expired)
+
+    def count(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteSessionBackend:
+    """Sessions in a SQLite file, so they survive restarts and are shared by workers on one host"""
+
+    def __init__(self, path: str, max_sessions: int = 100_000):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        self._conn.commit()
+
+    def load(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return Session(**json.loads(row[0])) if row else None
+
+    def save(self, session: Session):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO sessions (id, data, updated_at) VALUES (?, ?, ?)",
+                               (session.id, json.dumps(session.as_dict()), session.updated_at))
+            count = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            if count > self.max_sessions:
+                self._conn.execute(
+                    "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions ORDER BY updated_at ASC LIMIT ?)",
+                    (count - self.max_sessions,),
+                )
+            self._conn.commit()
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._conn.commit()
+
+    def purge(self, updated_before: float) -> int:
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (updated_before,)).rowcount
+            self._conn.commit()
+        return removed
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class SessionNotFound(KeyError):
+    """No such session, or it expired"""
+
+
+class SessionStore:
+    """Per-conversation summary + recent turns under a token budget"""
+
+    def __init__(self, backend, ttl_seconds: float = 24 * 3600, max_recent_turns: int = 8,
+                 token_budget: int = 1500, summary_words: int = 200,
+                 summarizer: Optional[Callable[[str], str]] = None, purge_every: int = 200):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_recent_messages = max_recent_turns * 2  # a turn is a user message and its reply
+        self.token_budget = token_budget
+        self.summary_words = summary_words
+        self.summarizer = summarizer  # prompt -> text; None uses extractive_summary
+        self.purge_every = purge_every
+        self._locks = [threading.Lock() for _ in range(64)]
+        self._compactor: Optional[ThreadPoolExecutor] = None
+        self._compactor_lock = threading.Lock()
+        self._compacting = set()
+        self._compacting_lock = threading.Lock()
+        self.writes = 0
+        self.compactions = 0
+        self.compaction_failures = 0
+        self.expired = 0
+
+    def _get_compactor(self) -> ThreadPoolExecutor:
+        """Created on the first compaction, so constructing the store starts nothing"""
+        with self._compactor_lock:
+            if self._compactor is None:
+                self._compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-compactor")
+            return self._compactor
+
+    def _lock_for(self, session_id: str) -> threading.Lock:
+        return self._locks[hash(session_id) % len(self._locks)]
+
+    def create(self, user) -> Session:
+        session = Session(id=uuid.uuid4().hex, user_id=session_user_id(user))
+        self.backend.save(session)
+        return session
+
+    def get(self, session_id: str, user) -> Session:
+        session = self.backend.load(session_id)
+        if session is not None and time.time() - session.updated_at > self.ttl_seconds:
+            self.backend.delete(session_id)
+            self.expired += 1
+            session = None
+        if session is None:
+            raise SessionNotFound(session_id)
+        if session.user_id != session_user_id(user):
+            raise PermissionError("This conversation belongs to another user")
+        return session
+
+    def context(self, session: Session) -> List[SessionMessage]:
+        """Rolling summary plus the newest turns that fit in the token budget"""
+        budget = self.token_budget
+        messages = []
+        if session.summary:
+            messages.append(SessionMessage("summary", session.summary))
+            budget -= count_tokens(session.summary) + 4
+        recent = [SessionMessage(turn["role"], turn["content"]) for turn in session.turns]
+        return messages + trim_history(recent, max(budget, 0))
+
+    def record_turn(self, session_id: str, user_message: str, assistant_message: str) -> Session:
+        with self._lock_for(session_id):
+            session = self.backend.load(session_id)
+            if session is None:
+                raise SessionNotFound(session_id)
+            session.turns.append({"role": "user", "content": user_message})
+            session.turns.append({"role": "assistant", "content": assistant_message})
+            session.updated_at = time.time()
+            self.backend.save(session)
+            self.writes += 1
+        if self._needs_compaction(session):
+            self._schedule_compaction(session_id)
+        if self.purge_every and self.writes % self.purge_every == 0:
+            self._get_compactor().submit(self.purge_expired)
+        return session
+
+    def _needs_compaction(self, session: Session) -> bool:
+        if len(session.turns) > self.max_recent_messages:
+            return True
+        size = count_tokens(session.summary) + sum(count_tokens(turn["content"]) + 4 for turn in session.turns)
+        return size > self.token_budget and len(session.turns) > 2
+
+    def _schedule_compaction(self, session_id: str):
+        with self._compacting_lock:
+            if session_id in self._compacting:
+                return
+            self._compacting.add(session_id)
+        self._get_compactor().submit(self._compact_scheduled, session_id)
+
+    def _compact_scheduled(self, session_id: str):
+        try:
+            self.compact(session_id)
+        finally:
+            with self._compacting_lock:
+                self._compacting.discard(session_id)
+
+    def compact(self, session_id: str) -> bool:
+        """Fold the oldest turns into the summary until the rest fit the limits"""
+        session = self.backend.load(session_id)
+        if session is None or not self._needs_compaction(session):
+            return False
+        # Keep the newest half of the allowance verbatim and summarize everything older
+        keep = max(2, min(self.max_recent_messages, len(session.turns)) // 2)
+        keep -= keep % 2
+        folded = session.turns[:len(session.turns) - keep]
+        if not folded:
+            return False
+        try:
+            summary = self._summarize(session.summary, folded)
+        except Exception as e:
+            # Keep the turns; context() still trims to the budget
+            print(f"Session summary failed for {session_id}: {e}")
+            self.compaction_failures += 1
+            return False
+        with self._lock_for(session_id):
+            current = self.backend.load(session_id)
+            if current is None or current.summarized_messages != session.summarized_messages:
+                return False  # deleted, or compacted by another worker meanwhile
+            # Only appends happen between load and here, so the folded turns are still the oldest
+            current.summary = summary
+            current.turns = current.turns[len(folded):]
+            current.summarized_messages += len(folded)
+            self.backend.save(current)
+        self.compactions += 1
+        return True
+
+    def _summarize(self, summary: str, messages: List[Dict[str, str]]) -> str:
+        if self.summarizer is None:
+            return extractive_summary(summary, messages, self.summary_words)
+        prompt = SUMMARY_PROMPT.format(
+            max_words=self.summary_words,
+            summary=summary or "(none yet)",
+            messages="\n".join(f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in messages),
+        )
+        return self.summarizer(prompt).strip()
+
+    def purge_expired(self) -> int:
+        removed = self.backend.purge(time.time() - self.ttl_seconds)
+        self.expired += removed
+        return removed
+
+    def shutdown(self):
+        with self._compactor_lock:
+            compactor = self._compactor
+        if compactor is not None:
+            compactor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": self.backend.count(),
+            "writes": self.writes,
+            "compactions": self.compactions,
+            "compaction_failures": self.compaction_failures,
+            "expired": self.expired,
+            "token_budget": self.token_budget,
+            "max_recent_turns": self.max_recent_messages // 2,
+        }
@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+from statistics import median
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# --------------------------
+# Lazy components, warmup and readiness
+# --------------------------
+# Clients that are expensive to import or construct (OpenAI, Chroma, Mongo)
+# are declared as LazyComponents and built on first use, so importing the
+# service is cheap and /health answers straight away. Warmup builds them ahead
+# of traffic and preloads indexes; readiness reports ready only once warmup
+# has finished and the dependency checks pass.
+
+
+class LazyComponent:
+    """Shared component built on first use; attribute access is forwarded to the built object.
+
+    The accessor is resolve() rather than get() so it cannot shadow the component's own get().
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self._name = name
+        self._factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+        self.build_seconds: Optional[float] = None
+
+    def resolve(self) -> Any:
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    started = time.perf_counter()
+                    value = self._factory()
+                    self.build_seconds = time.perf_counter() - started
+                    self._value = value
+        return self._value
+
+    def set_factory(self, factory: Callable[[], Any]):
+        """Build the component differently from now on (offline benchmarks); drops any built value"""
+        with self._lock:
+            self._factory = factory
+            self._value = None
+            self.build_seconds = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._value is not None
+
+    def __getattr__(self, attr: str):
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self) -> str:
+        return f"<LazyComponent {self._name} {'loaded' if self.loaded else 'not loaded'}>"
+
+
+class StartupManager:
+    """Registry of lazy components, warmup steps and readiness checks"""
+
+    def __init__(self, check_interval: float = 5.0):
+        self.check_interval = check_interval
+        self.components: Dict[str, LazyComponent] = {}
+        self.warmup_steps: List[Tuple[str, Callable[[], Any]]] = []
+        self.checks: Dict[str, Callable[[], Any]] = {}
+        self.module_seconds: Optional[float] = None
+        self.warmup_report: Dict[str, Any] = {}
+        self.warmup_started: Optional[float] = None
+        self.warmup_finished: Optional[float] = None
+        self._warmup_lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._last_check: Tuple[float, bool, Dict[str, Any]] = (0.0, False, {})
+
+    def component(self, name: str, factory: Callable[[], Any]) -> LazyComponent:
+        self.components[name] = LazyComponent(name, factory)
+        return self.components[name]
+
+    def add_warmup_step(self, name: str, step: Callable[[], Any]):
+        self.warmup_steps.append((name, step))
+
+    def add_check(self, name: str, check: Callable[[], Any]):
+        self.checks[name] = check
+
+    def warmup(self) -> Dict[str, Any]:
+        """Run every warmup step once, in order; a failing step is reported, not raised"""
+        with self._warmup_lock:
+            if self.warmup_finished is not None:
+                return self.warmup_report
+            self.warmup_started = time.time()
+            for name, step in self.warmup_steps:
+                started = time.perf_counter()
+                try:
+                    step()
+                    self.warmup_report[name] = {"ok": True}
+                except Exception as e:
+                    print(f"Warmup step {name} failed: {e}")
+                    self.warmup_report[name] = {"ok": False, "error": str(e)}
+                self.warmup_report[name]["seconds"] = round(time.perf_counter() - started, 4)
+            self.warmup_finished = time.time()
+            print(f"Warmup finished in {self.warmup_finished - self.warmup_started:.2f}s")
+            return self.warmup_report
+
+    def skip_warmup(self):
+        """Serve without warming up; components are then built by the first requests"""
+        with self._warmup_lock:
+            self.warmup_started = self.warmup_finished = time.time()
+
+    def start_warmup(self) -> threading.Thread:
+        thread = threading.Thread(target=self.warmup, name="service-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def readiness(self) -> Tuple[bool, Dict[str, Any]]:
+        """(ready, details): warmup done and every check passing; checks rerun at most every check_interval"""
+        if self.warmup_finished is None:
+            return False, {"warmup": "running" if self.warmup_started else "pending"}
+        with self._check_lock:
+            checked_at, ready, results = self._last_check
+            if time.time() - checked_at >= self.check_interval:
+                results = {}
+                for name, check in self.checks.items():
+                    try:
+                        check()
+                        results[name] = "ok"
+                    except Exception as e:
+                        results[name] = f"failed: {e}"
+                ready = all(result == "ok" for result in results.values())
+                self._last_check = (time.time(), ready, results)
+        return ready, {"warmup": "done", "checks": results}
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "module_seconds": round(self.module_seconds, 4) if self.module_seconds is not None else None,
+            "components": {
+                name: {"loaded": component.loaded,
+                       "build_seconds": round(component.build_seconds, 4) if component.build_seconds else None}
+                for name, component in self.components.items()
+            },
+            "warmup_seconds": round(self.warmup_finished - self.warmup_started, 4) if self.warmup_finished else None,
+            "warmup": self.warmup_report,
+        }
+
+
+# --------------------------
+# Benchmark
+# --------------------------
+_CHILD = """
+import json, time
+started = time.perf_counter()
+import {module}
+import rag_pipeline
+imported = time.perf_counter() - started
+report = {{"import_seconds": imported}}
+if {warmup}:
+    started = time.perf_counter()
+    rag_pipeline.startup.warmup()
+    report["warmup_seconds"] = time.perf_counter() - started
+    report["steps"] = {{name: step["seconds"] for name, step in rag_pipeline.startup.warmup_report.items()}}
+rag_pipeline.lease_render_service.shutdown()
+print("STARTUP_REPORT " + json.dumps(report))
+"""
+
+
+def benchmark(runs: int = 3, module: str = "api", warmup: bool = True) -> Dict[str, Any]:
+    """Cold-start cost: import time and warmup step times, each run in a fresh interpreter"""
+    code = _CHILD.format(module=module, warmup=warmup)
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    reports = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True, text=True, check=True).stdout
+        line = next(line for line in output.splitlines() if line.startswith("STARTUP_REPORT "))
+        report = json.loads(line[len("STARTUP_REPORT "):])
+        report["process_seconds"] = time.perf_counter() - started
+        reports.append(report)
+
+    def summary(values):
+        return {"median": round(median(values), 4), "max": round(max(values), 4)}
+
+    result = {"runs": runs, "module": module}
+    for key in ("import_seconds", "warmup_seconds", "process_seconds"):
+        if all(key in report for report in reports):
+            result[key] = summary([report[key] for report in reports])
+    if warmup:
+        result["steps"] = {name: summary([report["steps"][name] for report in reports]) for name in reports[0]["steps"]}
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark service cold start: import and warmup times")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--module", default="api")
+    parser.add_argument("--no-warmup", action="store_true")
+    args = parser.parse_args()
+    print(json.dumps(benchmark(args.runs, args.module, not args.no_warmup), indent=2))
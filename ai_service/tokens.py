@@ -0,0 +1,47 @@
+from typing import Optional
+
+# --------------------------
+# Token counting
+# --------------------------
+# Uses tiktoken's cl100k_base encoding (shipped with langchain_openai) when it
+# can be loaded, otherwise falls back to the ~4 characters per token heuristic.
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"tiktoken unavailable, estimating token counts: {e}")
+            _encoding = None
+    return _encoding
+
+
+def count_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def truncate_to_tokens(text: Optional[str], max_tokens: int) -> str:
+    """Longest prefix of text within max_tokens, cut back to a word boundary"""
+    if not text or count_tokens(text) <= max_tokens:
+        return text or ""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is not None:
+        prefix = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    else:
+        prefix = text[:max_tokens * 4]
+    cut = prefix.rfind(" ")
+    return prefix[:cut] if cut > len(prefix) // 2 else prefix
@@ -0,0 +1,118 @@
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+# --------------------------
+# Listing write buffer
+# --------------------------
+# Per-listing create/update/delete calls are collected for up to max_delay_ms
+# (or until max_items listings are pending) and applied together: all upserts
+# in one embedding batch, all deletes in one call. Repeated writes to the same
+# listing inside a window collapse to the last one. Each caller gets a Future
+# that resolves once its listing's final state has been applied.
+
+UPSERT, DELETE = "upsert", "delete"
+
+# apply(upserts by listing id, deleted listing ids) -> {listing id: error} for failures
+BatchApplier = Callable[[Dict[str, dict], List[str]], Dict[str, Exception]]
+
+
+class ListingWriteBuffer:
+    """Micro-batches listing writes with last-writer-wins per listing ID"""
+
+    def __init__(self, apply: BatchApplier, max_items: int = 64, max_delay_ms: float = 250):
+        self.apply = apply
+        self.max_items = max_items
+        self.max_delay = max_delay_ms / 1000.0
+        self._pending: "OrderedDict[str, tuple]" = OrderedDict()  # id -> (op, listing, [futures])
+        self._oldest: Optional[float] = None
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.submitted = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.applied = 0
+
+    def upsert(self, listing_id: str, listing: dict) -> Future:
+        return self._submit(str(listing_id), UPSERT, listing)
+
+    def delete(self, listing_id: str) -> Future:
+        return self._submit(str(listing_id), DELETE, None)
+
+    def _submit(self, listing_id: str, op: str, listing: Optional[dict]) -> Future:
+        future: Future = Future()
+        with self._condition:
+            self._ensure_started()
+            self.submitted += 1
+            futures = [future]
+            if listing_id in self._pending:
+                self.coalesced += 1
+                futures = self._pending.pop(listing_id)[2] + futures
+            self._pending[listing_id] = (op, listing, futures)
+            if self._oldest is None:
+                self._oldest = time.time()
+            self._condition.notify()
+        return future
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="listing-write-buffer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._pending and (
+                        self._stopping or len(self._pending) >= self.max_items
+                        or time.time() - self._oldest >= self.max_delay
+                    ):
+                        break
+                    if self._stopping:
+                        return
+                    timeout = None if not self._pending else self.max_delay - (time.time() - self._oldest)
+                    self._condition.wait(timeout)
+                batch = self._pending
+                self._pending = OrderedDict()
+                self._oldest = None
+            self._flush(batch)
+
+    def _flush(self, batch: "OrderedDict[str, tuple]"):
+        upserts = {listing_id: listing for listing_id, (op, listing, _) in batch.items() if op == UPSERT}
+        deletes = [listing_id for listing_id, (op, _, _) in batch.items() if op == DELETE]
+        try:
+            errors = self.apply(upserts, deletes) or {}
+        except Exception as e:
+            errors = {listing_id: e for listing_id in batch}
+        self.flushes += 1
+        self.applied += len(batch)
+        for listing_id, (_, _, futures) in batch.items():
+            for future in futures:
+                if listing_id in errors:
+                    future.set_exception(errors[listing_id])
+                else:
+                    future.set_result(listing_id)
+
+    def flush_and_stop(self, timeout: float = 10.0):
+        """Apply whatever is pending and stop the flusher thread"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, float]:
+        with self._condition:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "applied": self.applied,
+            "avg_batch_size": round(self.applied / self.flushes, 2) if self.flushes else 0.0,
+        }
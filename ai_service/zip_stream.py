@@ -0,0 +1,47 @@
+import zipfile
+from typing import List
+
+# --------------------------
+# Incremental ZIP writer
+# --------------------------
+# zipfile can write to a non-seekable stream (sizes go in data descriptors),
+# so members are compressed into a small in-memory sink that is drained after
+# each one. Only the member being added is ever held in memory.
+
+
+class _Sink:
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ZipStream:
+    """Build a ZIP archive member by member, returning the bytes produced so far after each"""
+
+    def __init__(self, compression: int = zipfile.ZIP_DEFLATED):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, mode="w", compression=compression)
+
+    def add(self, name: str, data: bytes) -> bytes:
+        self._zip.writestr(name, data)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._sink.drain()
@@ -16,6 +16,7 @@ const Chatbot = () => {
   ]);
   const [inputMessage, setInputMessage] = useState('');
   const [isLoading, setIsLoading] = useState(false);
+  const sessionIdRef = useRef(null);
 
   // Auto-scroll effect
   useEffect(() => {
@@ -28,6 +29,20 @@ const Chatbot = () => {
     setIsOpen(!isOpen);
   };
 
+  // The server keeps the conversation (a rolling summary plus recent turns), so each turn
+  // sends only the new message with the session ID
+  const getSessionId = async () => {
+    if (!sessionIdRef.current) {
+      try {
+        sessionIdRef.current = await ragAPI.createSession();
+      } catch (error) {
+        // Without a session the recent history is sent with the query instead
+        console.error('Session error:', error);
+      }
+    }
+    return sessionIdRef.current;
+  };
+
   // Get last 10 messages for context (excluding the welcome message)
   const getConversationContext = () => {
     // Filter out the initial welcome message and get last 10 messages
@@ -59,10 +74,46 @@ const Chatbot = () => {
     setMessages((prev) => [...prev, userMessage]);
 
     try {
-      // Get conversation context before sending
+      // Only used when no server-side session could be created
       const conversationHistory = getConversationContext();
 
-      const data = await ragAPI.queryWithContext(currentInput, conversationHistory);
+      // Stream the answer into a placeholder message as tokens arrive. Lease replies carry
+      // markers that are parsed below, so those are only shown once complete.
+      const streamingId = Date.now() + 2;
+      let streamedCategory = null;
+      let streamingStarted = false;
+      const streamAnswer = (sessionId) =>
+        ragAPI.streamQueryWithContext(currentInput, conversationHistory, {
+          sessionId,
+          onCategory: (category) => {
+            streamedCategory = category;
+          },
+          onToken: (_, answerSoFar) => {
+            if (streamedCategory === 'lease_generation') return;
+            if (!streamingStarted) {
+              streamingStarted = true;
+              setIsLoading(false);
+              setMessages((prev) => [
+                ...prev,
+                { id: streamingId, text: answerSoFar, isBot: true, timestamp: new Date() },
+              ]);
+            } else {
+              setMessages((prev) =>
+                prev.map((msg) => (msg.id === streamingId ? { ...msg, text: answerSoFar } : msg))
+              );
+            }
+          },
+        });
+
+      let data;
+      try {
+        data = await streamAnswer(await getSessionId());
+      } catch (error) {
+        if (error.status !== 404) throw error;
+        // The session expired on the server: start a new one
+        sessionIdRef.current = null;
+        data = await streamAnswer(await getSessionId());
+      }
       let botResponseText = data.answer || "Sorry, I couldn't process your request.";
 
       // Lease generation handling
@@ -134,13 +185,19 @@ Sorry, there was an issue creating your lease PDF. Please try again or contact s
       }
 
       // Final bot response
-      const botResponse = {
-        id: Date.now() + 2,
-        text: botResponseText,
-        isBot: true,
-        timestamp: new Date(),
-      };
-      setMessages((prev) => [...prev, botResponse]);
+      if (streamingStarted) {
+        setMessages((prev) =>
+          prev.map((msg) => (msg.id === streamingId ? { ...msg, text: botResponseText } : msg))
+        );
+      } else {
+        const botResponse = {
+          id: streamingId,
+          text: botResponseText,
+          isBot: true,
+          timestamp: new Date(),
+        };
+        setMessages((prev) => [...prev, botResponse]);
+      }
     } catch (err) {
       console.error('Chat error:', err);
       const errorResponse = {
@@ -338,6 +338,74 @@ export const ragAPI = {
     }
   },
 
+  // Starts a server-side conversation; later queries send only the new message and this ID
+  createSession: async () => {
+    const response = await fetch(`${RAG_API_BASE_URL}/sessions`, { method: 'POST' });
+    if (!response.ok) throw new Error('RAG API error');
+    const data = await response.json();
+    return data.session_id;
+  },
+
+  // Streams the answer over Server-Sent Events. Calls onCategory once the query is classified
+  // and onToken for each chunk of answer text; resolves with the full answer. With a sessionId
+  // the server keeps the conversation and conversationHistory is not sent.
+  streamQueryWithContext: async (
+    userQuery,
+    conversationHistory,
+    { sessionId, onCategory, onToken, signal } = {}
+  ) => {
+    const response = await fetch(`${RAG_API_BASE_URL}/rag_query_stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(
+        sessionId
+          ? { query: userQuery, session_id: sessionId }
+          : { query: userQuery, conversation_history: conversationHistory }
+      ),
+      signal,
+    });
+    if (!response.ok || !response.body) {
+      const error = new Error('RAG API error');
+      error.status = response.status;
+      throw error;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let category = null;
+    let answer = '';
+
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // SSE events are separated by a blank line
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        const eventName = rawEvent.match(/^event: (.*)$/m)?.[1];
+        const dataLine = rawEvent.match(/^data: (.*)$/m)?.[1];
+        const data = dataLine ? JSON.parse(dataLine) : {};
+
+        if (eventName === 'category') {
+          category = data.category;
+          onCategory?.(category);
+        } else if (eventName === 'token') {
+          answer += data.text;
+          onToken?.(data.text, answer);
+        } else if (eventName === 'error') {
+          throw new Error(data.detail || 'RAG API error');
+        }
+      }
+    }
+
+    return { category, answer: answer.trim() };
+  },
+
   generateAndDownloadLease: async (leaseInfo) => {
     try {
       const response = await fetch(`${RAG_API_BASE_URL}/generate_lease`, {